@@ -10,7 +10,7 @@ import requests
 from pydantic import validator
 
 from opennem.schema.core import BaseConfig
-from opennem.utils.http import attach_proxy, mount_retry_adaptor, mount_timeout_adaptor, retry_strategy_on_permission_denied
+from opennem.utils.http import attach_proxy, mount_retry_adaptor, retry_strategy_on_permission_denied
 from opennem.utils.random_agent import get_random_agent
 
 logger = logging.getLogger("opennem.clients.bom")
@@ -46,11 +46,7 @@ _bom_req_session = requests.Session()
 
 attach_proxy(_bom_req_session)
 
-mount_retry_adaptor(_bom_req_session)
-_bom_req_session.mount("http://", retry_strategy_on_permission_denied)  # type: ignore
-_bom_req_session.mount("https://", retry_strategy_on_permission_denied)  # type: ignore
-
-mount_timeout_adaptor(_bom_req_session)
+mount_retry_adaptor(_bom_req_session, retry=retry_strategy_on_permission_denied)
 
 
 def _clean_bom_text_field(field_val: str) -> str | None:
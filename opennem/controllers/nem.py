@@ -4,6 +4,8 @@ Parses MMS tables into OpenNEM derived database
 """
 
 import logging
+import time
+from collections.abc import Callable, Iterable
 from dataclasses import asdict
 from datetime import datetime
 from typing import Any
@@ -14,9 +16,9 @@ from sqlalchemy.dialects.postgresql import insert
 from opennem.controllers.schema import ControllerReturn
 from opennem.core.networks import NetworkNEM
 from opennem.core.normalizers import clean_float
-from opennem.core.parsers.aemo.mms import AEMOTableSchema, AEMOTableSet
-from opennem.db import get_database_engine, get_scoped_session
-from opennem.db.bulk_insert_csv import bulkinsert_mms_items
+from opennem.core.parsers.aemo.mms import AEMOTableBatch, AEMOTableProjection, AEMOTableSchema, AEMOTableSet
+from opennem.db import shared_connection
+from opennem.db.bulk_insert_csv import staged_upsert
 from opennem.db.models.opennem import BalancingSummary, FacilityScada
 from opennem.importer.rooftop import rooftop_remap_regionids
 from opennem.schema.aemo.mms import MMSBaseClass
@@ -26,6 +28,11 @@ from opennem.utils.numbers import float_to_str
 
 logger = logging.getLogger("opennem.controllers.nem")
 
+
+class ProcessorException(Exception):
+    pass
+
+
 # @TODO could read this from schema
 FACILITY_SCADA_COLUMN_NAMES = [
     "created_by",
@@ -134,7 +141,7 @@ def unit_scada_generate_facility_scada(
 
 
 def generate_facility_scada(
-    records: list[dict[str, Any] | MMSBaseClass],
+    records: list[dict[str, Any] | MMSBaseClass] | pd.DataFrame,
     network: NetworkSchema = NetworkNEM,
     interval_field: str = "settlementdate",
     facility_code_field: str = "duid",
@@ -142,10 +149,14 @@ def generate_facility_scada(
     energy_field: str | None = None,
     is_forecast: bool = False,
 ) -> list[dict[str, Any]]:
-    """Optimized facility scada generator"""
+    """Optimized facility scada generator. Takes either a list of records or
+    a frame from a columnar table"""
     created_at = datetime.now()
 
-    df = pd.DataFrame().from_records(records)
+    if isinstance(records, pd.DataFrame):
+        df = records.reset_index() if any(records.index.names) else records
+    else:
+        df = pd.DataFrame().from_records(records)
 
     column_renames = {
         interval_field: "trading_interval",
@@ -249,349 +260,296 @@ def generate_balancing_summary(
     return return_records
 
 
-# Processors
+# balancing summary columns each MMS table contributes, keyed by the table column
+BALANCING_SUMMARY_TABLE_FIELDS: dict[str, dict[str, str]] = {
+    "dispatch_price": {"rrp": "price_dispatch"},
+    "trading_price": {"rrp": "price"},
+    "dispatch_regionsum": {
+        "netinterchange": "net_interchange",
+        "totaldemand": "demand",
+        "demand_and_nonschedgen": "demand_total",
+    },
+    "trading_regionsum": {"netinterchange": "net_interchange_trading"},
+}
 
+BALANCING_SUMMARY_COLUMN_NAMES = [
+    "created_by",
+    "created_at",
+    "updated_at",
+    "network_id",
+    "trading_interval",
+    "network_region",
+    "forecast_load",
+    "generation_scheduled",
+    "generation_non_scheduled",
+    "generation_total",
+    "net_interchange",
+    "demand",
+    "demand_total",
+    "price",
+    "price_dispatch",
+    "net_interchange_trading",
+    "is_forecast",
+]
 
-def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerReturn:
-    session = get_scoped_session()
-    engine = get_database_engine()
 
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+def generate_balancing_summary_records(tables: list[AEMOTableSchema]) -> dict[tuple[str, ...], list[dict[str, Any]]]:
+    """Merges the price, demand and interchange tables of a table set into a single balancing
+    summary record per interval and region. Returns the records grouped by the columns their
+    tables set"""
+    created_at = datetime.now()
+    merged: dict[tuple[datetime, str], dict[str, Any]] = {}
+    merged_fields: dict[tuple[datetime, str], list[str]] = {}
 
-    for record in table.records:
-        primary_key = {record["settlementdate"], record["interconnectorid"]}
+    for table in tables:
+        table_fields = BALANCING_SUMMARY_TABLE_FIELDS.get(table.full_name)
 
-        if primary_key in primary_keys:
-            continue
+        if not table_fields:
+            raise Exception(f"No balancing summary fields for table {table.full_name}")
 
-        primary_keys.append(primary_key)
+        # the first record for a key in each table wins as it did with the per table upserts
+        seen_keys: set[tuple[datetime, str]] = set()
 
-        if "meteredmwflow" not in record:
-            raise Exception(f"No meteredmwflow in record: {record}")
+        for record in table.iter_records():
+            if not isinstance(record, dict):
+                continue
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "created_by": "opennem.controller",
-                "facility_code": record["interconnectorid"],
-                "trading_interval": record["settlementdate"],
-                "generated": record.get("meteredmwflow", 0),
-            }
-        )
-        cr.processed_records += 1
+            trading_interval = parse_date(record["settlementdate"], network=NetworkNEM, dayfirst=False)
 
-    # insert
-    stmt = insert(FacilityScada).values(records_to_store)
-    stmt.bind = engine
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["trading_interval", "network_id", "facility_code", "is_forecast"],
-        set_={"generated": stmt.excluded.generated},
-    )
+            if not trading_interval:
+                continue
 
-    try:
-        session.execute(stmt)
-        session.commit()
-        cr.inserted_records = cr.processed_records
-        cr.server_latest = max(i["trading_interval"] for i in records_to_store)
-    except Exception as e:
-        logger.error("Error inserting records")
-        logger.error(e)
-        cr.errors = cr.processed_records
-        return cr
-    finally:
-        session.rollback()
-        session.close()
-        engine.dispose()
+            primary_key = (trading_interval, record["regionid"])
 
-    return cr
+            if primary_key in seen_keys:
+                continue
 
+            seen_keys.add(primary_key)
 
-def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
-    """Stores the NEM price for both dispatch price and trading price"""
-    session = get_scoped_session()
-    engine = get_database_engine()
+            if primary_key not in merged:
+                merged[primary_key] = {
+                    **dict.fromkeys(BALANCING_SUMMARY_COLUMN_NAMES),
+                    "created_by": "opennem.controllers.nem",
+                    "created_at": created_at,
+                    "network_id": "NEM",
+                    "trading_interval": trading_interval,
+                    "network_region": record["regionid"],
+                    "is_forecast": False,
+                }
+                merged_fields[primary_key] = []
 
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+            merged_fields[primary_key] += table_fields.values()
 
-    price_field = "price"
+            for table_field, summary_field in table_fields.items():
+                if table_field not in record:
+                    raise Exception(f"No {table_field} in {table.full_name} record: {record}")
 
-    if table.full_name == "dispatch_price":
-        price_field = "price_dispatch"
+                value = record[table_field]
 
-    for record in table.records:
-        # @NOTE disable pk track
-        trading_interval = parse_date(record["settlementdate"])
+                if table.full_name == "trading_regionsum":
+                    value = clean_float(value)
 
-        primary_key = {trading_interval, record["regionid"]}  # type: ignore
+                merged[primary_key][summary_field] = value
 
-        if primary_key in primary_keys:
-            continue
+    record_groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
 
-        primary_keys.append(primary_key)
+    for primary_key, record in merged.items():
+        record_groups.setdefault(tuple(merged_fields[primary_key]), []).append(record)
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "created_by": "opennem.controllers.nem",
-                "network_region": record["regionid"],
-                "trading_interval": trading_interval,
-                price_field: record["rrp"],
-            }
-        )
+    return record_groups
 
-        cr.processed_records += 1
 
-    stmt = insert(BalancingSummary).values(records_to_store)
-    stmt.bind = engine
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["trading_interval", "network_id", "network_region"],
-        set_={price_field: getattr(stmt.excluded, price_field)},
-    )
+def _store_records(cr: ControllerReturn, table: Any, records: list[dict], update_fields: list[str]) -> None:
+    """Upserts processor records and sets the stored and changed counts on the controller return.
+    Chunks that failed to store are counted as errors"""
+    result = staged_upsert(table, records, update_fields)
 
-    try:
-        session.execute(stmt)
-        session.commit()
-        cr.inserted_records = cr.processed_records
-        cr.server_latest = max([i["trading_interval"] for i in records_to_store])
-    except Exception as e:
-        logger.error("Error inserting NEM price records")
-        logger.error(e)
+    cr.inserted_records += result.records
+    cr.changed_records += result.changed
+    cr.errors += result.errors
+    cr.error_detail += [f"chunk {c.chunk}: {c.error}" for c in result.chunks if c.error]
+
+
+def process_balancing_summary(tables: list[AEMOTableSchema]) -> ControllerReturn:
+    """Stores the balancing summary tables of a table set with merged upserts instead of one
+    upsert per table
+
+    @NOTE records are upserted in groups by the tables that had a value for their key so each
+    only updates the columns its tables set, like the per table upserts did. a null value from a
+    table still overwrites the stored value
+    """
+    cr = ControllerReturn(total_records=sum(t.record_count for t in tables))
+
+    record_groups = generate_balancing_summary_records(tables)
+
+    if not record_groups:
+        return cr
+
+    for update_fields, records in record_groups.items():
+        cr.processed_records += len(records)
+        _store_records(cr, BalancingSummary, records, list(update_fields))  # type: ignore
+
+    cr.server_latest = max(i["trading_interval"] for records in record_groups.values() for i in records)
+
+    if not cr.inserted_records:
         cr.errors = cr.processed_records
-    finally:
-        session.rollback()
-        session.close()
-        engine.dispose()
 
     return cr
 
 
-def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
-    session = get_scoped_session()
-    engine = get_database_engine()
+def _get_table_records(table: AEMOTableSchema) -> list[dict[str, Any]] | pd.DataFrame:
+    """Columnar tables are handed to the generators as a frame over their column arrays"""
+    if table.columnar:
+        return table.to_frame()
 
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+    return table.records  # type: ignore
 
-    for record in table.records:
-        if not isinstance(record, dict):
-            continue
 
-        trading_interval = parse_date(record.get("settlementdate"))
+# Processors
 
-        primary_key = {trading_interval, record["regionid"]}
+
+def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerReturn:
+    cr = ControllerReturn(total_records=table.record_count)
+    records_to_store = []
+    primary_keys = []
+
+    for record in table.iter_records():
+        primary_key = {record["settlementdate"], record["interconnectorid"]}
 
         if primary_key in primary_keys:
             continue
 
         primary_keys.append(primary_key)
 
-        if "demand_and_nonschedgen" not in record:
-            raise Exception("bad value in dispatch_regionsum")
+        if "meteredmwflow" not in record:
+            raise Exception(f"No meteredmwflow in record: {record}")
 
         records_to_store.append(
             {
                 "network_id": "NEM",
                 "created_by": "opennem.controller",
-                "network_region": record["regionid"],
-                "trading_interval": trading_interval,
-                "net_interchange": record["netinterchange"],
-                "demand": record["totaldemand"],
-                "demand_total": record["demand_and_nonschedgen"],
+                "facility_code": record["interconnectorid"],
+                "trading_interval": record["settlementdate"],
+                "generated": record.get("meteredmwflow", 0),
             }
         )
-
         cr.processed_records += 1
 
-    stmt = insert(BalancingSummary).values(records_to_store)
-    stmt.bind = engine
+    # insert
+    stmt = insert(FacilityScada).values(records_to_store)
     stmt = stmt.on_conflict_do_update(
-        index_elements=["trading_interval", "network_id", "network_region"],
-        set_={
-            "net_interchange": stmt.excluded.net_interchange,
-            "demand_total": stmt.excluded.demand_total,
-            "demand": stmt.excluded.demand,
-        },
+        index_elements=["trading_interval", "network_id", "facility_code", "is_forecast"],
+        set_={"generated": stmt.excluded.generated},
+        # only rewrite flows that changed
+        where=FacilityScada.generated.is_distinct_from(stmt.excluded.generated),
     )
 
     try:
-        session.execute(stmt)
-        session.commit()
+        with shared_connection() as conn:
+            result = conn.execute(stmt)
+
         cr.inserted_records = cr.processed_records
-        cr.server_latest = max([i["trading_interval"] for i in records_to_store])
+        cr.changed_records = result.rowcount
+        cr.server_latest = max(i["trading_interval"] for i in records_to_store)
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
         cr.errors = cr.processed_records
-    finally:
-        session.rollback()
-        session.close()
-        engine.dispose()
+        return cr
 
     return cr
 
 
-def process_trading_regionsum(table: AEMOTableSchema) -> ControllerReturn:
-    engine = get_database_engine()
-
-    if not table.records:
-        logger.debug(table)
-        raise Exception("Invalid table no records")
-
-    cr = ControllerReturn(total_records=len(table.records))
-    limit = None
-    records_to_store = []
-    records_processed = 0
-    primary_keys = []
-
-    for record in table.records:
-        if not isinstance(record, dict):
-            raise Exception("Invalid record type")
-
-        trading_interval = parse_date(
-            record["settlementdate"],
-            network=NetworkNEM,
-            dayfirst=False,
-            date_format="%Y/%m/%d %H:%M:%S",
-        )
-
-        if not trading_interval:
-            continue
-
-        _pk = {trading_interval, record["regionid"]}
-
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
-        net_interchange = None
-
-        if "netinterchange" in record:
-            net_interchange = clean_float(record["netinterchange"])
-
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "created_by": "opennem.controller.nem",
-                "network_region": record["regionid"],
-                "net_interchange_trading": net_interchange,
-                "trading_interval": trading_interval,
-            }
-        )
-
-        records_processed += 1
+def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
+    """Stores the NEM price for both dispatch price and trading price"""
+    return process_balancing_summary([table])
 
-        if limit and records_processed >= limit:
-            logger.info(f"Reached limit of: {limit} {records_processed}")
-            break
 
-    stmt = insert(BalancingSummary).values(records_to_store)
-    stmt.bind = engine
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["trading_interval", "network_id", "network_region"],
-        set_={
-            "net_interchange_trading": stmt.excluded.net_interchange_trading,
-        },
-    )
+def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
+    return process_balancing_summary([table])
 
-    session = get_scoped_session()
 
-    try:
-        session.execute(stmt)
-        session.commit()
-        cr.inserted_records = cr.processed_records
-        cr.server_latest = max([i["trading_interval"] for i in records_to_store])
-    except Exception as e:
-        logger.error("Error inserting records")
-        logger.error(e)
-        records_to_store = []
-        cr.errors = cr.processed_records
-    finally:
-        session.rollback()
-        session.close()
-        engine.dispose()
+def process_trading_regionsum(table: AEMOTableSchema) -> ControllerReturn:
+    if not table.record_count:
+        logger.debug(table)
+        raise Exception("Invalid table no records")
 
-    return cr
+    return process_balancing_summary([table])
 
 
 def process_unit_scada(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = unit_scada_generate_facility_scada(
-        table.records,  # type:ignore
+        list(table.iter_records()),  # type:ignore
         interval_field="settlementdate",
         facility_code_field="duid",
         power_field="scadavalue",
     )
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])  # type: ignore
+    _store_records(cr, FacilityScada, records, ["generated"])  # type: ignore
     cr.server_latest = max([i["trading_interval"] for i in records if i["trading_interval"]])
 
     return cr
 
 
 def process_unit_scada_optimized(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = generate_facility_scada(
-        table.records,  # type:ignore
+        _get_table_records(table),  # type:ignore
         interval_field="settlementdate",
         facility_code_field="duid",
         power_field="scadavalue",
     )
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated", "eoi_quantity"])  # type: ignore
+    _store_records(cr, FacilityScada, records, ["generated", "eoi_quantity"])  # type: ignore
     cr.server_latest = max([i["trading_interval"] for i in records if i["trading_interval"]])
 
     return cr
 
 
 def process_unit_solution(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = generate_facility_scada(
-        table.records,
+        _get_table_records(table),
         interval_field="settlementdate",
         facility_code_field="duid",
         power_field="initialmw",
     )
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
+    _store_records(cr, FacilityScada, records, ["generated"])
     cr.server_latest = max([i["trading_interval"] for i in records if i["trading_interval"]])
 
     return cr
 
 
 def process_meter_data_gen_duid(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = generate_facility_scada(
-        table.records,
+        _get_table_records(table),
         interval_field="interval_datetime",
         facility_code_field="duid",
         power_field="mwh_reading",
     )
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
+    _store_records(cr, FacilityScada, records, ["generated"])
     cr.server_latest = max([i["trading_interval"] for i in records])
 
     return cr
 
 
 def process_rooftop_actual(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = generate_facility_scada(
-        table.records,
+        _get_table_records(table),
         interval_field="interval_datetime",
         facility_code_field="regionid",
         power_field="power",
@@ -602,17 +560,17 @@ def process_rooftop_actual(table: AEMOTableSchema) -> ControllerReturn:
     records = [i for i in records if i]
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated", "eoi_quantity"])
+    _store_records(cr, FacilityScada, records, ["generated", "eoi_quantity"])
     cr.server_latest = max([i["trading_interval"] for i in records])
 
     return cr
 
 
 def process_rooftop_forecast(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = generate_facility_scada(
-        table.records,  # type: ignore
+        _get_table_records(table),  # type: ignore
         interval_field="interval_datetime",
         facility_code_field="regionid",
         power_field="powermean",
@@ -624,7 +582,7 @@ def process_rooftop_forecast(table: AEMOTableSchema) -> ControllerReturn:
     records = [i for i in records if i]
 
     cr.processed_records = len(records)
-    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])  # type: ignore
+    _store_records(cr, FacilityScada, records, ["generated"])  # type: ignore
     cr.server_latest = max([i["trading_interval"] for i in records])
 
     return cr
@@ -643,41 +601,186 @@ TABLE_PROCESSOR_MAP = {
     "trading_regionsum": "process_trading_regionsum",
 }
 
+# columns read by each processor in TABLE_PROCESSOR_MAP
+TABLE_PROCESSOR_COLUMNS: dict[str, list[str]] = {
+    "dispatch_interconnectorres": ["settlementdate", "interconnectorid", "meteredmwflow"],
+    "dispatch_unit_scada": ["settlementdate", "duid", "scadavalue"],
+    "dispatch_unit_solution": ["settlementdate", "duid", "initialmw"],
+    "meter_data_gen_duid": ["interval_datetime", "duid", "mwh_reading"],
+    "rooftop_actual": ["interval_datetime", "regionid", "power"],
+    "rooftop_forecast": ["interval_datetime", "regionid", "powermean"],
+    "dispatch_price": ["settlementdate", "regionid", "rrp"],
+    "trading_price": ["settlementdate", "regionid", "rrp"],
+    "dispatch_regionsum": ["settlementdate", "regionid", "netinterchange", "totaldemand", "demand_and_nonschedgen"],
+    "trading_regionsum": ["settlementdate", "regionid", "netinterchange"],
+}
+
+
+def get_table_projection() -> AEMOTableProjection:
+    """Projection of the tables and columns the processors store. Passed to the parsers so
+    they skip everything else"""
+    return {table_name: TABLE_PROCESSOR_COLUMNS.get(table_name) for table_name in TABLE_PROCESSOR_MAP}
+
 
-def store_aemo_tableset(tableset: AEMOTableSet) -> ControllerReturn:
+def merge_controller_return(cr: ControllerReturn, record_item: ControllerReturn) -> None:
+    """Adds the counts from a processor return into the aggregate return"""
+    for processor_name, processor_time in record_item.processor_timings.items():
+        cr.processor_timings[processor_name] = cr.processor_timings.get(processor_name, 0.0) + processor_time
+
+    cr.processed_records += record_item.processed_records
+    cr.total_records += record_item.total_records
+    cr.inserted_records += record_item.inserted_records
+    cr.changed_records += record_item.changed_records
+    cr.errors += record_item.errors
+    cr.error_detail += record_item.error_detail
+
+    if record_item.server_latest and (not cr.server_latest or record_item.server_latest > cr.server_latest):
+        cr.server_latest = record_item.server_latest
+
+
+def _run_processor(
+    conn: Any, processor_name: str, processor: Callable[..., ControllerReturn], tables: Any, atomic: bool = False
+) -> ControllerReturn:
+    """Runs a processor inside the shared connection and times it. Each processor runs in a savepoint
+    so a failure only rolls back its own writes, unless atomic where it fails the whole transaction"""
+    savepoint = None if atomic else conn.begin_nested()
+    start_time = time.perf_counter()
+
+    try:
+        record_item = processor(tables)
+
+        if record_item.errors:
+            error_message = f"{record_item.errors} errors storing records"
+
+            if record_item.error_detail:
+                error_message += ": " + "; ".join(str(i) for i in record_item.error_detail)
+
+            raise ProcessorException(error_message)
+
+        if savepoint:
+            savepoint.commit()
+
+    except Exception as e:
+        if savepoint and savepoint.is_active:
+            savepoint.rollback()
+
+        if isinstance(e, ProcessorException):
+            raise
+
+        raise ProcessorException(f"{processor_name} failed: {e}") from e
+
+    finally:
+        processor_time = time.perf_counter() - start_time
+        logger.info(f"Processor {processor_name} took {processor_time:.3f}s")
+
+    record_item.processor_timings[processor_name] = processor_time
+
+    return record_item
+
+
+def store_aemo_table_batches(batches: Iterable[AEMOTableBatch], atomic: bool = False) -> ControllerReturn:
+    """Stores record batches from the streaming MMS parser. Each batch is run through
+    the table processor as it arrives so only one batch is held in memory. All batches
+    are stored on one connection in a single transaction"""
+    cr = ControllerReturn()
+
+    with shared_connection() as conn:
+        for table_name, fieldnames, records in batches:
+            if table_name not in TABLE_PROCESSOR_MAP:
+                logger.debug("No processor for table %s", table_name)
+                continue
+
+            process_meth = TABLE_PROCESSOR_MAP[table_name]
+
+            if process_meth not in globals():
+                logger.info("Invalid processing function %s", process_meth)
+                continue
+
+            # full_name is namespace_name so splitting on the first separator round-trips it
+            table_namespace, _, name = table_name.partition("_")
+            table = AEMOTableSchema(namespace=table_namespace, name=name, fieldnames=fieldnames, records=records)
+
+            logger.info(f"processing batch for table {table_name} with {len(records)} records")
+
+            try:
+                record_item = _run_processor(conn, process_meth, globals()[process_meth], table, atomic=atomic)
+            except Exception as e:
+                logger.error(f"Error processing batch for {table_name}: {e}")
+
+                if atomic:
+                    raise
+
+                cr.errors += len(records)
+                continue
+
+            merge_controller_return(cr, record_item)
+
+    return cr
+
+
+def store_aemo_tableset(tableset: AEMOTableSet, atomic: bool = False) -> ControllerReturn:
+    """Stores a table set through the table processors on one connection in a single
+    transaction. With atomic any processor failure rolls back the whole table set"""
     if not tableset.tables:
         raise Exception("Invalid item - no tables located")
 
     cr = ControllerReturn()
 
-    for table in tableset.tables:
-        if table.full_name not in TABLE_PROCESSOR_MAP:
-            logger.info("No processor for table %s", table.full_name)
-            continue
+    # the balancing summary tables are merged and stored together
+    balancing_tables = [t for t in tableset.tables if t.full_name in BALANCING_SUMMARY_TABLE_FIELDS and t.record_count]
 
-        process_meth = TABLE_PROCESSOR_MAP[table.full_name]
+    with shared_connection() as conn:
+        if balancing_tables:
+            balancing_table_names = ", ".join(t.full_name for t in balancing_tables)
+            logger.info(f"processing balancing summary from {balancing_table_names}")
 
-        if process_meth not in globals():
-            logger.info("Invalid processing function %s", process_meth)
-            continue
+            try:
+                record_item = _run_processor(
+                    conn, "process_balancing_summary", process_balancing_summary, balancing_tables, atomic=atomic
+                )
+                logger.info(
+                    f"Stored {record_item.inserted_records} balancing summary records from {balancing_table_names}"
+                )
+                merge_controller_return(cr, record_item)
+            except Exception as e:
+                logger.error(f"Error processing {balancing_table_names}: {e}")
 
-        logger.info(f"processing table {table.full_name} with {len(table.records)} records")
+                if atomic:
+                    raise
 
-        record_item = None
+                cr.errors += sum(t.record_count for t in balancing_tables)
 
-        try:
-            record_item = globals()[process_meth](table)
-            logger.info(f"Stored {record_item.inserted_records} records for table {table.full_name}")
-        except Exception as e:
-            logger.error(f"Error processing {table.full_name}: {e}")
-            continue
+        for table in tableset.tables:
+            if table.full_name in BALANCING_SUMMARY_TABLE_FIELDS:
+                continue
+
+            if table.full_name not in TABLE_PROCESSOR_MAP:
+                logger.info("No processor for table %s", table.full_name)
+                continue
+
+            process_meth = TABLE_PROCESSOR_MAP[table.full_name]
+
+            if process_meth not in globals():
+                logger.info("Invalid processing function %s", process_meth)
+                continue
+
+            logger.info(f"processing table {table.full_name} with {table.record_count} records")
+
+            try:
+                record_item = _run_processor(conn, process_meth, globals()[process_meth], table, atomic=atomic)
+                logger.info(
+                    f"Stored {record_item.inserted_records} records ({record_item.changed_records} changed) "
+                    f"for table {table.full_name}"
+                )
+            except Exception as e:
+                logger.error(f"Error processing {table.full_name}: {e}")
+
+                if atomic:
+                    raise
+
+                cr.errors += table.record_count
+                continue
 
-        if record_item:
-            cr.processed_records += record_item.processed_records
-            cr.total_records += record_item.total_records
-            cr.inserted_records += record_item.inserted_records
-            cr.errors += record_item.errors
-            cr.error_detail += record_item.error_detail
-            cr.server_latest = record_item.server_latest
+            merge_controller_return(cr, record_item)
 
     return cr
@@ -15,7 +15,10 @@ class ControllerReturn(BaseConfig):
     server_latest: datetime | None = None
     total_records: int = 0
     inserted_records: int = 0
+    # records that were new or changed a stored row. re-crawled data stores records without changing any
+    changed_records: int = 0
     processed_records: int = 0
     errors: int = 0
     error_detail: list[str | None] = []
     crawls_run: int | None = None
+    processor_timings: dict[str, float] = {}
@@ -0,0 +1,222 @@
+"""
+Archive backfill orchestrator
+
+Plans the archive files of a crawler for a date range and stores them across a pool of
+workers. Each stored file is checkpointed in crawl_history so a backfill that is stopped
+or crashes picks up from the files that are left when it is run again.
+
+Workers are local processes or, in production, huey workers. Submission is throttled to a
+target rate of records written per second so a backfill does not starve the live crawlers
+of database writes.
+"""
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any
+
+from opennem import settings
+from opennem.controllers.nem import get_table_projection, merge_controller_return
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.crawlers.history import CrawlHistoryEntry, crawler_history_has_intervals, set_crawler_history
+from opennem.core.crawlers.schema import CrawlerDefinition
+from opennem.core.parsers.dirlisting import DirlistingEntry, get_dirlisting
+from opennem.crawlers.nemweb import store_aemo_entry
+from opennem.db import get_database_engine, isolated_bulk_inserts
+from opennem.schema.date_range import CrawlDateRange
+
+logger = logging.getLogger("opennem.crawler.backfill")
+
+
+class BackfillException(Exception):
+    pass
+
+
+@dataclass
+class BackfillProgress:
+    """Throughput and ETA of a running backfill"""
+
+    files_total: int
+    bytes_total: int = 0
+    files_done: int = 0
+    bytes_done: int = 0
+    records: int = 0
+    errors: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> timedelta | None:
+        """Remaining time from the bytes stored so far, or files where sizes are unknown"""
+        if self.bytes_total and self.bytes_done:
+            return timedelta(seconds=self.elapsed * (self.bytes_total - self.bytes_done) / self.bytes_done)
+
+        if self.files_done:
+            return timedelta(seconds=self.elapsed * (self.files_total - self.files_done) / self.files_done)
+
+        return None
+
+    def __str__(self) -> str:
+        eta = str(self.eta).split(".")[0] if self.eta is not None else "unknown"
+
+        return (
+            f"{self.files_done}/{self.files_total} files, {self.errors} errors, {self.records} records "
+            f"at {self.records_per_second:.0f}/s, ETA {eta}"
+        )
+
+
+def plan_backfill(crawler: CrawlerDefinition, date_range: CrawlDateRange) -> list[DirlistingEntry]:
+    """Archive files of a crawler with intervals in date_range that are not checkpointed in crawl_history"""
+    if not crawler.url:
+        raise BackfillException(f"Crawler {crawler.name} has no url to backfill")
+
+    dirlisting = get_dirlisting(crawler.url, timezone="Australia/Brisbane")
+
+    if crawler.filename_filter:
+        dirlisting.apply_filter(crawler.filename_filter)
+
+    entries = [
+        e
+        for e in dirlisting.get_files()
+        if e.aemo_interval_date and date_range.start <= e.aemo_interval_date <= date_range.end
+    ]
+
+    # workers checkpoint from other processes so rebuild from crawl_history
+    completed = crawler_history_has_intervals(
+        crawler.name, [e.aemo_interval_date for e in entries], rebuild=True  # type: ignore
+    )
+
+    planned = [e for e, done in zip(entries, completed, strict=True) if not done]
+
+    logger.info(
+        f"Planned {len(planned)} files for {crawler.name} between {date_range.start} and {date_range.end}. "
+        f"{len(entries) - len(planned)} already completed"
+    )
+
+    return planned
+
+
+def run_backfill_entry(crawler: CrawlerDefinition, entry: DirlistingEntry) -> ControllerReturn:
+    """Stores an archive file and checkpoints it. Runs in the worker. Bulk inserts commit a chunk
+    at a time so the backfill doesn't hold row locks for a whole file"""
+    with isolated_bulk_inserts():
+        controller_returns = store_aemo_entry(crawler, entry, projection=get_table_projection())
+
+    if entry.aemo_interval_date and not controller_returns.errors:
+        set_crawler_history(
+            crawler_name=crawler.name,
+            histories=[CrawlHistoryEntry(interval=entry.aemo_interval_date, records=controller_returns.processed_records)],
+        )
+
+    return controller_returns
+
+
+def _init_backfill_worker() -> None:
+    """Pool initializer. Drops the connection pool inherited from the parent, which planned the
+    backfill from crawl_history, so each worker opens its own"""
+    get_database_engine().dispose(close=False)
+
+
+def get_throttle_delay(records: int, elapsed: float, target_write_rate: int) -> float:
+    """Seconds to wait so the records written stay at or under the target records per second"""
+    if not target_write_rate:
+        return 0.0
+
+    return max(0.0, records / target_write_rate - elapsed)
+
+
+def _submit_local(executor: ProcessPoolExecutor) -> Callable[[CrawlerDefinition, DirlistingEntry], Callable[[], Any]]:
+    def _submit(crawler: CrawlerDefinition, entry: DirlistingEntry) -> Callable[[], Any]:
+        future: Future = executor.submit(run_backfill_entry, crawler, entry)
+        return future.result
+
+    return _submit
+
+
+def _submit_huey(crawler: CrawlerDefinition, entry: DirlistingEntry) -> Callable[[], Any]:
+    # @NOTE imported here as the scheduler module sets up huey and sends a startup alert
+    from opennem.workers.scheduler import run_backfill_entry_task
+
+    result = run_backfill_entry_task(crawler, entry)
+
+    return lambda: result.get(blocking=True)
+
+
+def run_backfill(
+    crawler: CrawlerDefinition,
+    date_range: CrawlDateRange,
+    workers: int | None = None,
+    target_write_rate: int | None = None,
+    use_huey: bool = False,
+) -> ControllerReturn:
+    """Backfills the archive files of a crawler for a date range across a pool of workers
+
+    At most workers files are in flight. Results are collected in plan order and new files are
+    held back while the records written are ahead of target_write_rate records per second"""
+    workers = workers or settings.backfill_workers
+    target_write_rate = settings.backfill_target_write_rate if target_write_rate is None else target_write_rate
+
+    entries = plan_backfill(crawler, date_range)
+    controller_returns = ControllerReturn()
+
+    if not entries:
+        logger.info(f"Nothing to backfill for {crawler.name}")
+        return controller_returns
+
+    progress = BackfillProgress(files_total=len(entries), bytes_total=sum(e.file_size or 0 for e in entries))
+    pending: deque[tuple[DirlistingEntry, Callable[[], Any]]] = deque()
+    entries_iter = iter(entries)
+
+    logger.info(f"Backfilling {len(entries)} files for {crawler.name} with {workers} {'huey' if use_huey else 'local'} workers")
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_backfill_worker) if not use_huey else None
+    submit = _submit_local(executor) if executor else _submit_huey
+
+    try:
+        while True:
+            while len(pending) < workers:
+                entry = next(entries_iter, None)
+
+                if entry is None:
+                    break
+
+                time.sleep(get_throttle_delay(progress.records, progress.elapsed, target_write_rate))
+                pending.append((entry, submit(crawler, entry)))
+
+            if not pending:
+                break
+
+            entry, result = pending.popleft()
+
+            try:
+                entry_controller_returns: ControllerReturn = result()
+                merge_controller_return(controller_returns, entry_controller_returns)
+                progress.records += entry_controller_returns.inserted_records
+            except Exception as e:
+                logger.error(f"Backfill error for {entry.link}: {e}")
+                controller_returns.errors += 1
+                progress.errors += 1
+
+            progress.files_done += 1
+            progress.bytes_done += entry.file_size or 0
+
+            logger.info(f"{crawler.name} backfill: {progress}")
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    controller_returns.crawls_run = len(entries)
+    controller_returns.last_modified = max([e.modified_date for e in entries if e.modified_date], default=None)
+
+    return controller_returns
+
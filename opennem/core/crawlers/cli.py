@@ -1,17 +1,21 @@
 """ Crawl commands cli """
 import logging
+from datetime import datetime
 from pathlib import Path
 
 import click
 from rich.table import Table
 
 from opennem import console
+from opennem.core.crawlers.backfill import run_backfill
 from opennem.core.crawlers.crawler import crawlers_flush_metadata, crawlers_get_crawl_metadata
 from opennem.core.parsers.aemo.nemweb import parse_aemo_url_optimized
 from opennem.crawl import get_crawl_set, run_crawl
+from opennem.schema.date_range import CrawlDateRange
 from opennem.utils.http import test_proxy
 from opennem.utils.timesince import timesince
 from opennem.utils.url import is_url
+from opennem.workers.nemweb_watcher import run_nemweb_watcher
 
 logger = logging.getLogger("opennem.cli")
 
@@ -107,7 +111,37 @@ def crawl_cli_import(url: str):
         parse_aemo_url_optimized(u)
 
 
+@click.command()
+@click.argument("name")
+@click.option("--start", required=True, type=click.DateTime(), help="First interval to backfill in NEM time")
+@click.option("--end", required=True, type=click.DateTime(), help="Last interval to backfill in NEM time")
+@click.option("--workers", default=None, type=int, help="Number of workers")
+@click.option("--write-rate", default=None, type=int, help="Target records written per second")
+@click.option("--huey", default=False, is_flag=True, help="Run on the huey workers")
+def crawl_cli_backfill(
+    name: str, start: datetime, end: datetime, workers: int | None, write_rate: int | None, huey: bool
+) -> None:
+    """Backfills archive files for a crawler over a date range. Resumes from files already stored"""
+    crawler = get_crawl_set().get_crawler(name)
+
+    console.log(f"Backfilling [blue]{crawler.name}[/blue] from {start} to {end}")
+
+    cr = run_backfill(
+        crawler, CrawlDateRange(start=start, end=end), workers=workers, target_write_rate=write_rate, use_huey=huey
+    )
+
+    console.log(f"Backfilled {cr.crawls_run or 0} files with {cr.inserted_records} records and {cr.errors} errors")
+
+
+@click.command()
+def crawl_cli_watch() -> None:
+    """Watches the live NEMWeb directories and enqueues their crawls as new files are published"""
+    run_nemweb_watcher()
+
+
 cmd_crawl_cli.add_command(crawl_cli_run, name="run")
 cmd_crawl_cli.add_command(crawl_cli_list, name="list")
 cmd_crawl_cli.add_command(crawl_cli_flush, name="flush")
 cmd_crawl_cli.add_command(crawl_cli_import, name="import")
+cmd_crawl_cli.add_command(crawl_cli_backfill, name="backfill")
+cmd_crawl_cli.add_command(crawl_cli_watch, name="watch")
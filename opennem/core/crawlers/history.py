@@ -1,16 +1,21 @@
 """" Reads and stores crawler history """
 import logging
+import threading
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from textwrap import dedent
 
+import numpy as np
 from datetime_truncate import truncate as date_trunc
 from sqlalchemy import text as sql
 from sqlalchemy.dialects.postgresql import insert
 
+from opennem import settings
 from opennem.core.time import get_interval
 from opennem.db import get_database_engine, get_scoped_session
 from opennem.db.models.opennem import CrawlHistory
+from opennem.schema.network import NetworkNEM
 from opennem.schema.time import TimeInterval
 from opennem.utils.dates import get_today_opennem
 
@@ -28,6 +33,170 @@ class CrawlHistoryGap:
     interval: datetime
 
 
+# crawl history bitmap slots are 5 minute NEM intervals counted from this naive NEM time
+CRAWL_HISTORY_BITMAP_EPOCH = datetime(1998, 12, 1)
+CRAWL_HISTORY_BITMAP_SLOT_MINUTES = 5
+
+# interval sizes that step a fixed number of slots. months, quarters and years use the sql path
+CRAWL_HISTORY_BITMAP_MAX_INTERVAL = 20160
+
+
+@dataclass
+class CrawlHistoryBitmap:
+    """Which 5 minute slots a crawler has history records for
+
+    Bit i is set when crawl_history has a row with inserted records for the slot at
+    offset + i. Intervals off the 5 minute grid are never part of a missing interval query
+    so are not tracked. processed_time is the latest crawl_history processed_time applied
+    and is used to pick up rows written by other processes"""
+
+    built_at: float = field(default_factory=time.monotonic)
+    processed_time: datetime | None = None
+    offset: int = 0
+    bits: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))
+
+    def set(self, slots: np.ndarray, has_records: np.ndarray) -> None:
+        if not len(slots):
+            return
+
+        low, high = int(slots.min()), int(slots.max())
+
+        if not len(self.bits):
+            self.offset = low
+
+        # grow to cover the slots
+        start, end = min(self.offset, low), max(self.offset + len(self.bits), high + 1)
+
+        if start != self.offset or end != self.offset + len(self.bits):
+            bits = np.zeros(end - start, dtype=bool)
+            bits[self.offset - start : self.offset - start + len(self.bits)] = self.bits
+            self.bits, self.offset = bits, start
+
+        self.bits[slots - self.offset] = has_records
+
+    def has(self, slots: np.ndarray) -> np.ndarray:
+        positions = slots - self.offset
+        in_range = (positions >= 0) & (positions < len(self.bits))
+        found = np.zeros(len(slots), dtype=bool)
+        found[in_range] = self.bits[positions[in_range]]
+
+        return found
+
+
+_crawl_history_bitmaps: dict[str, CrawlHistoryBitmap] = {}
+_crawl_history_bitmaps_lock = threading.Lock()
+
+
+def _intervals_to_slots(intervals: list[datetime]) -> tuple[np.ndarray, np.ndarray]:
+    """Maps naive NEM time intervals to bitmap slots. Returns the slots and a mask of those on the grid"""
+    minutes = np.array([(i - CRAWL_HISTORY_BITMAP_EPOCH) // timedelta(minutes=1) for i in intervals], dtype=np.int64)
+    on_grid = np.array([i.second == 0 and i.microsecond == 0 for i in intervals], dtype=bool)
+    on_grid &= minutes % CRAWL_HISTORY_BITMAP_SLOT_MINUTES == 0
+
+    return minutes // CRAWL_HISTORY_BITMAP_SLOT_MINUTES, on_grid
+
+
+def _nem_naive(interval: datetime) -> datetime:
+    if interval.tzinfo:
+        return interval.astimezone(NetworkNEM.get_fixed_offset()).replace(tzinfo=None)
+
+    return interval
+
+
+def _apply_crawler_history_rows(bitmap: CrawlHistoryBitmap, crawler_name: str) -> int:
+    """Applies crawl_history rows processed since the bitmap processed_time. Returns the number of rows"""
+    engine = get_database_engine()
+
+    # @NOTE inclusive so rows committed late with the same processed_time are not skipped
+    processed_time_filter = "and ch.processed_time >= :processed_time" if bitmap.processed_time else ""
+
+    # @NOTE cast the same way the missing interval query joins naive intervals against crawl_history
+    stmt = sql(
+        f"""
+        select
+            ch.interval::timestamp,
+            ch.inserted_records is not null,
+            ch.processed_time
+        from crawl_history ch
+        where
+            ch.crawler_name = :crawler_name
+            {processed_time_filter}
+    """
+    )
+
+    query = stmt.bindparams(crawler_name=crawler_name)
+
+    if bitmap.processed_time:
+        query = query.bindparams(processed_time=bitmap.processed_time)
+
+    with engine.connect() as c:
+        rows = list(c.execute(query))
+
+    if not rows:
+        return 0
+
+    slots, on_grid = _intervals_to_slots([i[0] for i in rows])
+    has_records = np.array([i[1] for i in rows], dtype=bool)
+    bitmap.set(slots[on_grid], has_records[on_grid])
+
+    bitmap.processed_time = max(filter(None, [bitmap.processed_time, *(i[2] for i in rows)]), default=None)
+
+    return len(rows)
+
+
+def _load_crawler_history_bitmap(crawler_name: str) -> CrawlHistoryBitmap:
+    """Builds a crawler bitmap from crawl_history"""
+    bitmap = CrawlHistoryBitmap()
+    num_rows = _apply_crawler_history_rows(bitmap, crawler_name)
+
+    logger.debug(f"Built crawl history bitmap for {crawler_name} from {num_rows} intervals")
+
+    return bitmap
+
+
+def get_crawler_history_bitmap(crawler_name: str, rebuild: bool = False) -> CrawlHistoryBitmap:
+    """Gets the crawler bitmap building it from crawl_history on first use or once it is stale
+
+    A cached bitmap is caught up with crawl_history rows processed since it was last read so
+    history written by other crawler processes is seen before the bitmap is trusted"""
+    with _crawl_history_bitmaps_lock:
+        bitmap = _crawl_history_bitmaps.get(crawler_name)
+
+        if rebuild or not bitmap or time.monotonic() - bitmap.built_at > settings.crawl_history_bitmap_rebuild_sec:
+            bitmap = _load_crawler_history_bitmap(crawler_name)
+            _crawl_history_bitmaps[crawler_name] = bitmap
+        else:
+            _apply_crawler_history_rows(bitmap, crawler_name)
+
+        return bitmap
+
+
+def update_crawler_history_bitmap(crawler_name: str, histories: list[CrawlHistoryEntry]) -> None:
+    """Applies stored crawl history to a crawler bitmap if it has been built"""
+    with _crawl_history_bitmaps_lock:
+        bitmap = _crawl_history_bitmaps.get(crawler_name)
+
+        if not bitmap:
+            return
+
+        slots, on_grid = _intervals_to_slots([_nem_naive(i.interval) for i in histories])
+        has_records = np.array([i.records is not None for i in histories], dtype=bool)
+        bitmap.set(slots[on_grid], has_records[on_grid])
+
+
+def crawler_history_has_intervals(crawler_name: str, intervals: list[datetime], rebuild: bool = False) -> list[bool]:
+    """Whether crawl_history has records for each interval. Intervals off the 5 minute grid are never found"""
+    bitmap = get_crawler_history_bitmap(crawler_name, rebuild=rebuild)
+    slots, on_grid = _intervals_to_slots([_nem_naive(i) for i in intervals])
+
+    return (bitmap.has(slots) & on_grid).tolist()
+
+
+def clear_crawler_history_bitmaps() -> None:
+    with _crawl_history_bitmaps_lock:
+        _crawl_history_bitmaps.clear()
+
+
 def set_crawler_history(crawler_name: str, histories: list[CrawlHistoryEntry]) -> int:
     """Sets the crawler history"""
     engine = get_database_engine()
@@ -93,6 +262,7 @@ def set_crawler_history(crawler_name: str, histories: list[CrawlHistoryEntry]) -
     try:
         session.execute(stmt)
         session.commit()
+        update_crawler_history_bitmap(crawler_name, histories)
     except Exception as e:
         logger.error(f"set_crawler_history error updating records: {e}")
     finally:
@@ -144,12 +314,104 @@ def get_crawler_history(crawler_name: str, interval: TimeInterval, days: int = 3
     return models
 
 
+def get_latest_nemweb_interval() -> datetime:
+    """Latest 5 minute interval in naive NEM time. Mirrors the nemweb_latest_interval() sql function"""
+    now = datetime.now(NetworkNEM.get_fixed_offset()).replace(tzinfo=None, second=0, microsecond=0)
+
+    return now.replace(minute=now.minute - now.minute % 5)
+
+
+def _truncate_missing_intervals(models: list[datetime], interval: TimeInterval) -> list[datetime]:
+    # truncate
+    # @NOTE specific >= as we trunc hour or greater
+    if interval.interval >= 60:
+        models = [date_trunc(i, interval.trunc) for i in models]
+
+    return models
+
+
+def _bitmap_supports_interval(interval: TimeInterval) -> bool:
+    return interval.interval % CRAWL_HISTORY_BITMAP_SLOT_MINUTES == 0 and interval.interval <= CRAWL_HISTORY_BITMAP_MAX_INTERVAL
+
+
+def get_crawler_missing_intervals_bitmap(
+    crawler_name: str,
+    interval: TimeInterval,
+    days: int = 365 * 3,
+    latest_interval: datetime | None = None,
+) -> list[datetime]:
+    """Gets the crawler missing intervals going back a period of days from the crawler bitmap
+
+    Steps the same series as the sql query from latest - days up to latest"""
+    if not _bitmap_supports_interval(interval):
+        raise Exception(f"Interval {interval.interval_human} not supported by the crawl history bitmap")
+
+    if not latest_interval:
+        latest_interval = get_latest_nemweb_interval()
+
+    bitmap = get_crawler_history_bitmap(crawler_name)
+
+    latest_slot = int(_intervals_to_slots([latest_interval])[0][0])
+    slots_per_day = 24 * 60 // CRAWL_HISTORY_BITMAP_SLOT_MINUTES
+    step = interval.interval // CRAWL_HISTORY_BITMAP_SLOT_MINUTES
+
+    # descending like the sql query
+    slots = np.arange(latest_slot - days * slots_per_day, latest_slot + 1, step)[::-1]
+    missing = slots[~bitmap.has(slots)]
+
+    models = (
+        (np.datetime64(CRAWL_HISTORY_BITMAP_EPOCH, "m") + missing * CRAWL_HISTORY_BITMAP_SLOT_MINUTES)
+        .astype("datetime64[us]")
+        .tolist()
+    )
+
+    return _truncate_missing_intervals(models, interval)
+
+
 def get_crawler_missing_intervals(
     crawler_name: str,
     interval: TimeInterval,
     days: int = 365 * 3,
 ) -> list[datetime]:
     """Gets the crawler missing intervals going back a period of days"""
+    if settings.crawl_history_bitmap and _bitmap_supports_interval(interval):
+        return get_crawler_missing_intervals_bitmap(crawler_name, interval=interval, days=days)
+
+    return get_crawler_missing_intervals_sql(crawler_name, interval=interval, days=days)
+
+
+def check_crawler_history_bitmap(crawler_name: str, interval: TimeInterval, days: int = 365 * 3) -> bool:
+    """Consistency check of the crawler bitmap against the sql missing interval query. Rebuilds the
+    bitmap when they differ"""
+    sql_missing = get_crawler_missing_intervals_sql(crawler_name, interval=interval, days=days)
+
+    # the sql results are relative to the database clock so use the same latest interval
+    with get_database_engine().connect() as c:
+        latest_interval = c.execute(sql("select nemweb_latest_interval()")).scalar()
+
+    bitmap_missing = get_crawler_missing_intervals_bitmap(
+        crawler_name, interval=interval, days=days, latest_interval=latest_interval
+    )
+
+    if set(sql_missing) == set(bitmap_missing):
+        return True
+
+    logger.warning(
+        f"Crawl history bitmap for {crawler_name} differs from crawl_history: "
+        f"{len(bitmap_missing)} missing vs {len(sql_missing)} in sql. Rebuilding"
+    )
+
+    get_crawler_history_bitmap(crawler_name, rebuild=True)
+
+    return False
+
+
+def get_crawler_missing_intervals_sql(
+    crawler_name: str,
+    interval: TimeInterval,
+    days: int = 365 * 3,
+) -> list[datetime]:
+    """Gets the crawler missing intervals going back a period of days from crawl_history in the database"""
     engine = get_database_engine()
 
     stmt = sql(
@@ -187,12 +449,7 @@ def get_crawler_missing_intervals(
 
     models = [i[0] for i in results]
 
-    # truncate
-    # @NOTE specific >= as we trunc hour or greater
-    if interval.interval >= 60:
-        models = [date_trunc(i, interval.trunc) for i in models]
-
-    return models
+    return _truncate_missing_intervals(models, interval)
 
 
 if __name__ == "__main__":
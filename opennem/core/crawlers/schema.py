@@ -47,6 +47,9 @@ class CrawlerDefinition(BaseConfig):
     backfill_days: int | None = None
     bulk_insert: bool = Field(default=False)
 
+    # number of files fetched and parsed concurrently ahead of the store. 1 runs them in turn
+    concurrency: int = Field(default=1)
+
     priority: CrawlerPriority
     schedule: CrawlerSchedule | None = None
     backoff: int | None = None
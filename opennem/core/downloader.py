@@ -1,27 +1,28 @@
 import logging
+from collections.abc import Generator
 from io import BytesIO
 from pathlib import Path
 from zipfile import ZipFile
 
 from opennem import settings
-from opennem.utils.archive import _handle_zip, chain_streams
+from opennem.utils.archive import _handle_zip, chain_streams, iter_prefetched, iter_unzipped_chunks
+from opennem.utils.download_cache import cached_download, get_download_cache
 from opennem.utils.http import http
 from opennem.utils.mime import mime_from_content, mime_from_url
 
 logger = logging.getLogger("opennem.downloader")
 
+# size of the chunks read off the wire and how many are read ahead of the consumer
+URL_STREAM_CHUNK_SIZE = 64 * 1024
+URL_STREAM_PREFETCH_CHUNKS = 16
+
 
 def url_downloader(url: str) -> bytes:
     """Downloads a URL and returns content, handling embedded zips and other MIME's"""
 
     logger.debug(f"Downloading: {url}")
 
-    r = http.get(url, verify=settings.http_verify_ssl)
-
-    if not r.ok:
-        raise Exception(f"Bad link returned {r.status_code}: {url}")
-
-    content = BytesIO(r.content)
+    content = BytesIO(cached_download(url, verify=settings.http_verify_ssl))
 
     file_mime = mime_from_content(content)
 
@@ -51,6 +52,36 @@ def url_downloader(url: str) -> bytes:
     return content.getvalue()
 
 
+def url_stream_downloader(
+    url: str, chunk_size: int = URL_STREAM_CHUNK_SIZE, prefetch: int = URL_STREAM_PREFETCH_CHUNKS
+) -> Generator[bytes, None, None]:
+    """Streams a URL as a lazy iterator of byte chunks. Zips and embedded zips are
+    decompressed member by member as they download so memory does not grow with
+    the size of the archive
+
+    @NOTE with the download cache enabled the compressed content is fetched through the
+    cache and decompressed from memory"""
+    download_cache = get_download_cache()
+
+    if download_cache:
+        content = download_cache.fetch(url, verify=settings.http_verify_ssl)
+        yield from iter_unzipped_chunks(content[i : i + chunk_size] for i in range(0, len(content), chunk_size))
+        return None
+
+    logger.debug(f"Streaming: {url}")
+
+    r = http.get(url, verify=settings.http_verify_ssl, stream=True)
+
+    if not r.ok:
+        r.close()
+        raise Exception(f"Bad link returned {r.status_code}: {url}")
+
+    try:
+        yield from iter_unzipped_chunks(iter_prefetched(r.iter_content(chunk_size=chunk_size), depth=prefetch))
+    finally:
+        r.close()
+
+
 def file_opener(path: Path) -> bytes:
     """Opens a local file, handling embedded zips and other MIME's"""
 
@@ -10,7 +10,6 @@ Uses an average in 30 minute buckets
 import logging
 from collections.abc import Generator
 from datetime import date, datetime, timedelta
-from typing import Any
 
 import numpy as np
 import pandas as pd
@@ -89,63 +88,6 @@ def __trading_energy_generator(df: pd.DataFrame, date: date, duid_id: str, power
     return return_cols
 
 
-def __trading_energy_generator_hour(
-    df: pd.DataFrame, hour: datetime, duid_id: str, power_field: str = "generated"
-) -> pd.DataFrame:
-    return_cols = []
-
-    t_start = hour.replace(minute=5)
-
-    for TI in range(2):
-        t_i = t_start + timedelta(0, 1800 * TI)
-        t_f = t_start + timedelta(0, 1800 * (TI + 1))
-
-        _query = f"'{t_i}' <= trading_interval <= '{t_f}' and facility_code == '{duid_id}'"
-
-        d_ti = df.query(_query)
-
-        energy_value = None
-        trading_interval = None
-
-        # rooftop 30m intervals - AEMO rooftop is going to go in a separate network
-        # so this won't be required
-        if (d_ti.fueltech_id.all() == "solar_rooftop") and (d_ti[power_field].count() == 1):
-            energy_value = d_ti[power_field].sum() / 2
-            # ooofff - this delta comes back off as part of NEM offset
-            trading_interval = d_ti.index[0] + timedelta(minutes=5)
-        # interpolate if it isn't padded out
-        elif d_ti[power_field].count() != 7:
-            index_interpolated = pd.date_range(start=t_i, end=t_f, freq="5min", tz=NetworkNEM.get_timezone())
-
-            d_ti = d_ti.reset_index()
-            d_ti = d_ti.set_index("trading_interval")
-            d_ti = d_ti.reindex(index_interpolated)
-            d_ti["facility_code"] = duid_id
-            d_ti[power_field] = d_ti[power_field].replace(np.NaN, 0)
-
-            if d_ti[power_field].count() != 7:
-                logger.warning("Interpolated frame didn't match generated count")
-
-        try:
-            if d_ti.fueltech_id.all() != "solar_rooftop":
-                energy_value = __trapezium_integration(d_ti, power_field)
-                trading_interval = d_ti.index[-2]
-        except ValueError as e:
-            logger.error(f"Error with {duid_id} at {t_i} {t_f}: {e}")
-
-        if not d_ti.index.empty:
-            return_cols.append(
-                {
-                    "trading_interval": trading_interval,
-                    "network_id": "NEM",
-                    "facility_code": duid_id,
-                    "eoi_quantity": energy_value,
-                }
-            )
-
-    return return_cols
-
-
 def get_day_range(df: pd.DataFrame) -> Generator[date, None, None]:
     """Get the day range for a dataframe"""
     min_date = (df.index.min() + timedelta(days=1)).date()
@@ -190,93 +132,220 @@ def _energy_aggregate_compat(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def _energy_aggregate_hours(df: pd.DataFrame) -> pd.DataFrame:
-    """v3 version of energy_sum for compat"""
-    energy_genrecs = []
-
-    hours = list(get_hour_range(df))
-
-    for hour in hours:
-        logger.info(f"Running for hour: {hour}")
-        for duid in sorted(df.facility_code.unique()):
-            energy_genrecs += list(__trading_energy_generator_hour(df, hour, duid))
-
-    df = pd.DataFrame(energy_genrecs, columns=["trading_interval", "network_id", "facility_code", "eoi_quantity"])
-
-    return df
-
-
-def _trapezium_integration_variable(d_ti: pd.Series) -> float | None:
-    """Gapfill version of trap int - will fill out"""
-    # Clear no numbers
-    d_ti = d_ti.dropna()
+def _energy_aggregate_hours(df: pd.DataFrame, power_field: str = "generated") -> pd.DataFrame:
+    """v3 version of energy_sum for compat
 
-    if d_ti.count() == 0:
-        return None
+    Trapezium energy for the two half hour buckets of each hour in the hour range for every duid.
+    Each bucket runs from :05 or :35 for 30 minutes and includes both edges so a full bucket has
+    seven readings. Buckets with all seven readings integrate them as they are. Otherwise the
+    readings on the 5 minute grid of the bucket are used with missing readings as zero.
 
-    # One entry
-    if d_ti.count() == 1:
-        return d_ti[0] * 0.5
+    Rooftop is in 30 minute intervals and a bucket with a single reading is half of it.
 
-    # Fall back on average but warn to check data
-    if d_ti.count() <= 3:
-        d_sum = d_ti.sum()
+    Computed over the whole frame at once. Readings are assigned to the buckets that contain them
+    and each bucket is reduced with a groupby, and gaps are filled on a dense duid by grid array"""
+    columns = ["trading_interval", "network_id", "facility_code", "eoi_quantity"]
 
-        if d_sum == 0:
-            return 0
+    hours = list(get_hour_range(df))
 
-        if d_ti.count() == 0:
-            return 0
+    if not hours:
+        return pd.DataFrame([], columns=columns)
+
+    bucket_size = 30 * 60 * 10**9
+    grid_size = 5 * 60 * 10**9
+    grid_points = bucket_size // grid_size + 1
+    weights = np.array([1] + [2] * (grid_points - 2) + [1])
+
+    t_start = hours[0].replace(minute=5)
+    buckets = len(hours) * 2
+
+    duids = np.array(sorted(df.facility_code.unique()), dtype=object)
+    duid_index = np.searchsorted(duids, df.facility_code.to_numpy())
+    rooftop = df.groupby("facility_code").fueltech_id.agg(lambda f: (f == "solar_rooftop").all()).reindex(duids).to_numpy()
+
+    offset = np.asarray((df.index - t_start).asi8, dtype=np.int64)
+    value = df[power_field].to_numpy(dtype=float)
+
+    # each reading is in the bucket it falls in and the bucket before if it is on the edge
+    bucket = offset // bucket_size
+    on_edge = offset % bucket_size == 0
+    rows = np.arange(len(df))
+
+    member_row = np.concatenate([rows, rows[on_edge]])
+    member_bucket = np.concatenate([bucket, bucket[on_edge] - 1])
+    in_range = (member_bucket >= 0) & (member_bucket < buckets)
+    member_row, member_bucket = member_row[in_range], member_bucket[in_range]
+
+    # readings of each bucket in frame order
+    order = np.lexsort((member_row, duid_index[member_row], member_bucket))
+    member_row, member_bucket = member_row[order], member_bucket[order]
+
+    members = pd.DataFrame(
+        {
+            "bucket": member_bucket,
+            "duid": duid_index[member_row],
+            "offset": offset[member_row],
+            "value": value[member_row],
+        }
+    )
+    members["position"] = members.groupby(["bucket", "duid"]).cumcount()
+    members["weighted"] = members.value * np.where(
+        (members.position == 0) | (members.position == grid_points - 1), weights[0], weights[1]
+    )
 
-        return 0.5 * d_sum / d_ti.count()
+    grouped = members.groupby(["bucket", "duid"])
+    readings = grouped.size()
+    readings_counted = grouped.value.count()
+    readings_energy = grouped.weighted.sum() / 24
+    readings_interval = members[members.position == grid_points - 2].set_index(["bucket", "duid"]).offset
+    first_reading = grouped.offset.first()
+    readings_sum = grouped.value.sum()
+
+    # every duid has a row for every bucket
+    bucket_duid = pd.MultiIndex.from_product([np.arange(buckets), np.arange(len(duids))], names=["bucket", "duid"])
+    readings = readings.reindex(bucket_duid, fill_value=0).to_numpy()
+    readings_counted = readings_counted.reindex(bucket_duid, fill_value=0).to_numpy()
+    readings_energy = readings_energy.reindex(bucket_duid).to_numpy()
+    readings_interval = readings_interval.reindex(bucket_duid).to_numpy(dtype=float)
+    first_reading = first_reading.reindex(bucket_duid).to_numpy(dtype=float)
+    readings_sum = readings_sum.reindex(bucket_duid).to_numpy()
+
+    # readings on the grid with missing as zero
+    grid = np.zeros((len(duids), buckets * (grid_points - 1) + 1))
+    on_grid = (offset % grid_size == 0) & (offset >= 0) & (offset < grid.shape[1] * grid_size)
+    grid[duid_index[on_grid], offset[on_grid] // grid_size] = np.nan_to_num(value[on_grid])
+
+    grid_windows = np.lib.stride_tricks.sliding_window_view(grid, grid_points, axis=1)[:, :: grid_points - 1]
+    grid_energy = (grid_windows @ weights).T.reshape(-1) / 24
+
+    bucket_index, duid_ids = (np.asarray(c, dtype=np.int64) for c in bucket_duid.codes)
+    bucket_offset = bucket_index * bucket_size
+
+    # a full bucket with extra empty readings can't be integrated
+    full = readings_counted == grid_points
+    full_integrated = full & (readings == grid_points)
+    energy = np.where(full, np.where(full_integrated, readings_energy, np.nan), grid_energy)
+    interval = np.where(full, np.where(full_integrated, readings_interval, np.nan), bucket_offset + (grid_points - 2) * grid_size)
+
+    for b, d in zip(bucket_index[full & ~full_integrated], duid_ids[full & ~full_integrated], strict=True):
+        logger.error(f"Error with {duids[d]} at {t_start + pd.Timedelta(b * bucket_size)}: bucket has extra empty readings")
+
+    is_rooftop = rooftop[duid_ids]
+    rooftop_single = is_rooftop & (readings_counted == 1)
+    energy = np.where(is_rooftop, np.where(rooftop_single, readings_sum / 2, np.nan), energy)
+    interval = np.where(is_rooftop, np.where(rooftop_single, first_reading + grid_size, np.nan), interval)
+
+    energy_df = pd.DataFrame(
+        {
+            "trading_interval": t_start + pd.to_timedelta(interval, unit="ns"),
+            "network_id": "NEM",
+            "facility_code": duids[duid_ids],
+            "eoi_quantity": energy,
+            "_hour": bucket_index // 2,
+            "_bucket": bucket_index,
+        }
+    )
 
-    bucket_middle = d_ti.count() - 2
+    # hour, then duid, then the buckets in the hour
+    energy_df = energy_df.sort_values(["_hour", "facility_code", "_bucket"], kind="stable")
 
-    bucket_middle_weights = [1] + [2] * bucket_middle + [1]
+    return energy_df[columns].reset_index(drop=True)
 
-    weights = d_ti.values * bucket_middle_weights
 
-    weights_sum = weights.sum()
+def _trapezium_integration_variable(
+    count: np.ndarray, total: np.ndarray, first: np.ndarray, last: np.ndarray
+) -> np.ndarray:
+    """Gapfill version of trap int over buckets of any number of readings - will fill out
 
-    bucket_energy = 0.5 * weights_sum / ((d_ti.count() - 1) * 2)
+    Takes the count, sum, first and last of the non empty readings of each bucket. Buckets of
+    one reading are half of it, two or three readings fall back on the average and longer buckets
+    weight the middle readings twice. Buckets with no readings are nan"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average = np.where(total == 0, 0, 0.5 * total / count)
+        trapezium = 0.5 * (2 * total - first - last) / ((count - 1) * 2)
 
-    return bucket_energy
+    return np.select([count == 0, count == 1, count <= 3], [np.nan, total * 0.5, average], trapezium)
 
 
 def _energy_aggregate(df: pd.DataFrame, power_column: str = "generated", zero_fill: bool = False) -> pd.DataFrame:
-    """v3 version of energy aggregate for energy_sum - iterates over time bucekts with edges"""
-    in_cap = {}
-    capture: dict[str, Any] = {}
-    values = []
-    dt: datetime | None = None
+    """v3 version of energy aggregate for energy_sum - buckets readings between reading stop edges
+
+    Takes a frame indexed by interval, network and duid in interval order. A duid bucket closes on
+    the reading after a reading at a stop minute and includes the readings from the reading that
+    closed the previous bucket. The first reading of a duid is a bucket on its own. Each bucket is
+    at the last stop interval read before it closes for any duid and the readings still open at
+    the end are not included"""
+    columns = ["trading_interval", "network_id", "facility_code", "eoi_quantity"]
     reading_stops: list[int] = [0, 30]
 
-    for index, value in df.iterrows():
-        i, network_id, duid = index
-
-        if duid not in capture:
-            capture[duid] = []
-            in_cap[duid] = True
-
-        if in_cap[duid]:
-            capture[duid].append(value[power_column])
-
-            if dt:
-                energy = _trapezium_integration_variable(pd.Series(capture[duid]))
-                values.append((dt, network_id, duid, energy))
-
-            in_cap[duid] = False
-            capture[duid] = []
-
-        if i.minute in reading_stops:
-            dt = i
-            capture[duid].append(value[power_column])
-            in_cap[duid] = True
-
-        else:
-            capture[duid].append(value[power_column])
+    if df.empty:
+        return pd.DataFrame([], columns=columns)
+
+    intervals = df.index.get_level_values(0)
+    network_ids = df.index.get_level_values(1).to_numpy()
+    duids = df.index.get_level_values(2).to_numpy()
+    values = df[power_column].to_numpy(dtype=float)
+
+    rows = np.arange(len(df))
+    is_stop = np.isin(intervals.minute, reading_stops)
+
+    # last stop read before each reading for any duid
+    last_stop = np.maximum.accumulate(np.where(is_stop, rows, -1))
+    bucket_stop = np.concatenate([[-1], last_stop[:-1]])
+
+    # buckets close on the first reading of a duid and the reading after a stop
+    duid_codes = pd.factorize(duids)[0]
+    duid_order = np.argsort(duid_codes, kind="stable")
+    duid_start = np.concatenate([[True], duid_codes[duid_order][1:] != duid_codes[duid_order][:-1]])
+    closes = np.empty(len(df), dtype=bool)
+    closes[duid_order] = duid_start | np.concatenate([[False], is_stop[duid_order][:-1]])
+
+    # readings are in the bucket that closes next for the duid and a closing reading also
+    # opens the bucket after it
+    closed = np.empty(len(df), dtype=int)
+    closed[duid_order] = np.cumsum(closes[duid_order]) - 1
+
+    member_row = np.concatenate([rows, rows[closes]])
+    members = pd.DataFrame(
+        {
+            "duid": duid_codes[member_row],
+            "bucket": np.concatenate([closed + 1, closed[closes]]),
+            "row": member_row,
+            "value": values[member_row],
+        }
+    ).sort_values(["duid", "bucket", "row"], kind="stable")
+
+    grouped = members.groupby(["duid", "bucket"]).value
+    closing = pd.Series(rows[closes], index=pd.MultiIndex.from_arrays([duid_codes[closes], closed[closes]]))
+
+    # buckets still open at the end have no closing reading
+    buckets = pd.DataFrame(
+        {
+            "count": grouped.count(),
+            "total": grouped.sum(),
+            "first": grouped.first(),
+            "last": grouped.last(),
+            "closed_at": closing,
+        }
+    ).dropna(subset=["closed_at"])
+
+    closed_at = buckets.closed_at.to_numpy(dtype=int)
+    buckets = buckets[bucket_stop[closed_at] >= 0]
+    buckets = buckets.iloc[np.argsort(buckets.closed_at.to_numpy(dtype=int), kind="stable")]
+    closed_at = buckets.closed_at.to_numpy(dtype=int)
+
+    energy_df = pd.DataFrame(
+        {
+            "trading_interval": intervals[bucket_stop[closed_at]],
+            "network_id": network_ids[closed_at],
+            "facility_code": duids[closed_at],
+            "eoi_quantity": _trapezium_integration_variable(
+                *(buckets[c].to_numpy() for c in ["count", "total", "first", "last"])
+            ),
+        }
+    )
 
-    return pd.DataFrame(values, columns=["trading_interval", "network_id", "facility_code", "eoi_quantity"])
+    return energy_df[columns]
 
 
 def shape_energy_dataframe(gen_series: list[dict], network: NetworkSchema = NetworkNEM) -> pd.DataFrame:
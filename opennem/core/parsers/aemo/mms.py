@@ -5,15 +5,17 @@ Parse AEMO MMS CSV format which can have multiple tables and definitions per CSV
 
 import csv
 import logging
+import mmap
+from collections.abc import Generator, Iterable
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, NamedTuple
 
 from pydantic import BaseModel, Field, validator
 from pydantic.error_wrappers import ValidationError
 from pydantic.fields import PrivateAttr
 
-from opennem.core.downloader import url_downloader
+from opennem.core.downloader import url_stream_downloader
 from opennem.core.normalizers import normalize_duid
 from opennem.schema.aemo.mms import MMSBaseClass, get_mms_schema_for_table
 from opennem.schema.core import BaseConfig
@@ -24,8 +26,11 @@ from opennem.utils.version import get_version
 _HAVE_PANDAS = False
 
 try:
+    import numpy as np
     import pandas as pd
 
+    from opennem.core.parsers.aemo.mms_validators import compile_mms_validator
+
     _HAVE_PANDAS = True
 except ImportError:
     pass
@@ -33,6 +38,13 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# number of buffered rows converted into column arrays at a time for columnar tables
+MMS_COLUMNAR_CHUNK_SIZE = 50_000
+
+
+class AEMOParserException(Exception):
+    pass
+
 
 # pylint: disable=no-self-argument
 class AEMOTableSchema(BaseConfig):
@@ -44,6 +56,11 @@ class AEMOTableSchema(BaseConfig):
     # optionally it has a schema
     _record_schema: MMSBaseClass | None = PrivateAttr()
 
+    # columnar tables hold records as chunks of arrays per field rather than a list of rows
+    columnar: bool = False
+    _column_chunks: dict[str, list[Any]] = PrivateAttr(default_factory=dict)
+    _column_buffer: list[list[Any]] = PrivateAttr(default_factory=list)
+
     # the url this table was taken from if any
     url_source: str | None = None
 
@@ -55,6 +72,16 @@ class AEMOTableSchema(BaseConfig):
     def full_name(self) -> str:
         return f"{self.namespace}_{self.name}"
 
+    @property
+    def record_count(self) -> int:
+        """Number of records in the table for either storage backend"""
+        if not self.columnar:
+            return len(self.records)
+
+        first_chunks = self._column_chunks.get(self.fieldnames[0], []) if self.fieldnames else []
+
+        return sum(len(c) for c in first_chunks) + len(self._column_buffer)
+
     @property
     def primary_key(self) -> list[str] | None:
         if (
@@ -87,12 +114,38 @@ class AEMOTableSchema(BaseConfig):
 
         return _fieldnames
 
+    @property
+    def has_schema(self) -> bool:
+        return bool(getattr(self, "_record_schema", None)) and not self.columnar
+
     def set_schema(self, schema: MMSBaseClass) -> bool:
         self._record_schema = schema
 
         return True
 
+    def add_validated_rows(self, rows: list[list[Any]]) -> int:
+        """Validates a block of D row values against the table schema a column at a time
+        and adds the records that pass. Returns the number of rows rejected"""
+        if not rows:
+            return 0
+
+        validator = compile_mms_validator(self._record_schema)  # type: ignore
+        result = validator.validate_columns(convert_mms_object_columns(self.fieldnames, rows), len(rows))
+
+        self.records.extend(validator.build_records(result))
+
+        return len(result.failed_rows)
+
     def add_record(self, record: dict | MMSBaseClass, values_only: bool = False) -> bool:
+        if self.columnar:
+            # @NOTE schema validation is skipped for columnar tables
+            self._column_buffer.append(list(record.values()) if isinstance(record, dict) else record)  # type: ignore
+
+            if len(self._column_buffer) >= MMS_COLUMNAR_CHUNK_SIZE:
+                self._flush_columns()
+
+            return True
+
         if isinstance(record, dict) and hasattr(self, "_record_schema") and self._record_schema:
             _record = None
 
@@ -134,14 +187,88 @@ class AEMOTableSchema(BaseConfig):
 
         return True
 
+    def _flush_columns(self) -> None:
+        """Converts the buffered rows into one array chunk per field"""
+        if not self._column_buffer:
+            return None
+
+        if not _HAVE_PANDAS:
+            raise AEMOParserException("Columnar tables require numpy")
+
+        for fieldname, column_chunk in convert_mms_columns(self.fieldnames, self._column_buffer).items():
+            self._column_chunks.setdefault(fieldname, []).append(column_chunk)
+
+        self._column_buffer = []
+
+    def get_column(self, fieldname: str) -> Any:
+        """Return a single array for a field in a columnar table. Chunks are joined once and kept"""
+        if not self.columnar:
+            raise AEMOParserException(f"Table {self.full_name} is not columnar")
+
+        self._flush_columns()
+
+        chunks = self._column_chunks.get(fieldname)
+
+        if not chunks:
+            return np.empty(0, dtype=object)
+
+        if len(chunks) > 1 and isinstance(chunks[0], pd.Index):
+            self._column_chunks[fieldname] = [chunks[0].append(chunks[1:])]
+        elif len(chunks) > 1:
+            self._column_chunks[fieldname] = [np.concatenate(chunks)]
+
+        return self._column_chunks[fieldname][0]
+
+    def merge_columns(self, table: "AEMOTableSchema") -> None:
+        """Appends the column chunks of another columnar table with the same fields"""
+        table._flush_columns()
+        self._flush_columns()
+
+        for fieldname in self.fieldnames:
+            self._column_chunks.setdefault(fieldname, []).extend(table._column_chunks.get(fieldname, []))
+
+    def extend_records(self, table: "AEMOTableSchema", values_only: bool = False) -> None:
+        """Bulk merge the records of another table of the same name into this one. Records
+        were validated when they were added to the other table so they are not validated again"""
+        if self.columnar and table.columnar:
+            self.merge_columns(table)
+
+        elif self.columnar:
+            for record in table.records:
+                self.add_record(record)  # type: ignore
+
+        elif table.columnar:
+            if values_only:
+                self.records.extend([list(r.values()) for r in table.iter_records()])
+            else:
+                self.records.extend(table.iter_records())
+
+        else:
+            self.records.extend(table.records)
+
+    def iter_records(self) -> Generator[dict[str, Any], None, None]:
+        """Iterate the table as dict records for either storage backend"""
+        if not self.columnar:
+            yield from self.records  # type: ignore
+            return None
+
+        columns = [self.get_column(f) for f in self.fieldnames]
+
+        for values in zip(*columns, strict=True):
+            yield dict(zip(self.fieldnames, values, strict=True))
+
     def to_frame(self) -> Any:
-        """Return a pandas dataframe for the table"""
+        """Return a pandas dataframe for the table. Columnar tables wrap their
+        arrays directly rather than building the frame from rows"""
         if not _HAVE_PANDAS:
             return None
 
         _index_keys = []
 
-        _df = pd.DataFrame(self.records)
+        if self.columnar:
+            _df = pd.DataFrame({f: self.get_column(f) for f in self.fieldnames}, copy=False)
+        else:
+            _df = pd.DataFrame(self.records)
 
         if hasattr(self, "_record_schema") and self._record_schema:
             if hasattr(self._record_schema, "_primary_keys"):
@@ -177,6 +304,14 @@ class AEMOTableSet(BaseModel):
     generated: datetime = datetime.now()
     tables: list[AEMOTableSchema] = []
 
+    # table lookups by full name and by name - kept in sync by add_table
+    _table_index: dict[str, AEMOTableSchema] = PrivateAttr(default_factory=dict)
+    _table_name_index: dict[str, AEMOTableSchema] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, **data: Any) -> None:
+        super().__init__(**data)
+        self._reindex()
+
     @property
     def table_names(self) -> list[str]:
         _names: list[str] = []
@@ -186,69 +321,327 @@ class AEMOTableSet(BaseModel):
 
         return _names
 
-    def has_table(self, table_name: str) -> bool:
-        found_table: bool = False
-
-        if not self.tables:
-            return False
-
-        if len(self.tables) < 1:
-            return False
+    def _reindex(self) -> None:
+        """Rebuild the lookup indexes from the table list"""
+        self._table_index = {}
+        self._table_name_index = {}
 
-        table_lookup = list(filter(lambda t: t.full_name == table_name, self.tables))
+        for table in self.tables:
+            self._index_table(table)
 
-        if len(table_lookup) > 0:
-            return True
+    def _index_table(self, table: AEMOTableSchema) -> None:
+        self._table_index[table.full_name] = table
 
-        # if not found search by name only
-        # @NOTE this might lead to bugs
-        table_lookup = list(filter(lambda t: t.name == table_name, self.tables))
+        # by name lookups return the last table added with that name
+        self._table_name_index[table.name] = table
 
-        if len(table_lookup) > 0:
-            return True
-
-        return found_table
+    def has_table(self, table_name: str) -> bool:
+        return self.get_table(table_name) is not None
 
     def add_table(self, table: AEMOTableSchema, values_only: bool = False) -> bool:
         _existing_table = self.get_table(table.full_name)
 
+        # the table is already in the set so merging it would duplicate its records
+        if _existing_table is table:
+            return True
+
         if _existing_table:
-            for r in table.records:
-                _existing_table.add_record(r, values_only=values_only)
+            _existing_table.extend_records(table, values_only=values_only)
         else:
             self.tables.append(table)
+            self._index_table(table)
 
         return True
 
     def get_table(self, table_name: str) -> AEMOTableSchema | None:
-        if not self.has_table(table_name):
+        if not self.tables:
             return None
 
-        table_lookup = list(filter(lambda t: t.full_name == table_name, self.tables))
+        # tables appended to the list directly are picked up here
+        if len(self._table_index) != len(self.tables):
+            self._reindex()
 
-        if table_lookup:
-            return table_lookup.pop()
+        if table_name in self._table_index:
+            return self._table_index[table_name]
 
-        table_lookup = list(filter(lambda t: t.name == table_name, self.tables))
-
-        if table_lookup:
-            return table_lookup.pop()
+        # if not found search by name only
+        # @NOTE this might lead to bugs
+        if table_name in self._table_name_index:
+            return self._table_name_index[table_name]
 
         logger.debug("Looking up table: {} amongst ({})".format(table_name, ", ".join([i.name for i in self.tables])))
 
         return None
 
 
-class AEMOParserException(Exception):
-    pass
-
-
 AEMO_ROW_HEADER_TYPES = ["C", "I", "D"]
 
 MMS_DATE_FIELDS = ["settlementdate", "tradinginterval", "lastchanged", "interval_datetime"]
 
 MMS_DUID_FIELDS = ["duid"]
 
+# number of records yielded per batch by the streaming parser
+MMS_STREAM_BATCH_SIZE = 10_000
+
+# AEMO date format in MMS files - used for the fast path in the column converter
+MMS_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+# maps table full names to the columns to keep when parsing. None keeps all the columns
+AEMOTableProjection = dict[str, list[str] | None]
+
+
+class AEMOTableBatch(NamedTuple):
+    """A batch of parsed records for a single table yielded by the streaming parser"""
+
+    table_name: str
+    fieldnames: list[str]
+    records: list[dict[str, Any]]
+
+
+def _parse_mms_record(fieldnames: list[str], values: list[str]) -> dict[str, Any]:
+    """Zip a D row into a record and parse the date and DUID fields per cell
+
+    @NOTE this is the slow path used when pandas isn't available - see convert_mms_columns
+    """
+    record = dict(zip(fieldnames, values, strict=True))
+
+    for field, fieldvalue in record.items():
+        if field in MMS_DATE_FIELDS:
+            fieldvalue_parsed = parse_date(fieldvalue, network=NetworkNEM)
+            record[field] = fieldvalue_parsed
+
+        if field in MMS_DUID_FIELDS:
+            fieldvalue_parsed = normalize_duid(fieldvalue)
+            record[field] = fieldvalue_parsed
+
+    return record
+
+
+def _parse_mms_date_value(value: Any) -> datetime | None:
+    """Generic date parse for values not in the AEMO format. Returns a naive datetime in NEM time"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+
+    try:
+        dt = parse_date(value, network=NetworkNEM)
+    except ValueError:
+        logger.warning(f"Could not parse MMS date value: {value}")
+        return None
+
+    if not dt:
+        return None
+
+    return dt.replace(tzinfo=None)
+
+
+def convert_mms_date_column(values: Any) -> Any:
+    """Converts a column of MMS date strings into a tz-aware DatetimeIndex in NEM time
+
+    Values are factorized first so each distinct date is only parsed once and the
+    AEMO fixed format is parsed in a single vectorized call. Anything that doesn't
+    match the format falls back to parse_date. Missing values are NaT"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+    # last slot is NaT for missing values which factorize codes as -1
+    parsed = np.full(len(uniques) + 1, np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    uniques_str = np.array([isinstance(u, str) for u in uniques], dtype=bool)
+
+    if uniques_str.any():
+        parsed[:-1][uniques_str] = pd.to_datetime(uniques[uniques_str], format=MMS_DATE_FORMAT, errors="coerce").to_numpy()
+
+    for i in np.flatnonzero(np.isnat(parsed[:-1])):
+        dt = _parse_mms_date_value(uniques[i])
+
+        if dt:
+            parsed[i] = np.datetime64(dt)
+
+    return pd.DatetimeIndex(parsed[codes]).tz_localize(NetworkNEM.get_fixed_offset())
+
+
+def convert_mms_duid_column(values: Any) -> Any:
+    """Normalizes a column of DUIDs. DUIDs repeat heavily so each distinct value is normalized once"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+    # last slot is None for missing values which factorize codes as -1
+    normalized = np.empty(len(uniques) + 1, dtype=object)
+    normalized[:-1] = [normalize_duid(u) for u in uniques]
+    normalized[-1] = None
+
+    return normalized[codes]
+
+
+def convert_mms_columns(fieldnames: list[str], rows: list[list[Any]]) -> dict[str, Any]:
+    """Transposes a block of D row values into columns and converts the date
+    and DUID fields a whole column at a time"""
+    columns: dict[str, Any] = {}
+
+    if not rows:
+        return {f: np.empty(0, dtype=object) for f in fieldnames}
+
+    for fieldname, column_values in zip(fieldnames, zip(*rows, strict=True), strict=True):
+        if fieldname in MMS_DATE_FIELDS:
+            columns[fieldname] = convert_mms_date_column(column_values)
+        elif fieldname in MMS_DUID_FIELDS:
+            columns[fieldname] = convert_mms_duid_column(column_values)
+        else:
+            column = np.empty(len(column_values), dtype=object)
+            column[:] = column_values
+            columns[fieldname] = column
+
+    return columns
+
+
+def convert_mms_object_columns(fieldnames: list[str], rows: list[list[Any]]) -> dict[str, Any]:
+    """Converts a block of D row values into object columns holding python values"""
+    columns = convert_mms_columns(fieldnames, rows)
+
+    for fieldname, column in columns.items():
+        if isinstance(column, pd.DatetimeIndex):
+            column_dt = np.empty(len(column), dtype=object)
+            column_dt[:] = column.to_pydatetime()
+            column_dt[column.isna()] = None
+            columns[fieldname] = column_dt
+
+    return columns
+
+
+def convert_mms_rows(fieldnames: list[str], rows: list[list[Any]]) -> list[dict[str, Any]]:
+    """Converts a block of D row values into parsed records using the column converters"""
+    if not _HAVE_PANDAS:
+        return [_parse_mms_record(fieldnames, values) for values in rows]
+
+    if not rows:
+        return []
+
+    columns = convert_mms_object_columns(fieldnames, rows)
+    column_values = [columns[fieldname].tolist() for fieldname in fieldnames]
+
+    return [dict(zip(fieldnames, values, strict=True)) for values in zip(*column_values, strict=True)]
+
+
+def _project_lines(lines: Iterable[str], projection: AEMOTableProjection) -> Generator[str, None, None]:
+    """Drops the D rows of tables not in the projection before they reach the csv reader"""
+    keep_table = True
+
+    for line in lines:
+        record_type = line[:1].upper()
+
+        if record_type == "D" and not keep_table:
+            continue
+
+        if record_type == "I":
+            row = next(csv.reader([line]))
+            keep_table = len(row) > 2 and f"{row[1]}_{row[2]}".strip().lower() in projection
+
+        yield line
+
+
+def _project_table_fields(
+    table_name: str, table_fields: list[str], projection: AEMOTableProjection | None
+) -> tuple[list[str], list[int] | None]:
+    """Returns the fieldnames to keep for a table and their indexes in the D rows. Indexes are None
+    when all the columns are kept"""
+    if not projection or not projection.get(table_name):
+        return table_fields, None
+
+    keep_columns = projection[table_name] or []
+    column_index = [i for i, f in enumerate(table_fields) if f in keep_columns]
+
+    return [table_fields[i] for i in column_index], column_index
+
+
+def _projection_tables(projection: AEMOTableProjection | None) -> AEMOTableProjection | None:
+    """Table only version of a projection for rows that already had their columns projected"""
+    if projection is None:
+        return None
+
+    return dict.fromkeys(projection)
+
+
+def _split_mms_byte_line(line: bytes, encoding: str) -> list[bytes] | None:
+    """Splits a line on commas and strips the quotes AEMO puts around dates. Returns None
+    for lines with quoted commas or escaped quotes which need the csv module"""
+    fields = line.rstrip(b"\r\n").split(b",")
+
+    if b'"' not in line:
+        return fields
+
+    if b'""' in line:
+        return None
+
+    for i, field in enumerate(fields):
+        if field[:1] == b'"':
+            if len(field) < 2 or field[-1:] != b'"':
+                return None
+
+            fields[i] = field[1:-1]
+
+    return fields
+
+
+def iter_aemo_byte_rows(
+    lines: Iterable[bytes], projection: AEMOTableProjection | None = None, encoding: str = "utf-8"
+) -> Generator[list[str], None, None]:
+    """Tokenizes MMS rows straight from lines of bytes
+
+    D rows of tables outside the projection are skipped without being split or decoded,
+    and for kept tables only the projected columns are decoded. I rows of kept tables are
+    yielded with the projected fieldnames so the rows that come out are already projected"""
+    keep_table = True
+    row_length = 0
+    column_index: list[int] | None = None
+
+    for line in lines:
+        record_type = line[:1].upper()
+
+        if record_type == b"D" and not keep_table:
+            continue
+
+        fields: list[bytes] | list[str] | None = _split_mms_byte_line(line, encoding)
+
+        # quoted commas and escaped quotes go through the csv module
+        if fields is None:
+            fields = next(csv.reader([line.decode(encoding)]), [])
+
+        if not fields:
+            continue
+
+        if record_type == b"D" and column_index is not None:
+            if len(fields) - 4 != row_length:
+                logger.error("Malformed AEMO csv - length mismatch between records and fields")
+                continue
+
+            fields = fields[:4] + [fields[4 + i] for i in column_index]  # type: ignore
+
+        row = [f.decode(encoding) if isinstance(f, bytes) else f for f in fields]
+
+        if record_type == b"I":
+            table_name = f"{row[1]}_{row[2]}".strip().lower() if len(row) > 2 else ""
+            keep_table = projection is None or table_name in projection
+
+            table_fields = [i.lower() for i in row[4:]]
+            row_length = len(table_fields)
+            column_index = None
+
+            if keep_table and projection:
+                projected_fields, column_index = _project_table_fields(table_name, table_fields, projection)
+                row = row[:4] + projected_fields
+
+        yield row
+
+
+def _iter_aemo_file_rows(
+    file_path: Path, projection: AEMOTableProjection | None = None, encoding: str = "utf-8"
+) -> Generator[list[str], None, None]:
+    """Memory maps a local file and tokenizes its rows from bytes so the file is never read into a str"""
+    if file_path.stat().st_size == 0:
+        return None
+
+    with file_path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from iter_aemo_byte_rows(iter(mm.readline, b""), projection=projection, encoding=encoding)
+
 
 def parse_aemo_mms_csv(
     content: str,
@@ -258,25 +651,82 @@ def parse_aemo_mms_csv(
     skip_records: bool = False,
     url: str | None = None,
     values_only: bool = False,
+    columnar: bool = False,
+    projection: AEMOTableProjection | None = None,
 ) -> AEMOTableSet:
     """
     Parse AEMO CSV's into schemas and return a table set
 
+    With columnar set the tables store their records as numpy arrays per field
+    which are wrapped by to_frame() rather than lists of row dicts
+
+    A projection limits parsing to the tables it names and, for each, to the listed columns.
+    D rows of other tables are skipped before they are split
+
+    Record values are buffered per table and the date and DUID fields are converted
+    a column at a time when the table is flushed
+
     Exception raised on error and logs malformed CSVs
     """
 
-    if not table_set:
-        table_set = AEMOTableSet()
+    content_split: Iterable[str] = content.splitlines()
 
-    content_split = content.splitlines()
+    if projection is not None:
+        content_split = _project_lines(content_split, projection)
 
     # @NOTE more efficient csv parsing
     datacsv = csv.reader(content_split)
 
+    return _parse_aemo_mms_rows(
+        datacsv,
+        table_set=table_set,
+        namespace_filter=namespace_filter,
+        parse_table_schemas=parse_table_schemas,
+        skip_records=skip_records,
+        url=url,
+        values_only=values_only,
+        columnar=columnar,
+        projection=projection,
+    )
+
+
+def _parse_aemo_mms_rows(
+    rows: Iterable[list[str]],
+    table_set: AEMOTableSet | None = None,
+    namespace_filter: list[str] | None = None,
+    parse_table_schemas: bool = False,
+    skip_records: bool = False,
+    url: str | None = None,
+    values_only: bool = False,
+    columnar: bool = False,
+    projection: AEMOTableProjection | None = None,
+) -> AEMOTableSet:
+    """Builds a table set from split MMS rows. Shared by the str and bytes parse paths"""
+    if not table_set:
+        table_set = AEMOTableSet()
+
     # init all the parser vars
     table_current = None
+    table_rows: list[list[str]] = []
+    table_row_length = 0
+    column_index: list[int] | None = None
+
+    def _flush_table() -> None:
+        if not table_current:
+            return None
+
+        # columnar tables buffer raw values and convert on their own flush
+        if table_current.has_schema and not values_only and _HAVE_PANDAS:
+            table_current.add_validated_rows(table_rows)
+        elif not table_current.columnar:
+            for record in convert_mms_rows(table_current.fieldnames, table_rows):
+                table_current.add_record(record, values_only=values_only)
+
+        table_rows.clear()
+
+        table_set.add_table(table_current, values_only=values_only)  # type: ignore
 
-    for row in datacsv:
+    for row in rows:
         if not row or type(row) is not list or len(row) < 1:
             continue
 
@@ -291,28 +741,36 @@ def parse_aemo_mms_csv(
         match record_type:
             case "C":
                 # @TODO csv meta stored in table
-                if table_current:
-                    table_set.add_table(table_current, values_only=values_only)
+                _flush_table()
+                table_current = None
 
             # new table
             case "I":
-                if table_current:
-                    table_set.add_table(table_current, values_only=values_only)
+                _flush_table()
 
                 table_namespace = row[1]
                 table_name = row[2]
                 table_fields = [i.lower() for i in row[4:]]
+                table_full_name = f"{table_namespace}_{table_name}".strip().lower()
 
                 if namespace_filter and table_namespace.lower() not in namespace_filter:
                     table_current = None
                     continue
 
+                if projection is not None and table_full_name not in projection:
+                    table_current = None
+                    continue
+
+                table_row_length = len(table_fields)
+                table_fields, column_index = _project_table_fields(table_full_name, table_fields, projection)
+
                 table_current = AEMOTableSchema(
                     name=table_name,
                     namespace=table_namespace,
                     fields=table_fields,
                     fieldnames=table_fields,
                     url_source=url,
+                    columnar=columnar,
                 )
 
                 # do we have a custom shema for the table?
@@ -333,22 +791,17 @@ def parse_aemo_mms_csv(
 
                 values = row[4:]
 
-                if len(values) != len(table_current.fieldnames):
+                if len(values) != table_row_length:
                     logger.error("Malformed AEMO csv - length mismatch between records and fields")
                     continue
 
-                record = dict(zip(table_current.fieldnames, values, strict=True))
+                if column_index is not None:
+                    values = [values[i] for i in column_index]
 
-                for field, fieldvalue in record.items():
-                    if field in MMS_DATE_FIELDS:
-                        fieldvalue_parsed = parse_date(fieldvalue, network=NetworkNEM)
-                        record[field] = fieldvalue_parsed
-
-                    if field in MMS_DUID_FIELDS:
-                        fieldvalue_parsed = normalize_duid(fieldvalue)
-                        record[field] = fieldvalue_parsed
-
-                table_current.add_record(record, values_only=values_only)
+                if table_current.columnar:
+                    table_current.add_record(values)  # type: ignore
+                else:
+                    table_rows.append(values)
 
             case _:
                 logger.error(f"Invalid AEMO record type: {record_type}")
@@ -356,30 +809,135 @@ def parse_aemo_mms_csv(
     return table_set
 
 
+def parse_aemo_mms_csv_stream(
+    stream: IO[bytes],
+    batch_size: int = MMS_STREAM_BATCH_SIZE,
+    namespace_filter: list[str] | None = None,
+    encoding: str = "utf-8",
+    projection: AEMOTableProjection | None = None,
+) -> Generator[AEMOTableBatch, None, None]:
+    """
+    Streaming version of parse_aemo_mms_csv. Reads rows lazily from a byte stream (file handle
+    or zip member) and yields batches of at most batch_size records per table as
+    (table_name, fieldnames, records) so that memory tracks the batch size rather than the file size
+
+    Takes a projection of tables and columns to keep like parse_aemo_mms_csv
+
+    Batches are flushed when they fill up, when a new table starts and at the end of the stream
+    """
+    rows = iter_aemo_byte_rows(iter(stream.readline, b""), projection=projection, encoding=encoding)
+
+    yield from _stream_aemo_mms_rows(
+        rows, batch_size=batch_size, namespace_filter=namespace_filter, projection=_projection_tables(projection)
+    )
+
+
+def _stream_aemo_mms_rows(
+    rows: Iterable[list[str]],
+    batch_size: int = MMS_STREAM_BATCH_SIZE,
+    namespace_filter: list[str] | None = None,
+    projection: AEMOTableProjection | None = None,
+) -> Generator[AEMOTableBatch, None, None]:
+    """Yields record batches from split MMS rows"""
+    if batch_size < 1:
+        raise AEMOParserException(f"Invalid batch size: {batch_size}")
+
+    table_name: str | None = None
+    table_fields: list[str] = []
+    table_row_length = 0
+    column_index: list[int] | None = None
+    batch: list[list[str]] = []
+
+    for row in rows:
+        if not row:
+            continue
+
+        record_type = row[0].strip().upper()
+
+        match record_type:
+            case "C":
+                if table_name and batch:
+                    yield AEMOTableBatch(table_name, table_fields, convert_mms_rows(table_fields, batch))
+
+                table_name = None
+                batch = []
+
+            case "I":
+                if table_name and batch:
+                    yield AEMOTableBatch(table_name, table_fields, convert_mms_rows(table_fields, batch))
+
+                batch = []
+                table_namespace = row[1].strip().lower()
+                table_fields = [i.lower() for i in row[4:]]
+
+                table_name = f"{table_namespace}_{row[2].strip().lower()}"
+
+                if namespace_filter and table_namespace not in namespace_filter:
+                    table_name = None
+                    continue
+
+                if projection is not None and table_name not in projection:
+                    table_name = None
+                    continue
+
+                table_row_length = len(table_fields)
+                table_fields, column_index = _project_table_fields(table_name, table_fields, projection)
+
+            case "D":
+                if not table_name:
+                    continue
+
+                values = row[4:]
+
+                if len(values) != table_row_length:
+                    logger.error("Malformed AEMO csv - length mismatch between records and fields")
+                    continue
+
+                if column_index is not None:
+                    values = [values[i] for i in column_index]
+
+                batch.append(values)
+
+                if len(batch) >= batch_size:
+                    yield AEMOTableBatch(table_name, table_fields, convert_mms_rows(table_fields, batch))
+                    batch = []
+
+            case _:
+                logger.info(f"Skipping row, invalid type: {record_type}")
+
+    if table_name and batch:
+        yield AEMOTableBatch(table_name, table_fields, convert_mms_rows(table_fields, batch))
+
+
 def parse_aemo_url(
-    url: str, table_set: AEMOTableSet | None = None, skip_records: bool = False, values_only: bool = False
+    url: str,
+    table_set: AEMOTableSet | None = None,
+    skip_records: bool = False,
+    values_only: bool = False,
+    columnar: bool = False,
+    projection: AEMOTableProjection | None = None,
 ) -> AEMOTableSet:
-    """Parse a single AEMO URL into an AEMOTableSet"""
+    """Parse a single AEMO URL into an AEMOTableSet. The download is streamed and tokenized from
+    bytes as it arrives so the decompressed file is never held in memory as a whole"""
 
     if not table_set:
         table_set = AEMOTableSet()
 
-    try:
-        csv_content = url_downloader(url)
-    except Exception as e:
-        raise Exception(f"Could not fetch AEMO url {url}: {e}") from None
-
-    if not csv_content:
-        raise Exception(f"Could not parse URL: {url}")
-
-    csv_content_decoded = csv_content.decode("utf-8")
-    table_set = parse_aemo_mms_csv(csv_content_decoded, table_set, skip_records=skip_records, url=url, values_only=values_only)
+    table_set = _parse_aemo_mms_rows(
+        iter_aemo_byte_rows(_iter_url_lines(url), projection=projection),
+        table_set,
+        skip_records=skip_records,
+        url=url,
+        values_only=values_only,
+        columnar=columnar,
+        projection=_projection_tables(projection),
+    )
 
     # Count number of records
     total_records = 0
 
     for table in table_set.tables:
-        total_records += len(table.records)
+        total_records += table.record_count
 
     logger.info(f"Parsed {total_records} records")
 
@@ -404,8 +962,15 @@ def parse_aemo_urls(urls: list[str], skip_records: bool = False, values_only: bo
     return aemo
 
 
-def parse_aemo_file(file: str, table_set: AEMOTableSet | None = None, values_only: bool = False) -> AEMOTableSet:
-    """Parses a local AEMO file"""
+def parse_aemo_file(
+    file: str,
+    table_set: AEMOTableSet | None = None,
+    values_only: bool = False,
+    columnar: bool = False,
+    projection: AEMOTableProjection | None = None,
+) -> AEMOTableSet:
+    """Parses a local AEMO file. The file is memory mapped and tokenized from bytes rather
+    than read into memory"""
     if not table_set:
         table_set = AEMOTableSet()
 
@@ -417,12 +982,71 @@ def parse_aemo_file(file: str, table_set: AEMOTableSet | None = None, values_onl
     if file_path.suffix.lower() not in [".csv"]:
         raise Exception(f"Not a CSV file {file_path}")
 
-    with file_path.open() as fh:
-        table_set = parse_aemo_mms_csv(fh.read(), table_set=table_set, values_only=values_only)
+    table_set = _parse_aemo_mms_rows(
+        _iter_aemo_file_rows(file_path, projection=projection),
+        table_set=table_set,
+        values_only=values_only,
+        columnar=columnar,
+        projection=_projection_tables(projection),
+    )
 
     return table_set
 
 
+def stream_aemo_file(
+    file: str, batch_size: int = MMS_STREAM_BATCH_SIZE, projection: AEMOTableProjection | None = None
+) -> Generator[AEMOTableBatch, None, None]:
+    """Streams a local AEMO file as record batches from a memory map of the file"""
+    file_path = Path(file)
+
+    if not file_path.is_file():
+        raise Exception(f"Not a file {file_path}")
+
+    if file_path.suffix.lower() not in [".csv"]:
+        raise Exception(f"Not a CSV file {file_path}")
+
+    yield from _stream_aemo_mms_rows(
+        _iter_aemo_file_rows(file_path, projection=projection),
+        batch_size=batch_size,
+        projection=_projection_tables(projection),
+    )
+
+
+def _iter_chunk_lines(chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """Splits a stream of byte chunks into lines"""
+    pending = b""
+
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+
+        for line in lines:
+            yield line + b"\n"
+
+    if pending:
+        yield pending
+
+
+def _iter_url_lines(url: str) -> Generator[bytes, None, None]:
+    """Lines of a streamed AEMO url. Download errors are raised with the url"""
+    try:
+        yield from _iter_chunk_lines(url_stream_downloader(url))
+    except Exception as e:
+        raise Exception(f"Could not fetch AEMO url {url}: {e}") from None
+
+
+def stream_aemo_url(
+    url: str, batch_size: int = MMS_STREAM_BATCH_SIZE, projection: AEMOTableProjection | None = None
+) -> Generator[AEMOTableBatch, None, None]:
+    """Streams an AEMO url as record batches while it downloads. Zipped and nested zipped
+    files are decompressed on the fly so nothing is held beyond the current batch"""
+    yield from _stream_aemo_mms_rows(
+        iter_aemo_byte_rows(_iter_url_lines(url), projection=projection),
+        batch_size=batch_size,
+        projection=_projection_tables(projection),
+    )
+
+
 def parse_aemo_directory(directory_path: str) -> AEMOTableSet | None:
     """Parse an entire AEMO directory"""
     return None
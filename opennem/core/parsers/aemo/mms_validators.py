@@ -0,0 +1,177 @@
+"""
+Compiled validators for MMS table schemas
+
+A validator is built once per schema from its field definitions and primary keys and
+validates and coerces whole columns of a table at a time rather than constructing a
+pydantic model per row. It accepts and rejects the same rows as the per row path.
+"""
+import dataclasses
+import logging
+from functools import cache
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from pydantic.fields import ModelField
+
+from opennem.schema.aemo.mms import MMSBaseClass
+
+logger = logging.getLogger("opennem.core.parsers.aemo.mms_validators")
+
+# field types that can be coerced as a whole column by numpy. numpy calls the python
+# builtin on each element so it accepts and rejects exactly what pydantic does
+_NUMPY_COERCE_TYPES: dict[type, Any] = {float: np.float64, int: np.int64}
+
+
+class MMSColumnValidationResult(BaseModel):
+    """Coerced columns for a batch along with the indices of the rows that failed"""
+
+    columns: dict[str, Any]
+    failed_rows: list[int]
+    row_count: int
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def valid_rows(self) -> Any:
+        mask = np.ones(self.row_count, dtype=bool)
+        mask[self.failed_rows] = False
+
+        return np.flatnonzero(mask)
+
+
+class MMSSchemaValidator:
+    """Column validator compiled from an MMS schema"""
+
+    def __init__(self, schema: type[BaseModel] | type[MMSBaseClass]) -> None:
+        self.schema = schema
+        self.primary_keys: list[str] = list(getattr(schema, "_primary_keys", None) or [])
+        self.is_dataclass = dataclasses.is_dataclass(schema)
+
+        self.fields: dict[str, ModelField] = {}
+        self.init_fieldnames: set[str] = set()
+
+        if self.is_dataclass:
+            self.init_fieldnames = {f.name for f in dataclasses.fields(schema) if f.init}  # type: ignore
+        else:
+            self.fields = dict(schema.__fields__)  # type: ignore
+
+        # fields with no validators beyond their type can be coerced by numpy in one call
+        self.numpy_fields: dict[str, Any] = {
+            name: _NUMPY_COERCE_TYPES[field.outer_type_]
+            for name, field in self.fields.items()
+            if field.outer_type_ in _NUMPY_COERCE_TYPES and not field.class_validators and not field.allow_none
+        }
+
+        # validate primary keys first so a batch with bad keys fails early
+        self.field_order = [k for k in self.primary_keys if k in self.fields] + [
+            k for k in self.fields if k not in self.primary_keys
+        ]
+
+    def _validate_value(self, field: ModelField, value: Any) -> tuple[Any, bool]:
+        try:
+            validated, errors = field.validate(value, {}, loc=field.name, cls=self.schema)  # type: ignore
+        except Exception:
+            # the per row path rejects a record on any error
+            return None, False
+
+        return validated, errors is None
+
+    def _validate_column(self, field: ModelField, column: Any) -> tuple[Any, Any]:
+        """Validates a column once per distinct value and returns the coerced column and a failure mask"""
+        coerce_type = self.numpy_fields.get(field.name)
+
+        if coerce_type is not None:
+            try:
+                return column.astype(coerce_type), np.zeros(len(column), dtype=bool)
+            except (TypeError, ValueError, OverflowError):
+                # fall through to find which rows failed
+                pass
+
+        codes, uniques = pd.factorize(column)
+
+        coerced = np.empty(len(uniques), dtype=object)
+        valid = np.empty(len(uniques), dtype=bool)
+
+        for i, unique_value in enumerate(uniques):
+            coerced[i], valid[i] = self._validate_value(field, unique_value)
+
+        coerced_column = np.empty(len(column), dtype=object)
+        failed = np.zeros(len(column), dtype=bool)
+
+        present = codes >= 0
+        coerced_column[present] = coerced[codes[present]]
+        failed[present] = ~valid[codes[present]]
+
+        # @NOTE missing values are validated individually as None and NaN validate differently
+        for row_index in np.flatnonzero(~present):
+            coerced_column[row_index], is_valid = self._validate_value(field, column[row_index])
+            failed[row_index] = not is_valid
+
+        return coerced_column, failed
+
+    def validate_columns(self, columns: dict[str, Any], row_count: int) -> MMSColumnValidationResult:
+        """Validates and coerces a batch of columns keyed by lower case field name"""
+        failed = np.zeros(row_count, dtype=bool)
+        coerced: dict[str, Any] = {}
+
+        if self.is_dataclass:
+            # dataclass schemas are not type checked and only reject unknown fields
+            if not set(columns.keys()).issubset(self.init_fieldnames):
+                failed[:] = True
+
+            return MMSColumnValidationResult(
+                columns=dict(columns), failed_rows=np.flatnonzero(failed).tolist(), row_count=row_count
+            )
+
+        for fieldname in self.field_order:
+            field = self.fields[fieldname]
+
+            if fieldname not in columns:
+                if field.required:
+                    failed[:] = True
+
+                continue
+
+            column = columns[fieldname]
+
+            if not isinstance(column, np.ndarray):
+                column = np.asarray(column, dtype=object)
+
+            coerced[fieldname], column_failed = self._validate_column(field, column)
+            failed |= column_failed
+
+        failed_rows = np.flatnonzero(failed).tolist()
+
+        if failed_rows:
+            logger.debug(f"{self.schema.__name__}: {len(failed_rows)} of {row_count} rows failed validation")
+
+        return MMSColumnValidationResult(columns=coerced, failed_rows=failed_rows, row_count=row_count)
+
+    def build_records(self, result: MMSColumnValidationResult) -> list[Any]:
+        """Builds schema instances for the rows that passed without validating them again"""
+        fieldnames = list(result.columns.keys())
+        valid_rows = result.valid_rows
+
+        if not fieldnames:
+            return [self.schema() if self.is_dataclass else self.schema.construct() for _ in valid_rows]  # type: ignore
+
+        column_values = [result.columns[f][valid_rows].tolist() for f in fieldnames]
+
+        if self.is_dataclass:
+            return [self.schema(**dict(zip(fieldnames, v, strict=True))) for v in zip(*column_values, strict=True)]
+
+        fields_set = set(fieldnames)
+
+        return [
+            self.schema.construct(_fields_set=fields_set, **dict(zip(fieldnames, v, strict=True)))  # type: ignore
+            for v in zip(*column_values, strict=True)
+        ]
+
+
+@cache
+def compile_mms_validator(schema: type[BaseModel] | type[MMSBaseClass]) -> MMSSchemaValidator:
+    """Compiles and caches the column validator for a schema"""
+    return MMSSchemaValidator(schema)
@@ -1,77 +1,154 @@
 """ NEMWeb optimized parsers """
 
 import logging
+import multiprocessing
 import os
+from functools import partial
 from pathlib import Path
 
-from opennem.controllers.nem import store_aemo_tableset
+from opennem import settings
+from opennem.controllers.nem import merge_controller_return, store_aemo_table_batches, store_aemo_tableset
 from opennem.controllers.schema import ControllerReturn
-from opennem.core.parsers.aemo.mms import AEMOTableSet, parse_aemo_file
+from opennem.core.parsers.aemo.mms import AEMOTableProjection, AEMOTableSet, parse_aemo_file, stream_aemo_file
+from opennem.db import get_database_engine, isolated_bulk_inserts
 from opennem.utils.archive import download_and_unzip
 
 logger = logging.getLogger("opennem.core.parsers.aemo.nemweb")
 
+# recycle parse worker processes after this many files to release memory
+PARSE_WORKER_MAX_TASKS = 50
+
+
+def _get_extracted_csv_files(directory: str) -> list[Path]:
+    """Get the CSV files extracted from an archive into a directory"""
+    onlyfiles = [Path(directory) / f for f in os.listdir(directory) if (Path(directory) / f).is_file()]
+    logger.debug(f"Got {len(onlyfiles)} files")
+
+    return sorted([f for f in onlyfiles if f.suffix.lower() in [".csv"]])
+
+
+def _init_parse_worker() -> None:
+    """Pool initializer. Drops the connection pool inherited from the parent so each worker opens its own"""
+    get_database_engine().dispose(close=False)
+
+
+def _store_aemo_file(file_path: str, projection: AEMOTableProjection | None = None) -> ControllerReturn:
+    """Streams a single extracted file into the database. Errors are isolated to the file and bulk
+    inserts commit a chunk at a time"""
+    logger.info(f"parsing {file_path}")
+
+    try:
+        with isolated_bulk_inserts():
+            return store_aemo_table_batches(stream_aemo_file(file_path, projection=projection))
+    except Exception as e:
+        logger.error(f"Error processing file {file_path}: {e}")
+        return ControllerReturn(errors=1, error_detail=[f"{file_path}: {e}"])
+
+
+def store_aemo_files(
+    files: list[Path], workers: int | None = None, projection: AEMOTableProjection | None = None
+) -> ControllerReturn:
+    """Parses and stores a list of extracted AEMO files and returns the aggregated controller return
+
+    With more than one worker the files are fanned out to a process pool. Each worker streams its
+    file in record batches and stores them on its own connections so memory is bound by
+    workers x batch size. In a daemonic process such as a huey worker the files are stored in turn"""
+    cr = ControllerReturn()
+
+    if workers is None:
+        workers = settings.nemweb_parse_workers
+
+    file_paths = [str(f) for f in files]
+
+    # @NOTE huey process workers are daemonic and daemonic processes can't start a pool of any kind
+    if workers > 1 and multiprocessing.current_process().daemon:
+        logger.info(f"Parsing {len(file_paths)} files without workers in daemonic process")
+        workers = 1
+
+    if workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            merge_controller_return(cr, _store_aemo_file(file_path, projection=projection))
+
+        return cr
+
+    logger.info(f"Parsing {len(file_paths)} files with {workers} workers")
+
+    with multiprocessing.Pool(
+        processes=workers, initializer=_init_parse_worker, maxtasksperchild=PARSE_WORKER_MAX_TASKS
+    ) as pool:
+        for file_cr in pool.imap_unordered(partial(_store_aemo_file, projection=projection), file_paths):
+            merge_controller_return(cr, file_cr)
+
+    return cr
+
 
 def parse_aemo_url_optimized(
-    url: str, table_set: AEMOTableSet | None = None, persist_to_db: bool = True, values_only: bool = False
+    url: str,
+    table_set: AEMOTableSet | None = None,
+    persist_to_db: bool = True,
+    values_only: bool = False,
+    projection: AEMOTableProjection | None = None,
+    workers: int | None = None,
 ) -> ControllerReturn | AEMOTableSet:
     """Optimized version of aemo url parser that stores the files locally in tmp
-    and parses them individually to resolve memory pressure"""
+    and parses them individually to resolve memory pressure
+
+    When persisting each file is streamed into the database in record batches, across
+    a process pool if workers is set"""
     d = download_and_unzip(url)
-    cr = ControllerReturn()
 
-    onlyfiles = [Path(d) / f for f in os.listdir(d) if (Path(d) / f).is_file()]
-    logger.debug(f"Got {len(onlyfiles)} files")
+    csv_files = _get_extracted_csv_files(d)
+
+    if persist_to_db:
+        return store_aemo_files(csv_files, workers=workers, projection=projection)
 
     if not table_set:
         table_set = AEMOTableSet()
 
-    for f in onlyfiles:
+    for f in csv_files:
         logger.info(f"parsing {f}")
 
-        if f.suffix.lower() not in [".csv"]:
-            continue
-
-        table_set = parse_aemo_file(str(f), table_set=table_set, values_only=values_only)
-
-        if persist_to_db:
-            controller_returns = store_aemo_tableset(table_set)
-            cr.inserted_records += controller_returns.inserted_records
+        table_set = parse_aemo_file(str(f), table_set=table_set, values_only=values_only, projection=projection)
 
-            if cr.last_modified and controller_returns.last_modified and cr.last_modified < controller_returns.last_modified:
-                cr.last_modified = controller_returns.last_modified
-
-    if not persist_to_db:
-        return table_set
-
-    return cr
+    return table_set
 
 
 def parse_aemo_url_optimized_bulk(
-    url: str, table_set: AEMOTableSet | None = None, persist_to_db: bool = True
+    url: str,
+    table_set: AEMOTableSet | None = None,
+    persist_to_db: bool = True,
+    projection: AEMOTableProjection | None = None,
+    workers: int | None = None,
 ) -> ControllerReturn | AEMOTableSet:
     """Optimized version of aemo url parser that stores the files locally in tmp
-    and parses them individually to resolve memory pressure"""
+    and parses them individually to resolve memory pressure
+
+    With more than one worker the files are parsed and stored in parallel rather than merged
+    into a single table set"""
     d = download_and_unzip(url)
     cr = ControllerReturn()
 
-    onlyfiles = [Path(d) / f for f in os.listdir(d) if (Path(d) / f).is_file()]
-    logger.debug(f"Got {len(onlyfiles)} files")
+    csv_files = _get_extracted_csv_files(d)
+
+    if workers is None:
+        workers = settings.nemweb_parse_workers
+
+    if persist_to_db and workers > 1:
+        return store_aemo_files(csv_files, workers=workers, projection=projection)
 
     ts = AEMOTableSet()
 
-    for f in onlyfiles:
+    for f in csv_files:
         logger.info(f"parsing {f}")
 
-        if f.suffix.lower() not in [".csv"]:
-            continue
-
-        ts = parse_aemo_file(str(f), table_set=ts)
+        ts = parse_aemo_file(str(f), table_set=ts, projection=projection)
 
         if not persist_to_db:
             return ts
 
-    controller_returns = store_aemo_tableset(ts)
+    with isolated_bulk_inserts():
+        controller_returns = store_aemo_tableset(ts)
+
     cr.inserted_records += controller_returns.inserted_records
 
     if cr.last_modified and controller_returns.last_modified and cr.last_modified < controller_returns.last_modified:
@@ -8,35 +8,51 @@ Currently supports:
 
     * IIS default listings and variations
     * Extracing metadata from AEMO filenames
+    * Conditional and incremental fetches of listings that are polled
 """
 
 import html
 import logging
 import re
+from bisect import bisect_right
 from datetime import datetime
 from enum import Enum
-from operator import attrgetter
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 from urllib.parse import urljoin
 from zoneinfo import ZoneInfo
 
-from pydantic import ValidationError, validator
-from pyquery import PyQuery as pq
+from pydantic import PrivateAttr, ValidationError, validator
 
-from opennem.core.downloader import url_downloader
+from opennem import settings
 from opennem.core.normalizers import is_number, strip_double_spaces
 from opennem.core.parsers.aemo.filenames import parse_aemo_filename
 from opennem.schema.core import BaseConfig
 from opennem.schema.date_range import CrawlDateRange
+from opennem.utils.http import http
 
 logger = logging.getLogger("opennem.parsers.dirlisting")
 
+# @NOTE case insensitive as IIS sends upper case tags that pyquery lower cases
 __iis_line_match = re.compile(
     r"(?P<modified_date>.*[AM|PM])\ {2,}(?P<file_size>(\d{1,}|\<dir\>))\ "
-    r"<a href=['\"]?(?P<link>[^'\" >]+)['\"]>(?P<filename>[^\<]+)"
+    r"<a href=['\"]?(?P<link>[^'\" >]+)['\"]>(?P<filename>[^\<]+)",
+    re.IGNORECASE,
 )
 
+# a single listing entry in the raw html. date, size or <dir>, then the link
+_dirlisting_entry_match = re.compile(
+    r"(?P<modified_date>\w+,\s+\w+\s+\d{1,2},\s+\d{4}\s+\d{1,2}:\d{2}(?:\s+[AP]M)?)\s+"
+    r"(?P<file_size>\d+|&lt;dir&gt;|<dir>)\s+"
+    r"<a href=['\"]?(?P<link>[^'\" >]+)['\"]?>(?P<filename>[^<]+)</a>",
+    re.IGNORECASE,
+)
+
+# the pre block of a raw listing and the line breaks within it
+_dirlisting_pre_match = re.compile(r"<pre>(?P<pre>.*)</pre>", re.IGNORECASE | re.DOTALL)
+_dirlisting_line_split = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
 
 # AEMO files have a created timestamp in their filenames. This extracts it.
 _aemo_created_date_match = re.compile(r"\_(?P<date_created>\d{12})\_")
@@ -124,74 +140,125 @@ class DirlistingEntry(BaseConfig):
         return DirlistingEntryType.file
 
 
+class DirlistingIndex:
+    """Lookup structures over the entries of a listing built once per set of entries"""
+
+    def __init__(self, entries: list[DirlistingEntry]) -> None:
+        # positions of files in listing order
+        self.files: list[int] = [i for i, e in enumerate(entries) if e.entry_type == DirlistingEntryType.file]
+
+        self.intervals: dict[datetime, list[int]] = {}
+
+        for i, entry in enumerate(entries):
+            if entry.aemo_interval_date:
+                self.intervals.setdefault(entry.aemo_interval_date, []).append(i)
+
+        # files with a modified date sorted by it, with the dates alongside for bisect
+        self.files_by_modified: list[int] = sorted(
+            [i for i in self.files if entries[i].modified_date], key=lambda i: entries[i].modified_date  # type: ignore
+        )
+        self.modified_dates: list[datetime] = [entries[i].modified_date for i in self.files_by_modified]  # type: ignore
+
+
 class DirectoryListing(BaseConfig):
     url: str
     timezone: str | None
     entries: list[DirlistingEntry] = []
 
+    # entries that were not in the listing the last time it was fetched and whether it changed
+    new_entries: list[DirlistingEntry] = []
+    modified: bool = True
+
+    _index: DirlistingIndex | None = PrivateAttr(default=None)
+
+    @property
+    def index(self) -> DirlistingIndex:
+        if self._index is None:
+            self._index = DirlistingIndex(self.entries)
+
+        return self._index
+
+    def _set_entries(self, entries: list[DirlistingEntry]) -> None:
+        # set without validating so entries are not copied, and drop the index built over the old ones
+        self.__dict__["entries"] = entries
+        self._index = None
+
     @property
     def count(self) -> int:
         return len(self.entries)
 
     @property
     def file_count(self) -> int:
-        return len(self.get_files())
+        return len(self.index.files)
 
     @property
     def directory_count(self) -> int:
         return len(self.get_directories())
 
     def apply_date_range(self, date_range: CrawlDateRange) -> None:
-        self.entries = list(
-            filter(
-                lambda x: x.modified_date and x.modified_date > date_range.start and x.modified_date < date_range.end,
-                self.entries,
-            )
-        )
+        def _in_range(x: DirlistingEntry) -> bool:
+            return bool(x.modified_date and x.modified_date > date_range.start and x.modified_date < date_range.end)
+
+        self._set_entries(list(filter(_in_range, self.entries)))
+        self.new_entries = list(filter(_in_range, self.new_entries))
 
     def apply_filter(self, pattern: str) -> None:
-        self.entries = list(filter(lambda x: re.match(pattern, x.link), self.entries))
+        self._set_entries(list(filter(lambda x: re.match(pattern, x.link), self.entries)))
+        self.new_entries = list(filter(lambda x: re.match(pattern, x.link), self.new_entries))
+
+    def get_new_files(self) -> list[DirlistingEntry]:
+        return list(filter(lambda x: x.entry_type == DirlistingEntryType.file, self.new_entries))
 
     def get_files(self) -> list[DirlistingEntry]:
-        return list(filter(lambda x: x.entry_type == DirlistingEntryType.file, self.entries))
+        return [self.entries[i] for i in self.index.files]
 
     def get_directories(self) -> list[DirlistingEntry]:
         return list(filter(lambda x: x.entry_type == DirlistingEntryType.directory, self.entries))
 
     def get_most_recent_files(self, reverse: bool = True, limit: int | None = None) -> list[DirlistingEntry]:
-        _entries = sorted(self.get_files(), key=attrgetter("modified_date"), reverse=reverse)
+        files_by_modified = self.index.files_by_modified
+
+        if reverse:
+            # sorted descending keeping listing order between files modified at the same time
+            files_by_modified = sorted(
+                files_by_modified, key=lambda i: self.entries[i].modified_date, reverse=True  # type: ignore
+            )
 
-        if not limit:
-            return _entries
+        if limit:
+            files_by_modified = files_by_modified[:limit]
 
-        return _entries[:limit]
+        return [self.entries[i] for i in files_by_modified]
 
     def get_files_modified_in(self, intervals: list[datetime]) -> list[DirlistingEntry]:
-        return list(filter(lambda x: x.modified_date in intervals, self.entries))
+        intervals_set = set(intervals)
+        return list(filter(lambda x: x.modified_date in intervals_set, self.entries))
 
     def get_files_aemo_intervals(self, intervals: list[datetime]) -> list[DirlistingEntry]:
-        return list(filter(lambda x: x.aemo_interval_date in intervals, self.entries))
+        """Entries for the AEMO intervals in listing order"""
+        interval_index = self.index.intervals
+        positions: set[int] = set()
 
-    def get_files_modified_since(self, modified_date: datetime) -> list[DirlistingEntry]:
-        modified_since: list[DirlistingEntry] = []
+        for interval in intervals:
+            positions.update(interval_index.get(interval, []))
+
+        return [self.entries[i] for i in sorted(positions)]
 
-        if self.timezone:
+    def get_files_modified_since(self, modified_date: datetime) -> list[DirlistingEntry]:
+        """Files modified after modified_date in listing order. Modified dates in the listing are
+        local to the listing timezone"""
+        if self.timezone and modified_date.tzinfo:
             # sanity check the timezone before filter
             try:
-                ZoneInfo(self.timezone)
+                listing_timezone = ZoneInfo(self.timezone)
             except ValueError:
                 raise Exception(f"Invalid dirlisting timezone: {self.timezone}") from None
 
-            modified_since = list(
-                filter(
-                    lambda x: x.modified_date.replace(tzinfo=ZoneInfo(self.timezone)) > modified_date,
-                    self.get_files(),
-                )
-            )
-        else:
-            modified_since = list(filter(lambda x: x.modified_date > modified_date, self.get_files()))
+            modified_date = modified_date.astimezone(listing_timezone).replace(tzinfo=None)
 
-        return modified_since
+        index = self.index
+        first = bisect_right(index.modified_dates, modified_date)
+
+        return [self.entries[i] for i in sorted(index.files_by_modified[first:])]
 
 
 def parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
@@ -217,39 +284,180 @@ def parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
     return model
 
 
-def get_dirlisting(url: str, timezone: str | None = None) -> DirectoryListing:
-    """Parse a directory listng into a list of DirlistingEntry models"""
-    dirlisting_content = url_downloader(url)
+class DirlistingCacheEntry(BaseConfig):
+    """Previous fetch of a polled listing"""
 
-    resp = pq(dirlisting_content.decode("utf-8"))
+    etag: str | None = None
+    last_modified: str | None = None
 
-    _dirlisting_models: list[DirlistingEntry] = []
+    # parsed entry for each raw line of the listing
+    lines: dict[str, DirlistingEntry | None] = {}
+    entries: list[DirlistingEntry] = []
 
-    pre_area = resp("pre")
 
-    if not pre_area:
-        raise Exception("Invalid directory listing: no pre or bad html")
+# previous fetch of each listing url polled by this process
+_dirlisting_cache: dict[str, DirlistingCacheEntry] = {}
+
+
+def clear_dirlisting_cache() -> None:
+    _dirlisting_cache.clear()
+
+
+def _split_dirlisting_lines(dirlisting_content: str) -> list[str] | None:
+    """Splits the raw pre block of a listing into its lines. None if it has no pre block"""
+    pre_match = _dirlisting_pre_match.search(dirlisting_content)
+
+    if not pre_match:
+        return None
+
+    return [
+        i.strip()
+        for i in _dirlisting_line_split.split(pre_match.group("pre"))
+        if i.strip() and "To Parent Directory" not in i
+    ]
+
 
-    for i in [i for i in pre_area.html().split("<br/>") if i]:
-        # it catches the containing block so skip those
-        if not i:
-            continue
+@lru_cache(maxsize=4096)
+def _parse_dirlisting_datetime_cached(datetime_string: str) -> datetime | None:
+    # many files in a listing share a modified minute
+    return parse_dirlisting_datetime(datetime_string)
 
-        if "pre>" in i:
-            continue
 
-        if "To Parent Directory" in i:
-            continue
+def _parse_aemo_interval_date(filename: str) -> datetime | None:
+    if Path(filename).suffix not in [".zip", ".csv"]:
+        return None
+
+    try:
+        return parse_aemo_filename(filename).date
+    except Exception as e:
+        logger.info(f"Error parsing aemo datetime: {e}")
+        return None
+
+
+def _dirlisting_entry_from_match(match: re.Match, url: str) -> DirlistingEntry:
+    """Builds an entry from a listing regex match. Matches what the model validators derive"""
+    link, filename = match.group("link"), match.group("filename").strip()
+
+    if "&" in link or "&" in filename:
+        link, filename = html.unescape(link), html.unescape(filename)
+
+    link = urljoin(url, link)
+    file_size_value = match.group("file_size")
+    file_size = int(file_size_value) if file_size_value.isdigit() else None
+
+    return DirlistingEntry.construct(
+        filename=Path(filename),
+        link=link,
+        modified_date=_parse_dirlisting_datetime_cached(match.group("modified_date")),
+        aemo_interval_date=_parse_aemo_interval_date(filename),
+        file_size=file_size,
+        entry_type=DirlistingEntryType.directory
+        if not file_size or link.endswith("/")
+        else DirlistingEntryType.file,
+    )
+
 
-        model = parse_dirlisting_line(html.unescape(i.strip()))
+def parse_dirlisting_lines(
+    lines: list[str], url: str, previous_lines: dict[str, DirlistingEntry | None] | None = None
+) -> tuple[list[DirlistingEntry], list[DirlistingEntry], dict[str, DirlistingEntry | None]]:
+    """Parses raw listing lines reusing the entries of lines parsed on a previous fetch
+
+    Returns every entry, the entries from lines that were not seen before and the line map
+    for the next fetch"""
+    previous_lines = previous_lines or {}
+    line_entries: dict[str, DirlistingEntry | None] = {}
+    entries: list[DirlistingEntry] = []
+    new_entries: list[DirlistingEntry] = []
+
+    for line in lines:
+        if line in previous_lines:
+            model = previous_lines[line]
+        else:
+            match = _dirlisting_entry_match.search(line)
+            model = _dirlisting_entry_from_match(match, url) if match else None
+
+            if model:
+                new_entries.append(model)
+
+        line_entries[line] = model
 
         if model:
-            # append the base URL to the model link
-            model.link = urljoin(url, model.link)
+            entries.append(model)
+
+    return entries, new_entries, line_entries
+
+
+def get_dirlisting(url: str, timezone: str | None = None, cached: bool = True) -> DirectoryListing:
+    """Parse a directory listng into a list of DirlistingEntry models
+
+    Listings polled by the crawlers are fetched conditionally with the validators of the
+    previous fetch and only lines that were not in the previous fetch are parsed. The listing
+    returned always has every entry along with the new_entries since the last fetch"""
+    cache_entry = _dirlisting_cache.get(url) if cached else None
+
+    headers = {}
+
+    if cache_entry and cache_entry.etag:
+        headers["If-None-Match"] = cache_entry.etag
+
+    if cache_entry and cache_entry.last_modified:
+        headers["If-Modified-Since"] = cache_entry.last_modified
+
+    r = http.get(url, headers=headers, verify=settings.http_verify_ssl)
+
+    if cache_entry and r.status_code == 304:
+        logger.debug(f"Dirlisting not modified: {url}")
+        return DirectoryListing.construct(url=url, timezone=timezone, entries=list(cache_entry.entries), modified=False)
+
+    if not r.ok:
+        raise Exception(f"Bad link returned {r.status_code}: {url}")
+
+    dirlisting_content = r.content.decode("utf-8")
+    lines = _split_dirlisting_lines(dirlisting_content)
+
+    if lines is None or not cached:
+        return parse_dirlisting(dirlisting_content, url=url, timezone=timezone)
+
+    entries, new_entries, line_entries = parse_dirlisting_lines(
+        lines, url=url, previous_lines=cache_entry.lines if cache_entry else None
+    )
+
+    _dirlisting_cache[url] = DirlistingCacheEntry.construct(
+        etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"), lines=line_entries, entries=entries
+    )
+
+    logger.debug(f"Got back {len(entries)} models with {len(new_entries)} new")
+
+    return DirectoryListing.construct(
+        url=url,
+        timezone=timezone,
+        entries=list(entries),
+        new_entries=new_entries,
+        modified=not cache_entry or line_entries.keys() != cache_entry.lines.keys(),
+    )
+
+
+def parse_dirlisting(dirlisting_content: str | bytes, url: str, timezone: str | None = None) -> DirectoryListing:
+    """Parse the html of a directory listing at url into a list of DirlistingEntry models
+
+    The pre block is matched with a single regex rather than parsing the html and each
+    entry is built from its match without running the model validators"""
+    if isinstance(dirlisting_content, bytes):
+        dirlisting_content = dirlisting_content.decode("utf-8")
+
+    pre_match = _dirlisting_pre_match.search(dirlisting_content)
+
+    if not pre_match:
+        raise Exception("Invalid directory listing: no pre or bad html")
 
-            _dirlisting_models.append(model)
+    _dirlisting_models = [
+        _dirlisting_entry_from_match(m, url) for m in _dirlisting_entry_match.finditer(pre_match.group("pre"))
+    ]
 
-    listing_model = DirectoryListing(url=url, timezone=timezone, entries=_dirlisting_models)
+    # without a previous fetch to compare against every entry is new
+    listing_model = DirectoryListing.construct(
+        url=url, timezone=timezone, entries=_dirlisting_models, new_entries=list(_dirlisting_models)
+    )
 
     logger.debug(f"Got back {len(listing_model.entries)} models")
 
@@ -1,11 +1,14 @@
 """ Nemweb crawlers """
 import logging
+from collections import deque
+from collections.abc import Generator
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from opennem.controllers.nem import ControllerReturn, store_aemo_tableset
+from opennem.controllers.nem import ControllerReturn, get_table_projection, merge_controller_return, store_aemo_tableset
 from opennem.core.crawlers.history import CrawlHistoryEntry, get_crawler_missing_intervals, set_crawler_history
 from opennem.core.crawlers.schema import CrawlerDefinition, CrawlerPriority, CrawlerSchedule
 from opennem.core.parsers.aemo.filenames import AEMODataBucketSize
-from opennem.core.parsers.aemo.mms import parse_aemo_url
+from opennem.core.parsers.aemo.mms import AEMOTableProjection, AEMOTableSet, parse_aemo_url
 from opennem.core.parsers.aemo.nemweb import parse_aemo_url_optimized, parse_aemo_url_optimized_bulk
 from opennem.core.parsers.dirlisting import DirlistingEntry, get_dirlisting
 from opennem.core.time import get_interval, get_interval_by_size
@@ -58,6 +61,78 @@ def get_time_interval_for_crawler(crawler: CrawlerDefinition) -> TimeInterval:
     return time_interval
 
 
+def _is_large_entry(crawler: CrawlerDefinition, entry: DirlistingEntry) -> bool:
+    """Bulk and large files are downloaded to disk and stored by their own parsers"""
+    # @NOTE optimization - if we're dealing with a large file unzip
+    # to disk and parse rather than in-memory. 100,000kb
+    return crawler.bulk_insert or bool(entry.file_size and entry.file_size > 100_000)
+
+
+def _fetch_aemo_entry(
+    crawler: CrawlerDefinition, entry: DirlistingEntry, projection: AEMOTableProjection | None = None
+) -> AEMOTableSet | None:
+    """Downloads and parses an entry. Large entries are left for the store stage"""
+    if _is_large_entry(crawler, entry):
+        return None
+
+    return parse_aemo_url(entry.link, projection=projection)
+
+
+def store_aemo_entry(
+    crawler: CrawlerDefinition,
+    entry: DirlistingEntry,
+    projection: AEMOTableProjection | None = None,
+    table_set: AEMOTableSet | None = None,
+) -> ControllerReturn:
+    """Stores a dirlisting entry, parsing it first if it was not fetched ahead"""
+    if crawler.bulk_insert:
+        controller_returns = parse_aemo_url_optimized_bulk(entry.link, persist_to_db=True, projection=projection)
+    elif _is_large_entry(crawler, entry):
+        controller_returns = parse_aemo_url_optimized(entry.link, projection=projection)
+    else:
+        if not table_set:
+            table_set = parse_aemo_url(entry.link, projection=projection)
+
+        controller_returns = store_aemo_tableset(table_set)
+
+    if not isinstance(controller_returns, ControllerReturn):
+        raise Exception("Controller returns not a ControllerReturn")
+
+    return controller_returns
+
+
+def iter_fetched_entries(
+    crawler: CrawlerDefinition, entries: list[DirlistingEntry], projection: AEMOTableProjection | None = None
+) -> Generator[tuple[DirlistingEntry, AEMOTableSet | None, Exception | None], None, None]:
+    """Fetches and parses entries across a pool of crawler.concurrency threads and yields them
+    in order with their table set or fetch error
+
+    At most crawler.concurrency entries are fetched ahead of the consumer so a long catch up
+    does not hold every parsed file in memory"""
+    pending: deque[tuple[DirlistingEntry, Future]] = deque()
+    entries_iter = iter(entries)
+
+    with ThreadPoolExecutor(max_workers=crawler.concurrency, thread_name_prefix="nemweb_fetch") as executor:
+
+        def _submit_next() -> None:
+            entry = next(entries_iter, None)
+
+            if entry is not None:
+                pending.append((entry, executor.submit(_fetch_aemo_entry, crawler, entry, projection)))
+
+        for _ in range(crawler.concurrency):
+            _submit_next()
+
+        while pending:
+            entry, future = pending.popleft()
+            _submit_next()
+
+            try:
+                yield entry, future.result(), None
+            except Exception as e:
+                yield entry, None, e
+
+
 def run_nemweb_aemo_crawl(
     crawler: CrawlerDefinition,
     run_fill: bool = True,
@@ -86,7 +161,10 @@ def run_nemweb_aemo_crawl(
         logger.info(f"Applying date range: {date_range.start} - {date_range.end}")
         dirlisting.apply_date_range(date_range)
 
-    logger.debug(f"Got {dirlisting.count} entries, {dirlisting.file_count} files and {dirlisting.directory_count} directories")
+    logger.debug(
+        f"Got {dirlisting.count} entries, {dirlisting.file_count} files and {dirlisting.directory_count} directories. "
+        f"{len(dirlisting.get_new_files())} new files since the last poll"
+    )
 
     if not crawler.network or not crawler.network.interval_size:
         raise Exception("Require an interval size for network for this crawler")
@@ -109,43 +187,50 @@ def run_nemweb_aemo_crawl(
 
         if not missing_intervals:
             logger.info("Nothing to do")
+            return None
 
+        # @NOTE every file for a missing interval is fetched, not just the new ones, so files that
+        # failed on an earlier poll are retried. unchanged listings are not re-parsed
         entries_to_fetch = dirlisting.get_files_aemo_intervals(missing_intervals)
 
     if not entries_to_fetch:
         logger.info("Nothing to do")
         return None
 
-    logger.info(f"Fetching {latest=} {len(entries_to_fetch)} entries")
+    logger.info(f"Fetching {latest=} {len(entries_to_fetch)} entries with concurrency {crawler.concurrency}")
 
-    controller_returns: ControllerReturn | None = None
+    controller_returns = ControllerReturn()
 
-    for entry in entries_to_fetch:
-        try:
-            # @NOTE optimization - if we're dealing with a large file unzip
-            # to disk and parse rather than in-memory. 100,000kb
-            if crawler.bulk_insert:
-                controller_returns = parse_aemo_url_optimized_bulk(entry.link, persist_to_db=True)
-            elif entry.file_size and entry.file_size > 100_000:
-                controller_returns = parse_aemo_url_optimized(entry.link)
-            else:
-                ts = parse_aemo_url(entry.link)
-                controller_returns = store_aemo_tableset(ts)
+    # only parse the tables and columns that are stored by the processors
+    projection = get_table_projection()
+
+    max_date = max([i.modified_date for i in entries_to_fetch if i.modified_date], default=None)
 
-            if not isinstance(controller_returns, ControllerReturn):
-                raise Exception("Controller returns not a ControllerReturn")
+    if crawler.concurrency > 1:
+        fetched_entries = iter_fetched_entries(crawler, entries_to_fetch, projection=projection)
+    else:
+        fetched_entries = ((entry, None, None) for entry in entries_to_fetch)
 
-            max_date = max([i.modified_date for i in entries_to_fetch if i.modified_date])
+    # entries are stored in order on this thread even when fetched concurrently
+    for entry, table_set, fetch_error in fetched_entries:
+        try:
+            if fetch_error:
+                raise fetch_error
 
-            if not controller_returns.last_modified or max_date > controller_returns.last_modified:
-                controller_returns.last_modified = max_date
+            entry_controller_returns = store_aemo_entry(crawler, entry, projection=projection, table_set=table_set)
 
             if entry.aemo_interval_date:
-                ch = CrawlHistoryEntry(interval=entry.aemo_interval_date, records=controller_returns.processed_records)
+                ch = CrawlHistoryEntry(interval=entry.aemo_interval_date, records=entry_controller_returns.processed_records)
                 set_crawler_history(crawler_name=crawler.name, histories=[ch])
 
+            merge_controller_return(controller_returns, entry_controller_returns)
+
         except Exception as e:
             logger.error(f"Processing error: {e}")
+            controller_returns.errors += 1
+
+    if max_date and (not controller_returns.last_modified or max_date > controller_returns.last_modified):
+        controller_returns.last_modified = max_date
 
     controller_returns.crawls_run = len(entries_to_fetch)
 
@@ -161,6 +246,7 @@ AEMONemwebTradingIS = CrawlerDefinition(
     url="http://nemweb.com.au/Reports/Current/TradingIS_Reports/",
     network=NetworkNEM,
     backfill_days=14,
+    concurrency=4,
     processor=run_nemweb_aemo_crawl,
 )
 
@@ -175,6 +261,7 @@ AEMONemwebDispatchIS = CrawlerDefinition(
     url="http://nemweb.com.au/Reports/Current/DispatchIS_Reports/",
     network=NetworkNEM,
     backfill_days=2,
+    concurrency=4,
     processor=run_nemweb_aemo_crawl,
 )
 
@@ -186,6 +273,7 @@ AEMONNemwebDispatchScada = CrawlerDefinition(
     url="http://www.nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/",
     network=NetworkNEM,
     backfill_days=2,
+    concurrency=4,
     processor=run_nemweb_aemo_crawl,
 )
 
@@ -198,6 +286,7 @@ AEMONemwebRooftop = CrawlerDefinition(
     filename_filter=".*_MEASUREMENT_.*",
     network=NetworkAEMORooftop,
     backfill_days=14,
+    concurrency=4,
     processor=run_nemweb_aemo_crawl,
 )
 
@@ -8,9 +8,11 @@ project
 """
 import logging
 from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from sqlalchemy import create_engine
-from sqlalchemy.engine.base import Engine
+from sqlalchemy.engine.base import Connection, Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
@@ -21,6 +23,12 @@ DeclarativeBase = declarative_base()
 
 logger = logging.getLogger("opennem.db")
 
+# connection of the enclosing shared_connection block
+_shared_connection: ContextVar[Connection | None] = ContextVar("opennem_shared_connection", default=None)
+
+# bulk inserts commit their own chunks rather than joining the shared connection
+_isolated_bulk_inserts: ContextVar[bool] = ContextVar("opennem_isolated_bulk_inserts", default=False)
+
 
 def db_connect(db_conn_str: str | None = None, debug: bool = False, timeout: int = 10) -> Engine:
     """
@@ -109,3 +117,55 @@ def get_database_session() -> Generator[Session, None, None]:
     finally:
         if s:
             s.close()
+
+
+def get_shared_connection() -> Connection | None:
+    """Gets the connection of the enclosing shared_connection block if there is one"""
+    return _shared_connection.get()
+
+
+def bulk_inserts_isolated() -> bool:
+    """Whether bulk inserts are in an isolated_bulk_inserts block"""
+    return _isolated_bulk_inserts.get()
+
+
+@contextmanager
+def isolated_bulk_inserts() -> Generator[None, None, None]:
+    """
+    Bulk inserts in the block commit each chunk on its own connection rather than joining an
+    enclosing shared connection. For archive and backfill loads so a large file only holds row
+    locks for a chunk rather than until the whole file commits.
+    """
+    token = _isolated_bulk_inserts.set(True)
+
+    try:
+        yield None
+    finally:
+        _isolated_bulk_inserts.reset(token)
+
+
+@contextmanager
+def shared_connection(engine: Engine | None = None) -> Generator[Connection, None, None]:
+    """
+    Runs everything in the block on a single pooled connection and transaction. The
+    transaction commits when the block exits and rolls back on error, and the connection
+    is returned to the pool rather than the pool being disposed.
+
+    Nested blocks join the enclosing transaction.
+    """
+    connection = _shared_connection.get()
+
+    if connection is not None:
+        yield connection
+        return None
+
+    if not engine:
+        engine = get_database_engine()
+
+    with engine.begin() as connection:
+        token = _shared_connection.set(connection)
+
+        try:
+            yield connection
+        finally:
+            _shared_connection.reset(token)
@@ -0,0 +1,290 @@
+"""
+OpenNEM Binary Copy Encoder
+
+Encodes typed columns into the PostgreSQL binary COPY format so bulk inserts can skip
+formatting every value as CSV text on the client and parsing it again on the server.
+
+Columns are encoded whole with numpy and interleaved into tuples a chunk of rows at a
+time so the stream can be fed to copy_expert without holding the full payload in memory.
+
+See https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+"""
+import io
+import logging
+import struct
+from collections.abc import Generator, Iterable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import types as sqltypes
+from sqlalchemy.sql.schema import Column
+
+logger = logging.getLogger("opennem.db.bulk_insert_binary")
+
+PG_COPY_BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# signature, flags and header extension length
+PG_COPY_BINARY_HEADER = PG_COPY_BINARY_SIGNATURE + struct.pack(">ii", 0, 0)
+
+PG_COPY_BINARY_TRAILER = struct.pack(">h", -1)
+
+# microseconds between the unix epoch and the postgres epoch of 2000-01-01
+PG_EPOCH_OFFSET_US = 946_684_800_000_000
+
+# rows encoded per chunk of the stream
+BINARY_COPY_CHUNK_ROWS = 50_000
+
+# wire type for each staging column type. numeric columns are staged as float8 and cast
+# by the server on insert as the numeric wire format is not worth encoding by hand
+PG_BINARY_COLUMN_TYPES: dict[str, str] = {
+    "timestamptz": ">i8",
+    "timestamp": ">i8",
+    "float8": ">f8",
+    "int8": ">i8",
+    "int4": ">i4",
+    "int2": ">i2",
+    "bool": "u1",
+    "text": "",
+}
+
+
+class BinaryCopyException(Exception):
+    pass
+
+
+def get_binary_column_type(column: Column) -> str:
+    """Maps a model column to the staging type it is encoded as"""
+    column_type = column.type
+
+    if isinstance(column_type, sqltypes.DateTime):
+        return "timestamptz" if column_type.timezone else "timestamp"
+
+    if isinstance(column_type, sqltypes.Numeric):
+        return "float8"
+
+    if isinstance(column_type, sqltypes.BigInteger):
+        return "int8"
+
+    if isinstance(column_type, sqltypes.SmallInteger):
+        return "int2"
+
+    if isinstance(column_type, sqltypes.Integer):
+        return "int4"
+
+    if isinstance(column_type, sqltypes.Boolean):
+        return "bool"
+
+    if isinstance(column_type, sqltypes.String | sqltypes.Enum):
+        return "text"
+
+    raise BinaryCopyException(f"Column {column.name} type {column_type} not supported in binary copy")
+
+
+def _timestamp_micros(pg_type: str, series: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Converts timestamps to microseconds since the postgres epoch and a null mask"""
+    # @NOTE naive datetimes going into a timestamptz column are taken as UTC
+    timestamps = pd.to_datetime(series, errors="coerce", utc=pg_type == "timestamptz")
+
+    if timestamps.dt.tz is not None:
+        # utc for timestamptz and wall time for naive columns as the csv path would write it
+        timestamps = timestamps.dt.tz_localize(None)
+
+    nulls = timestamps.isna().to_numpy()
+    micros = timestamps.to_numpy(dtype="datetime64[us]").astype(np.int64)
+
+    return np.where(nulls, 0, micros - PG_EPOCH_OFFSET_US).astype(">i8"), nulls
+
+
+def _coerce_column(pg_type: str, values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Coerces a column to its wire dtype and returns the values and a null mask"""
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+
+    if pg_type in ["timestamptz", "timestamp"]:
+        if series.dtype == object:
+            # interval columns repeat heavily so each distinct value is converted once
+            codes, uniques = pd.factorize(series)
+            micros, nulls = _timestamp_micros(pg_type, pd.Series(uniques, dtype=object))
+            missing = codes < 0
+            codes = np.where(missing, 0, codes)
+
+            if not len(uniques):
+                return np.zeros(len(series), dtype=">i8"), missing
+
+            return micros[codes], nulls[codes] | missing
+
+        return _timestamp_micros(pg_type, series)
+
+    if pg_type == "bool":
+        nulls = series.isna().to_numpy()
+        return np.where(nulls, False, series.to_numpy(dtype=object)).astype(bool).astype("u1"), nulls
+
+    # @NOTE NaN is written as NULL as it is in the csv path
+    numbers = pd.to_numeric(series, errors="coerce")
+    nulls = numbers.isna().to_numpy()
+    numbers = numbers.to_numpy(dtype=np.float64, na_value=0)
+
+    if pg_type == "float8":
+        return numbers.astype(">f8"), nulls
+
+    return numbers.astype(PG_BINARY_COLUMN_TYPES[pg_type]), nulls
+
+
+def _gather(buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Gathers the byte ranges starts[i]:starts[i] + lengths[i] of buffer into one array"""
+    total = int(lengths.sum())
+    out_starts = np.cumsum(lengths) - lengths
+    index = np.repeat(starts - out_starts, lengths) + np.arange(total)
+
+    return buffer[index]
+
+
+def _encode_fixed_column(pg_type: str, values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Encodes a fixed width column as length prefixed fields. Returns the bytes and the field lengths"""
+    data, nulls = _coerce_column(pg_type, values)
+    width = data.dtype.itemsize
+    row_count = len(data)
+
+    fields = np.empty(row_count, dtype=[("length", ">i4"), ("value", data.dtype)])
+    fields["length"] = np.where(nulls, -1, width)
+    fields["value"] = data
+
+    encoded = fields.view(np.uint8).reshape(row_count, 4 + width)
+
+    if nulls.any():
+        keep = np.ones(encoded.shape, dtype=bool)
+        keep[nulls, 4:] = False
+        return encoded[keep], np.where(nulls, 4, 4 + width)
+
+    return encoded.reshape(-1), np.full(row_count, 4 + width)
+
+
+def _encode_text_column(values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Encodes a text column. Each distinct value is encoded once and gathered into place"""
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(series)
+
+    encoded_uniques = [v.encode("utf-8") if isinstance(v, str) else str(v).encode("utf-8") for v in uniques]
+    fields = [struct.pack(">i", len(v)) + v for v in encoded_uniques]
+
+    # missing values are coded -1 by factorize and point at a trailing null field
+    fields.append(struct.pack(">i", -1))
+    codes = np.where(codes < 0, len(encoded_uniques), codes)
+
+    field_lengths = np.array([len(f) for f in fields], dtype=np.int64)
+    field_starts = np.cumsum(field_lengths) - field_lengths
+    buffer = np.frombuffer(b"".join(fields), dtype=np.uint8)
+
+    lengths = field_lengths[codes]
+
+    return _gather(buffer, field_starts[codes], lengths), lengths
+
+
+def encode_binary_column(pg_type: str, values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Encodes a column of values as binary copy fields"""
+    if pg_type not in PG_BINARY_COLUMN_TYPES:
+        raise BinaryCopyException(f"Unsupported binary copy type: {pg_type}")
+
+    if pg_type == "text":
+        return _encode_text_column(values)
+
+    return _encode_fixed_column(pg_type, values)
+
+
+def encode_binary_tuples(columns: list[tuple[np.ndarray, np.ndarray]], row_count: int) -> bytes:
+    """Interleaves encoded columns into binary copy tuples"""
+    field_count = np.frombuffer(struct.pack(">h", len(columns)), dtype=np.uint8)
+    columns = [(np.tile(field_count, row_count), np.full(row_count, 2, dtype=np.int64))] + columns
+
+    row_lengths = np.sum([lengths for _, lengths in columns], axis=0, dtype=np.int64)
+    row_starts = np.cumsum(row_lengths) - row_lengths
+
+    out = np.empty(int(row_lengths.sum()), dtype=np.uint8)
+    row_offset = np.zeros(row_count, dtype=np.int64)
+
+    for data, lengths in columns:
+        source_starts = np.cumsum(lengths) - lengths
+        out[np.repeat(row_starts + row_offset - source_starts, lengths) + np.arange(len(data))] = data
+        row_offset += lengths
+
+    return out.tobytes()
+
+
+def iter_binary_copy(
+    columns: dict[str, tuple[str, Any]], chunk_rows: int = BINARY_COPY_CHUNK_ROWS
+) -> Generator[bytes, None, None]:
+    """Yields a binary copy stream for columns of name -> (staging type, values) a chunk of rows at a time"""
+    row_counts = {len(values) for _, values in columns.values()}
+
+    if len(row_counts) > 1:
+        raise BinaryCopyException("Binary copy columns have different lengths")
+
+    row_count = row_counts.pop() if row_counts else 0
+
+    yield PG_COPY_BINARY_HEADER
+
+    for chunk_start in range(0, row_count, chunk_rows):
+        chunk = slice(chunk_start, chunk_start + chunk_rows)
+
+        encoded = [
+            encode_binary_column(pg_type, values.iloc[chunk] if isinstance(values, pd.Series) else values[chunk])
+            for pg_type, values in columns.values()
+        ]
+
+        yield encode_binary_tuples(encoded, min(chunk_rows, row_count - chunk_start))
+
+    yield PG_COPY_BINARY_TRAILER
+
+
+def get_binary_copy_columns(
+    table: Any, records: list[dict] | pd.DataFrame, column_names: list[str] | None = None
+) -> dict[str, tuple[str, Any]]:
+    """Gets the staging types and column values to copy from records or a data frame for a model"""
+    table_columns = {c.name: c for c in table.__table__.columns.values()}
+
+    if column_names is None:
+        column_names = list(records.columns) if isinstance(records, pd.DataFrame) else list(records[0].keys())
+
+    for column_name in column_names:
+        if column_name not in table_columns:
+            raise BinaryCopyException(f"Column name from records not found in table: {column_name}")
+
+    columns: dict[str, tuple[str, Any]] = {}
+
+    for column_name in column_names:
+        if isinstance(records, pd.DataFrame):
+            values = records[column_name]
+        else:
+            values = [r.get(column_name) for r in records]
+
+        columns[column_name] = (get_binary_column_type(table_columns[column_name]), values)
+
+    return columns
+
+
+class BinaryCopyStream(io.RawIOBase):
+    """Read only file object over a generator of byte chunks for copy_expert"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._view = memoryview(b"")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while self._position >= len(self._view):
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                return 0
+
+            self._view = memoryview(chunk)
+            self._position = 0
+
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position : self._position + size]
+        self._position += size
+
+        return size
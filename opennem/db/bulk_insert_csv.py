@@ -2,18 +2,26 @@
 """
 OpenNEM Bulk Insert Pipeline
 
-Bulk inserts records using temporary tables and CSV imports with copy_from
+Bulk inserts records using temporary tables and CSV imports with copy_from. Inserts can
+opt into binary copy from typed columns with bulk_insert_binary. Large loads are staged
+and committed a chunk at a time with staged_upsert
 
 """
 import csv
 import logging
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from typing import Any, TypeVar
+from uuid import uuid4
 
+import pandas as pd
+from pydantic import BaseModel
 from sqlalchemy.sql.schema import Column, Table
 
-from opennem.db import get_database_engine
+from opennem import settings
+from opennem.db import bulk_inserts_isolated, get_database_engine, get_shared_connection
+from opennem.db.bulk_insert_binary import BinaryCopyStream, get_binary_copy_columns, iter_binary_copy
 from opennem.db.models.opennem import BalancingSummary, FacilityScada
 
 logger = logging.getLogger("opennem.db.bulk_insert_csv")
@@ -21,39 +29,76 @@ logger = logging.getLogger("opennem.db.bulk_insert_csv")
 ORMTableType = TypeVar("ORMTableType", bound=Table)
 
 BULK_INSERT_QUERY = """
-    CREATE TEMP TABLE __tmp_{table_name}_{tmp_table_name}
+    CREATE TEMP TABLE {staging_table}
     (LIKE {table_schema}{table_name} INCLUDING DEFAULTS)
     ON COMMIT DROP;
 
-    COPY __tmp_{table_name}_{tmp_table_name}
+    COPY {staging_table}
         FROM STDIN WITH (FORMAT CSV, HEADER TRUE, DELIMITER ',');
 
     INSERT INTO {table_schema}{table_name}
         SELECT *
-        FROM __tmp_{table_name}_{tmp_table_name}
-    ON CONFLICT {on_conflict}
+        FROM {staging_table}
+    ON CONFLICT {on_conflict};
+
+    DROP TABLE {staging_table};
+"""
+
+# staging table is typed for the binary columns rather than copied from the target as
+# numeric columns are staged as float8
+BULK_INSERT_BINARY_QUERY = """
+    CREATE TEMP TABLE {staging_table}
+    ({staging_columns})
+    ON COMMIT DROP;
+
+    COPY {staging_table} ({column_names})
+        FROM STDIN WITH (FORMAT BINARY);
+
+    INSERT INTO {table_schema}{table_name} ({column_names})
+        SELECT {column_names}
+        FROM {staging_table}
+    ON CONFLICT {on_conflict};
+
+    DROP TABLE {staging_table};
 """
 
+# read size copy_expert pulls from the binary stream
+BULK_INSERT_BINARY_READ_SIZE = 1024 * 1024
+
+# postgres truncates identifiers longer than this
+PG_IDENTIFIER_MAX_LENGTH = 63
+
 BULK_INSERT_CONFLICT_UPDATE = """
-    ({pk_columns}) DO UPDATE set {update_values}
+    ({pk_columns}) DO UPDATE set {update_values}{update_where}
 """
 
+# only rewrite a conflicting row when an updated value changes
+BULK_INSERT_CHANGED_ONLY_WHERE = """
+    WHERE ({current_values}) IS DISTINCT FROM ({new_values})"""
 
-def build_insert_query(
+# bookkeeping columns that always differ and are left out of the changed check
+BULK_INSERT_CHANGED_IGNORE_COLUMNS = ["updated_at"]
+
+
+def get_column_name(column: str | Column) -> str:
+    if isinstance(column, Column) and hasattr(column, "name"):
+        return column.name
+    if isinstance(column, str):
+        return column.strip()
+    return ""
+
+
+def build_on_conflict_clause(
     table: Table,
     update_cols: list[str | Column] = None,
+    update_coalesce: bool = False,
+    update_changed_only: bool = False,
 ) -> str:
-    """
-    Builds the bulk insert query
-    """
-    on_conflict = "DO NOTHING"
+    """Builds the on conflict clause for a bulk insert into table
 
-    def get_column_name(column: str | Column) -> str:
-        if isinstance(column, Column) and hasattr(column, "name"):
-            return column.name
-        if isinstance(column, str):
-            return column.strip()
-        return ""
+    With update_changed_only a conflicting row is only updated when one of its values is
+    distinct from the stored one so re-crawled data does not rewrite identical rows"""
+    on_conflict = "DO NOTHING"
 
     update_col_names = []
 
@@ -64,14 +109,33 @@ def build_insert_query(
 
     primary_key_columns = [c.name for c in table.__table__.primary_key.columns.values()]  # type: ignore
 
+    table_name = table.__table__.name  # type: ignore
+
+    update_values = {
+        n: f"COALESCE(EXCLUDED.{n}, {table_name}.{n})" if update_coalesce else f"EXCLUDED.{n}" for n in update_col_names
+    }
+
+    update_where = ""
+    compare_col_names = [n for n in update_col_names if n not in BULK_INSERT_CHANGED_IGNORE_COLUMNS]
+
+    if update_changed_only and compare_col_names:
+        update_where = BULK_INSERT_CHANGED_ONLY_WHERE.format(
+            current_values=", ".join([f"{table_name}.{n}" for n in compare_col_names]),
+            new_values=", ".join([update_values[n] for n in compare_col_names]),
+        )
+
     if len(update_col_names):
         on_conflict = BULK_INSERT_CONFLICT_UPDATE.format(
             pk_columns=",".join(primary_key_columns),
-            update_values=", ".join([f"{n} = EXCLUDED.{n}" for n in update_col_names]),
+            update_values=", ".join([f"{n} = {v}" for n, v in update_values.items()]),
+            update_where=update_where,
         )
 
-    # Table schema
-    table_schema: str = ""
+    return on_conflict
+
+
+def get_table_schema_name(table: Table) -> str:
+    """Gets the schema name from a models table args or an empty string"""
     _ts: str = ""
 
     if hasattr(table, "__table_args__"):
@@ -86,22 +150,70 @@ def build_insert_query(
 
         if not _ts:
             logger.warning(f"Table schema not found for table: {table.__table__.name}")  # type: ignore
-        else:
-            table_schema = f"{_ts}."
 
-    # Temporary table name uniq
-    tmp_table_name: str = ""
+    return _ts
+
+
+def get_staging_table_name(table: Table) -> str:
+    """Unique staging table name for a load. A timestamp alone collided for two loads in the same
+    second on one session. The id leads so postgres truncating a long name keeps it unique"""
+    return f"__tmp_{uuid4().hex[:12]}_{table.__table__.name}"[:PG_IDENTIFIER_MAX_LENGTH]  # type: ignore
+
+
+def build_insert_query(
+    table: Table,
+    update_cols: list[str | Column] = None,
+    update_coalesce: bool = False,
+    update_changed_only: bool = False,
+) -> str:
+    """
+    Builds the bulk insert query
 
-    tmp_table_name = datetime.strftime(datetime.now(), "%Y%m%d%H%M%S")
+    With update_coalesce a null in the inserted row keeps the existing value on conflict
+    rather than overwriting it
+    """
+    on_conflict = build_on_conflict_clause(
+        table, update_cols, update_coalesce=update_coalesce, update_changed_only=update_changed_only
+    )
 
-    if _ts:
-        tmp_table_name = f"{_ts}_{tmp_table_name}"
+    # Table schema
+    _ts = get_table_schema_name(table)
+    table_schema: str = f"{_ts}." if _ts else ""
 
     query = BULK_INSERT_QUERY.format(
         table_name=table.__table__.name,  # type: ignore
         table_schema=table_schema,
         on_conflict=on_conflict,
-        tmp_table_name=tmp_table_name,
+        staging_table=get_staging_table_name(table),
+    )
+
+    logger.debug(query)
+
+    return query
+
+
+def build_binary_insert_query(
+    table: Table,
+    staging_types: dict[str, str],
+    update_cols: list[str | Column] = None,
+    update_coalesce: bool = False,
+    update_changed_only: bool = False,
+) -> str:
+    """Builds the bulk insert query for a binary copy of the columns in staging_types"""
+    on_conflict = build_on_conflict_clause(
+        table, update_cols, update_coalesce=update_coalesce, update_changed_only=update_changed_only
+    )
+
+    _ts = get_table_schema_name(table)
+    table_schema: str = f"{_ts}." if _ts else ""
+
+    query = BULK_INSERT_BINARY_QUERY.format(
+        table_name=table.__table__.name,  # type: ignore
+        table_schema=table_schema,
+        staging_columns=", ".join([f"{name} {pg_type}" for name, pg_type in staging_types.items()]),
+        column_names=", ".join(staging_types.keys()),
+        on_conflict=on_conflict,
+        staging_table=get_staging_table_name(table),
     )
 
     logger.debug(query)
@@ -173,38 +285,209 @@ def generate_bulkinsert_csv_from_records(
     return csv_buffer
 
 
-def bulkinsert_mms_items(
+class BulkInsertChunkMetric(BaseModel):
+    """Timing and outcome of a chunk of a staged upsert"""
+
+    chunk: int
+    records: int
+    # rows inserted or updated with changed values
+    changed: int = 0
+    seconds: float
+    error: str | None = None
+
+
+class BulkInsertResult(BaseModel):
+    records: int = 0
+    changed: int = 0
+    chunks: list[BulkInsertChunkMetric] = []
+
+    @property
+    def errors(self) -> int:
+        return len([c for c in self.chunks if c.error])
+
+
+def _copy_chunk(
+    cursor: Any,
     table: ORMTableType,
-    records: list[dict],
-    update_fields: list[str | Column[Any]] | None = None,
+    records: list[dict] | pd.DataFrame,
+    update_fields: list[str | Column[Any]] | None,
+    update_coalesce: bool,
+    update_changed_only: bool,
+    binary: bool,
 ) -> int:
-    num_records = 0
+    """Stages and upserts a chunk of records on cursor and returns the number of rows changed"""
+    query_kwargs = {"update_coalesce": update_coalesce, "update_changed_only": update_changed_only}
 
-    if not records:
-        return 0
+    if binary:
+        columns = get_binary_copy_columns(table, records)
+        sql_query = build_binary_insert_query(
+            table, {name: pg_type for name, (pg_type, _) in columns.items()}, update_fields, **query_kwargs
+        )
+        return _execute_staged_query(cursor, sql_query, BinaryCopyStream(iter_binary_copy(columns)))
 
-    sql_query = build_insert_query(table, update_fields)
+    sql_query = build_insert_query(table, update_fields, **query_kwargs)
     csv_content = generate_bulkinsert_csv_from_records(table, records, column_names=list(records[0].keys()))
 
-    # @TODO check the scoping here
-    engine = get_database_engine()
-    conn = engine.raw_connection()
+    return _execute_staged_query(cursor, sql_query, csv_content)
+
+
+def _execute_staged_query(cursor: Any, sql_query: str, content: Any) -> int:
+    """Runs the statements of a staged insert query one at a time so the row count of the
+    insert can be read. Returns the number of rows inserted or updated"""
+    changed = 0
+
+    for statement in [s.strip() for s in sql_query.split(";") if s.strip()]:
+        if statement.startswith("COPY"):
+            cursor.copy_expert(statement, content, size=BULK_INSERT_BINARY_READ_SIZE)
+            continue
+
+        cursor.execute(statement)
+
+        if statement.startswith("INSERT"):
+            changed = max(cursor.rowcount, 0)
+
+    return changed
+
+
+def _upsert_chunk(chunk_index: int, records: list[dict] | pd.DataFrame, **copy_kwargs: Any) -> BulkInsertChunkMetric:
+    """Upserts a chunk on its own pooled connection and commits it"""
+    start = time.perf_counter()
+    conn = get_database_engine().raw_connection()
+    error = None
+    changed = 0
 
     try:
-        cursor = conn.cursor()
-        cursor.copy_expert(sql_query, csv_content)
+        changed = _copy_chunk(conn.cursor(), records=records, **copy_kwargs)
         conn.commit()
-        num_records = len(records)
-        logger.info(f"Bulk inserted {len(records)} records")
     except Exception as generic_error:
         if hasattr(generic_error, "hide_parameters"):
             generic_error.hide_parameters = True  # type: ignore
-        logger.error(generic_error)
+        logger.error(f"Error in bulk insert chunk {chunk_index}: {generic_error}")
+        error = str(generic_error)
+        conn.rollback()
     finally:
-        engine.dispose()
+        # @NOTE return the connection to the pool. disposing the engine here threw away every pooled connection
         conn.close()
 
-    return num_records
+    return BulkInsertChunkMetric(
+        chunk=chunk_index,
+        records=0 if error else len(records),
+        changed=changed,
+        seconds=time.perf_counter() - start,
+        error=error,
+    )
+
+
+def staged_upsert(
+    table: ORMTableType,
+    records: list[dict] | pd.DataFrame,
+    update_fields: list[str | Column[Any]] | None = None,
+    update_coalesce: bool = False,
+    binary: bool | None = None,
+    chunk_size: int | None = None,
+    workers: int | None = None,
+    update_changed_only: bool | None = None,
+    isolated: bool | None = None,
+) -> BulkInsertResult:
+    """Upserts records through staging tables a chunk at a time
+
+    Each chunk commits on its own so a large load only holds row locks for a chunk and does
+    not block the live interval writers. With more than one worker chunks are loaded in
+    parallel on separate connections. Inside a shared connection block the chunks join its
+    transaction instead and errors are raised so the block can roll back, unless isolated,
+    which defaults to whether the call is in an isolated_bulk_inserts block"""
+    result = BulkInsertResult()
+
+    if records is None or not len(records):
+        return result
+
+    if binary is None:
+        binary = settings.db_bulk_insert_binary
+
+    if update_changed_only is None:
+        update_changed_only = settings.db_bulk_insert_changed_only
+
+    if not chunk_size:
+        chunk_size = settings.db_bulk_insert_chunk_size
+
+    if workers is None:
+        workers = settings.db_bulk_insert_workers
+
+    copy_kwargs = {
+        "table": table,
+        "update_fields": update_fields,
+        "update_coalesce": update_coalesce,
+        "update_changed_only": update_changed_only,
+        "binary": binary,
+    }
+
+    chunks = [
+        records.iloc[i : i + chunk_size] if isinstance(records, pd.DataFrame) else records[i : i + chunk_size]
+        for i in range(0, len(records), chunk_size)
+    ]
+
+    if isolated is None:
+        isolated = bulk_inserts_isolated()
+
+    shared_conn = get_shared_connection() if not isolated else None
+
+    if shared_conn is not None:
+        cursor = shared_conn.connection.cursor()
+
+        for chunk_index, chunk in enumerate(chunks):
+            start = time.perf_counter()
+            changed = _copy_chunk(cursor, records=chunk, **copy_kwargs)
+            result.chunks.append(
+                BulkInsertChunkMetric(
+                    chunk=chunk_index, records=len(chunk), changed=changed, seconds=time.perf_counter() - start
+                )
+            )
+    elif workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            result.chunks = list(
+                executor.map(lambda c: _upsert_chunk(c[0], c[1], **copy_kwargs), enumerate(chunks))  # type: ignore
+            )
+    else:
+        result.chunks = [_upsert_chunk(chunk_index, chunk, **copy_kwargs) for chunk_index, chunk in enumerate(chunks)]
+
+    result.records = sum(c.records for c in result.chunks)
+    result.changed = sum(c.changed for c in result.chunks)
+
+    for chunk_metric in result.chunks:
+        logger.debug(
+            f"{table.__table__.name} chunk {chunk_metric.chunk}: {chunk_metric.records} records in {chunk_metric.seconds:.3f}s"
+        )
+
+    logger.info(
+        f"Bulk inserted {result.records} records ({result.changed} changed) into {table.__table__.name} "
+        f"in {len(result.chunks)} chunks"
+        + (f" with {result.errors} failed" if result.errors else "")
+    )
+
+    return result
+
+
+def bulkinsert_mms_items(
+    table: ORMTableType,
+    records: list[dict],
+    update_fields: list[str | Column[Any]] | None = None,
+    update_coalesce: bool = False,
+    binary: bool | None = None,
+    update_changed_only: bool | None = None,
+) -> int:
+    """Bulk inserts records into table with a staged upsert and returns the number stored. With
+    binary the records are sent with binary copy, which defaults to the db_bulk_insert_binary setting"""
+    if not records:
+        return 0
+
+    return staged_upsert(
+        table,
+        records,
+        update_fields,
+        update_coalesce=update_coalesce,
+        binary=binary,
+        update_changed_only=update_changed_only,
+    ).records
 
 
 def pad_column_null(records: list[dict], column_name: str) -> list[dict]:
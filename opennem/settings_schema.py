@@ -71,6 +71,16 @@ class OpennemSettings(BaseSettings):
     # show database debug
     db_debug: bool = False
 
+    # send bulk inserts with binary copy rather than csv
+    db_bulk_insert_binary: bool = False
+
+    # records per staged upsert chunk and the number of connections chunks are loaded across
+    db_bulk_insert_chunk_size: int = 50_000
+    db_bulk_insert_workers: int = 1
+
+    # skip upsert updates that would not change a stored row
+    db_bulk_insert_changed_only: bool = True
+
     # cache scada values for
     cache_scada_values_ttl_sec: int = 60 * 5
 
@@ -87,9 +97,26 @@ class OpennemSettings(BaseSettings):
     # number of retries by default
     http_retries: int = 5
 
+    # connection pools kept per host and the connections kept in each
+    http_pool_connections: int = 10
+    http_pool_maxsize: int = 10
+
+    # async http client limits. http2 is used where the server supports it and h2 is installed
+    http_max_connections: int = 100
+    http_max_connections_per_host: int = 10
+    http_keepalive_expiry: float = 30
+    http_http2: bool = True
+
     # cache http requests locally
     http_cache_local: bool = False
     http_verify_ssl: bool = True
+
+    # content addressed on-disk cache of nemweb and mms downloads
+    download_cache: bool = False
+    download_cache_path: str = ".opennem_download_cache"
+    download_cache_max_bytes: int = 5 * 1024**3
+    # never evict archive files from the download cache. pinned files can take it past max bytes
+    download_cache_pin_archives: bool = False
     https_proxy_url: str | None = None  # @note don't let it confict with env HTTP_PROXY
 
     _static_folder_path: str = "opennem/static/"
@@ -122,6 +149,26 @@ class OpennemSettings(BaseSettings):
 
     tmp_file_prefix: str | None = "opennem_"
 
+    # number of processes used to parse multi-file nemweb archives. 0 parses them in the crawler process
+    nemweb_parse_workers: int = 0
+
+    # answer crawler missing interval queries from an in-process bitmap of crawl history
+    crawl_history_bitmap: bool = False
+
+    # seconds before a crawler history bitmap is fully rebuilt from crawl_history. rows written by
+    # other processes are applied on each read
+    crawl_history_bitmap_rebuild_sec: int = 60 * 60
+
+    # nemweb watcher seconds between listing polls in the window after each interval when files
+    # are published and outside of it
+    nemweb_watcher_poll_sec: float = 2
+    nemweb_watcher_idle_poll_sec: float = 30
+    nemweb_watcher_window_sec: int = 180
+
+    # archive backfill workers and the records per second they write at. 0 is unthrottled
+    backfill_workers: int = 4
+    backfill_target_write_rate: int = 0
+
     slack_admin_alert: list[str] | None = ["nik"]
 
     # alert threshold level in minutes for interval delay monitoring
@@ -4,18 +4,23 @@ Module to handle zip files and nested zip files.
 """
 import io
 import os
+import queue
+import struct
+import threading
+import zlib
 from asyncio.log import logger
+from collections.abc import Generator, Iterable, Iterator
 from io import BytesIO
 from pathlib import Path
 from tempfile import mkdtemp
 from typing import IO, Any
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 from opennem import settings
+from opennem.utils.download_cache import cached_download, get_download_cache
+from opennem.utils.http_async import download_to_file
 from opennem.utils.url import get_filename_from_url
 
-from .http import http
-
 # limit how many zips within zips we'll parse
 # 0 means all
 ZIP_LIMIT = 0
@@ -99,6 +104,257 @@ def _handle_zip(file_obj: Any, mode: str) -> io.BufferedReader | IO[bytes]:
         return chain_streams(c)
 
 
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ZIP_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+ZIP_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+_ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_ZIP_FLAG_ENCRYPTED = 0x01
+_ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+_ZIP64_EXTRA_ID = 0x0001
+
+
+class ZipStreamException(Exception):
+    pass
+
+
+class _ChunkReader:
+    """Reads exact lengths and whole chunks from an iterator of byte chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def _fill(self, length: int) -> None:
+        while len(self._buffer) < length:
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                break
+
+            self._buffer += chunk
+
+    def peek(self, length: int) -> bytes:
+        self._fill(length)
+        return self._buffer[:length]
+
+    def read(self, length: int) -> bytes:
+        self._fill(length)
+        data, self._buffer = self._buffer[:length], self._buffer[length:]
+        return data
+
+    def read_chunk(self) -> bytes:
+        if self._buffer:
+            data, self._buffer = self._buffer, b""
+            return data
+
+        return next(self._chunks, b"")
+
+    def unread(self, data: bytes) -> None:
+        self._buffer = data + self._buffer
+
+
+def _zip64_sizes(extra: bytes) -> tuple[int, int] | None:
+    """Reads the (uncompressed, compressed) sizes from a zip64 extra field"""
+    offset = 0
+
+    while offset + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, offset)
+
+        if header_id == _ZIP64_EXTRA_ID and size >= 16:
+            return struct.unpack_from("<QQ", extra, offset + 4)
+
+        offset += 4 + size
+
+    return None
+
+
+def _iter_zip_member_data(
+    reader: _ChunkReader, method: int, flags: int, compressed_size: int, zip64: bool
+) -> Generator[bytes, None, None]:
+    """Yields the decompressed data of the member at the reader position"""
+    if method == ZIP_STORED:
+        if flags & _ZIP_FLAG_DATA_DESCRIPTOR:
+            raise ZipStreamException("Can't stream a stored zip member without a known size")
+
+        remaining = compressed_size
+
+        while remaining:
+            chunk = reader.read_chunk()
+
+            if not chunk:
+                raise ZipStreamException("Zip stream ended inside a member")
+
+            if len(chunk) > remaining:
+                reader.unread(chunk[remaining:])
+                chunk = chunk[:remaining]
+
+            remaining -= len(chunk)
+            yield chunk
+
+    elif method == ZIP_DEFLATED:
+        # deflate streams mark their own end so the compressed size is not needed
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        while not decompressor.eof:
+            chunk = reader.read_chunk()
+
+            if not chunk:
+                raise ZipStreamException("Zip stream ended inside a member")
+
+            data = decompressor.decompress(chunk)
+
+            if data:
+                yield data
+
+        reader.unread(decompressor.unused_data)
+
+    else:
+        raise ZipStreamException(f"Unsupported zip compression method: {method}")
+
+    if flags & _ZIP_FLAG_DATA_DESCRIPTOR:
+        if reader.peek(4) == ZIP_DATA_DESCRIPTOR_SIGNATURE:
+            reader.read(4)
+
+        # crc and the two sizes which are 8 bytes each for zip64
+        reader.read(20 if zip64 else 12)
+
+
+def iter_zip_stream(chunks: Iterable[bytes]) -> Generator[tuple[str, Iterator[bytes]], None, None]:
+    """
+    Reads a zip sequentially from its local file headers as the bytes arrive, rather
+    than seeking to the central directory at the end of the archive.
+
+    Yields the name and a data iterator for each member. Each member has to be read
+    before the next, and whatever is left of it is skipped when the next is requested.
+    """
+    reader = _ChunkReader(chunks)
+
+    while True:
+        signature = reader.peek(4)
+
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            if signature and signature != ZIP_CENTRAL_DIRECTORY_SIGNATURE:
+                raise ZipStreamException(f"Invalid zip header signature: {signature!r}")
+
+            return None
+
+        header = reader.read(_ZIP_LOCAL_HEADER.size)
+
+        if len(header) < _ZIP_LOCAL_HEADER.size:
+            raise ZipStreamException("Zip stream ended inside a header")
+
+        (_, _, flags, method, _, _, _, compressed_size, _, name_length, extra_length) = _ZIP_LOCAL_HEADER.unpack(
+            header
+        )
+
+        if flags & _ZIP_FLAG_ENCRYPTED:
+            raise ZipStreamException("Encrypted zip members are not supported")
+
+        name = reader.read(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read(extra_length)
+
+        zip64_sizes = _zip64_sizes(extra)
+
+        if zip64_sizes and compressed_size == 0xFFFFFFFF:
+            compressed_size = zip64_sizes[1]
+
+        member_data = _iter_zip_member_data(reader, method, flags, compressed_size, zip64_sizes is not None)
+
+        yield name, member_data
+
+        # skip whatever the consumer didn't read
+        for _ in member_data:
+            pass
+
+
+def iter_unzipped_chunks(chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """
+    Streams the decompressed contents of every member of a zip, including nested zips,
+    as one iterator of byte chunks. Content that isn't a zip is passed through.
+
+    Members are separated by a line break so line based consumers don't join the last
+    line of one member to the first of the next.
+    """
+    reader = _ChunkReader(chunks)
+
+    if reader.peek(4) != ZIP_LOCAL_HEADER_SIGNATURE:
+        while chunk := reader.read_chunk():
+            yield chunk
+
+        return None
+
+    stream_count = 0
+
+    for filename, member_data in iter_zip_stream(iter(reader.read_chunk, b"")):
+        if filename.endswith("/"):
+            continue
+
+        if filename.lower().endswith(".zip"):
+            if ZIP_LIMIT > 0 and stream_count >= ZIP_LIMIT:
+                continue
+
+            stream_count += 1
+            yield from iter_unzipped_chunks(member_data)
+            continue
+
+        last_chunk = b""
+
+        for chunk in member_data:
+            last_chunk = chunk
+            yield chunk
+
+        if last_chunk and not last_chunk.endswith(b"\n"):
+            yield b"\n"
+
+
+def iter_prefetched(chunks: Iterable[bytes], depth: int = 16) -> Generator[bytes, None, None]:
+    """
+    Reads an iterator of chunks from a background thread up to depth chunks ahead so
+    that a download overlaps with whatever consumes it.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    done = object()
+
+    def _put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _producer() -> None:
+        try:
+            for chunk in chunks:
+                if not _put(chunk):
+                    return None
+
+            _put(done)
+        except Exception as e:
+            _put(e)
+
+    producer = threading.Thread(target=_producer, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = buffer.get()
+
+            if item is done:
+                break
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+    finally:
+        stopped.set()
+
+
 def fix_central_directory(zfile: BytesIO) -> BytesIO:
     """
     Fixes the central directory on bad zip files
@@ -179,16 +435,17 @@ def download_and_unzip(url: str) -> str:
     logger.info(f"Saving to {dest_dir}")
 
     filename = get_filename_from_url(url)
+    save_path = Path(dest_dir) / filename
 
     try:
-        response = http.get(url)
+        # without the download cache the archive is streamed to disk rather than read into memory
+        if get_download_cache():
+            save_path.write_bytes(cached_download(url))
+        else:
+            download_to_file(url, save_path)
     except Exception as e:
         logger.error(e)
-
-    save_path = Path(dest_dir) / filename
-
-    with save_path.open("wb+") as fh:
-        fh.write(response.content)
+        raise e
 
     logger.info(f"Wrote file to {save_path}")
 
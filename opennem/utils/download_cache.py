@@ -0,0 +1,326 @@
+"""
+OpenNEM Download Cache
+
+Content addressed on-disk cache for NEMWeb and MMS downloads. File content is stored once
+per sha256 under the cache path and an sqlite index maps each URL to its content along
+with the Last-Modified and ETag it was served with.
+
+Hits are checked against the index alone. Current report files are revalidated with a
+conditional GET, archive files never change once published so they are served from the
+cache without a request and can optionally be pinned so eviction never drops them. Once
+the cache is over its size limit the least recently used unpinned files are evicted.
+
+usage:
+
+    from opennem.utils.download_cache import cached_download
+    content = cached_download(url)
+
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from opennem import settings
+from opennem.utils.http import http
+
+logger = logging.getLogger("opennem.utils.download_cache")
+
+DOWNLOAD_CACHE_INDEX = "index.sqlite"
+
+# url path parts of files that are not changed once published
+DOWNLOAD_CACHE_ARCHIVE_PATHS = ["/Reports/Archive/", "/Reports/ARCHIVE/", "/Data_Archive/"]
+
+_DOWNLOAD_CACHE_SCHEMA = """
+    create table if not exists download_cache (
+        url text primary key,
+        sha256 text not null,
+        size integer not null,
+        last_modified text,
+        etag text,
+        pinned integer not null default 0,
+        stored_at real not null,
+        accessed_at real not null
+    );
+    create index if not exists download_cache_sha256 on download_cache (sha256);
+    create index if not exists download_cache_accessed_at on download_cache (accessed_at);
+"""
+
+
+class DownloadCacheException(Exception):
+    pass
+
+
+@dataclass
+class DownloadCacheEntry:
+    url: str
+    sha256: str
+    size: int
+    last_modified: str | None = None
+    etag: str | None = None
+    pinned: bool = False
+
+
+def is_archive_url(url: str) -> bool:
+    """Archive files are immutable once published"""
+    return any(p in url for p in DOWNLOAD_CACHE_ARCHIVE_PATHS)
+
+
+class DownloadCache:
+    """Content addressed file cache with an sqlite index and LRU eviction"""
+
+    def __init__(self, path: Path | str, max_bytes: int, pin_archives: bool = False) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.pin_archives = pin_archives
+
+        (self.path / "objects").mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path / DOWNLOAD_CACHE_INDEX, timeout=30, check_same_thread=False)
+
+        with self._lock, self._db:
+            self._db.execute("pragma journal_mode=wal")
+            self._db.executescript(_DOWNLOAD_CACHE_SCHEMA)
+
+    def object_path(self, sha256: str) -> Path:
+        return self.path / "objects" / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> DownloadCacheEntry | None:
+        """Index only hit check. Does not read the content"""
+        with self._lock:
+            row = self._db.execute(
+                "select url, sha256, size, last_modified, etag, pinned from download_cache where url = ?", (url,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return DownloadCacheEntry(*row[:5], pinned=bool(row[5]))
+
+    def read(self, entry: DownloadCacheEntry) -> bytes | None:
+        """Reads cached content and marks it used. Missing or damaged content drops the entry"""
+        object_path = self.object_path(entry.sha256)
+
+        try:
+            content = object_path.read_bytes()
+        except FileNotFoundError:
+            content = None
+
+        # size is a cheap check against truncated writes. the hash is checked on put
+        if content is None or len(content) != entry.size:
+            logger.warning(f"Download cache content missing or damaged for {entry.url}")
+            self.remove(entry.url)
+            return None
+
+        with self._lock, self._db:
+            self._db.execute("update download_cache set accessed_at = ? where url = ?", (time.time(), entry.url))
+
+        return content
+
+    def put(
+        self,
+        url: str,
+        content: bytes,
+        last_modified: str | None = None,
+        etag: str | None = None,
+        pinned: bool | None = None,
+    ) -> DownloadCacheEntry:
+        """Stores content for a url. Content shared between urls is stored once"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        object_path = self.object_path(sha256)
+
+        if pinned is None:
+            pinned = self.pin_archives and is_archive_url(url)
+
+        if not object_path.is_file():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=object_path.parent, prefix=".tmp_")
+
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(content)
+
+            os.replace(tmp_path, object_path)
+
+        now = time.time()
+        previous = self.lookup(url)
+
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                insert into download_cache (url, sha256, size, last_modified, etag, pinned, stored_at, accessed_at)
+                values (?, ?, ?, ?, ?, ?, ?, ?)
+                on conflict (url) do update set
+                    sha256 = excluded.sha256,
+                    size = excluded.size,
+                    last_modified = excluded.last_modified,
+                    etag = excluded.etag,
+                    pinned = max(download_cache.pinned, excluded.pinned),
+                    stored_at = excluded.stored_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (url, sha256, len(content), last_modified, etag, int(pinned), now, now),
+            )
+
+        if previous and previous.sha256 != sha256:
+            self._remove_unreferenced(previous.sha256)
+
+        self.evict()
+
+        return DownloadCacheEntry(url, sha256, len(content), last_modified, etag, pinned)
+
+    def pin(self, url: str, pinned: bool = True) -> bool:
+        """Pins a cached url so it is never evicted. Returns False if it is not cached"""
+        with self._lock, self._db:
+            cursor = self._db.execute("update download_cache set pinned = ? where url = ?", (int(pinned), url))
+
+        return cursor.rowcount > 0
+
+    def remove(self, url: str) -> None:
+        entry = self.lookup(url)
+
+        if not entry:
+            return
+
+        with self._lock, self._db:
+            self._db.execute("delete from download_cache where url = ?", (url,))
+
+        self._remove_unreferenced(entry.sha256)
+
+    def _remove_unreferenced(self, sha256: str) -> None:
+        with self._lock:
+            referenced = self._db.execute("select 1 from download_cache where sha256 = ? limit 1", (sha256,)).fetchone()
+
+        if not referenced:
+            self.object_path(sha256).unlink(missing_ok=True)
+
+    def size(self) -> int:
+        """Bytes stored. Content shared between urls is counted once"""
+        with self._lock:
+            (total,) = self._db.execute(
+                "select coalesce(sum(size), 0) from (select distinct sha256, size from download_cache)"
+            ).fetchone()
+
+        return total
+
+    def evict(self, max_bytes: int | None = None) -> int:
+        """Evicts least recently used unpinned urls until the cache fits in max_bytes. Returns urls evicted"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.size()
+
+        if total <= max_bytes:
+            return 0
+
+        with self._lock:
+            candidates = self._db.execute(
+                "select url, sha256, size from download_cache where pinned = 0 order by accessed_at"
+            ).fetchall()
+
+        evicted = 0
+
+        for url, sha256, size in candidates:
+            if total <= max_bytes:
+                break
+
+            with self._lock, self._db:
+                self._db.execute("delete from download_cache where url = ?", (url,))
+                referenced = self._db.execute(
+                    "select 1 from download_cache where sha256 = ? limit 1", (sha256,)
+                ).fetchone()
+
+            if not referenced:
+                self.object_path(sha256).unlink(missing_ok=True)
+                total -= size
+
+            evicted += 1
+
+        logger.debug(f"Evicted {evicted} urls from the download cache, now {total} bytes")
+
+        if total > max_bytes:
+            logger.warning(f"Download cache is {total} bytes with pinned files, over its {max_bytes} byte limit")
+
+        return evicted
+
+    def fetch(self, url: str, **kwargs) -> bytes:
+        """Gets url content from the cache, revalidating current files, or downloads and stores it"""
+        entry = self.lookup(url)
+        headers: dict[str, str] = {}
+
+        if entry and is_archive_url(url):
+            content = self.read(entry)
+
+            if content is not None:
+                logger.debug(f"Download cache hit: {url}")
+                return content
+
+            entry = None
+
+        if entry:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        r = http.get(url, headers=headers, **kwargs)
+
+        if entry and r.status_code == 304:
+            content = self.read(entry)
+
+            if content is not None:
+                logger.debug(f"Download cache hit on revalidation: {url}")
+                return content
+
+            # content went missing since the lookup so download it again
+            r = http.get(url, **kwargs)
+
+        if not r.ok:
+            raise DownloadCacheException(f"Bad link returned {r.status_code}: {url}")
+
+        self.put(url, r.content, last_modified=r.headers.get("Last-Modified"), etag=r.headers.get("ETag"))
+
+        return r.content
+
+
+_download_cache: DownloadCache | None = None
+_download_cache_lock = threading.Lock()
+
+
+def get_download_cache() -> DownloadCache | None:
+    """Gets the download cache if it is enabled in settings"""
+    global _download_cache
+
+    if not settings.download_cache:
+        return None
+
+    with _download_cache_lock:
+        if not _download_cache:
+            _download_cache = DownloadCache(
+                settings.download_cache_path,
+                max_bytes=settings.download_cache_max_bytes,
+                pin_archives=settings.download_cache_pin_archives,
+            )
+
+    return _download_cache
+
+
+def cached_download(url: str, **kwargs) -> bytes:
+    """Downloads url content through the download cache when it is enabled"""
+    download_cache = get_download_cache()
+
+    if download_cache:
+        return download_cache.fetch(url, **kwargs)
+
+    r = http.get(url, **kwargs)
+
+    if not r.ok:
+        raise DownloadCacheException(f"Bad link returned {r.status_code}: {url}")
+
+    return r.content
@@ -77,6 +77,9 @@ def setup_http_cache() -> bool:
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
+    """Adapter with a default timeout. Takes max_retries as well as only one adapter can be
+    mounted per prefix"""
+
     def __init__(self, *args, **kwargs):
         self.timeout = DEFAULT_TIMEOUT
         if "timeout" in kwargs:
@@ -111,26 +114,29 @@ http = requests.Session()
 
 http.headers.update({"User-Agent": USER_AGENT})
 
-adapter_timeout = TimeoutHTTPAdapter()
-http.mount("https://", adapter_timeout)
-http.mount("http://", adapter_timeout)
-
+# @NOTE mounting a second adapter on a prefix replaces the first so the timeout and retries
+# are both set on the one adapter
+adapter_retry = TimeoutHTTPAdapter(
+    max_retries=retry_strategy, pool_connections=settings.http_pool_connections, pool_maxsize=settings.http_pool_maxsize
+)
+adapter_timeout = adapter_retry
 
-adapter_retry = HTTPAdapter(max_retries=retry_strategy)
 http.mount("https://", adapter_retry)
 http.mount("http://", adapter_retry)
 
 setup_http_cache()
 
 
-def mount_timeout_adaptor(session: requests.Session) -> None:
-    session.mount("https://", adapter_timeout)
-    session.mount("http://", adapter_timeout)
+def mount_timeout_adaptor(session: requests.Session, retry: Retry | None = None) -> None:
+    """Mounts the timeout adapter with the default retry strategy or retry"""
+    adapter = adapter_retry if not retry else TimeoutHTTPAdapter(max_retries=retry)
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
 
-def mount_retry_adaptor(session: requests.Session) -> None:
-    session.mount("https://", adapter_retry)
-    session.mount("http://", adapter_retry)
+def mount_retry_adaptor(session: requests.Session, retry: Retry | None = None) -> None:
+    mount_timeout_adaptor(session, retry=retry)
 
 
 def attach_proxy(session: requests.Session) -> requests.Session:
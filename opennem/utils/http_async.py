@@ -0,0 +1,225 @@
+"""
+    Async HTTP client with pooled keep-alive connections
+
+    Connections are pooled with a limit per host, HTTP/2 is negotiated where the server and
+    the h2 library support it, failed requests are retried with backoff and bodies can be
+    streamed. Sync wrappers run a client on a new event loop for existing callers.
+
+    Archive downloads go through this client. The data source clients keep their requests
+    sessions for now
+
+    usage:
+
+    from opennem.utils.http_async import AsyncHTTPClient, download_to_file
+
+    async with AsyncHTTPClient() as client:
+        contents = await asyncio.gather(*[client.fetch(url) for url in urls])
+
+    download_to_file(url, file_path)
+
+"""
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, TypeVar
+from urllib.parse import urlparse
+
+import httpx
+
+from opennem import settings
+from opennem.utils.http import USER_AGENT
+
+logger = logging.getLogger("opennem.utils.http_async")
+
+T = TypeVar("T")
+
+# status codes that are retried. matches the retry strategy of the sync session
+HTTP_RETRY_STATUS_CODES = [403, 429, 500, 502, 503, 504]
+
+# seconds before the first retry, doubled for each retry after
+HTTP_RETRY_BACKOFF = 0.5
+
+HTTP_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncHTTPException(Exception):
+    pass
+
+
+def _http2_available() -> bool:
+    if not settings.http_http2:
+        return False
+
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.debug("HTTP/2 requires the h2 library. Using HTTP/1.1")
+        return False
+
+    return True
+
+
+class AsyncHTTPClient:
+    """Pooled async HTTP client with a connection limit per host, retries and streaming"""
+
+    def __init__(
+        self,
+        max_connections_per_host: int | None = None,
+        retries: int | None = None,
+        backoff: float = HTTP_RETRY_BACKOFF,
+        transport: httpx.AsyncBaseTransport | None = None,
+        **client_kwargs: Any,
+    ) -> None:
+        self.max_connections_per_host = max_connections_per_host or settings.http_max_connections_per_host
+        self.retries = settings.http_retries if retries is None else retries
+        self.backoff = backoff
+
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._client = httpx.AsyncClient(
+            http2=_http2_available() if transport is None else False,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            timeout=settings.http_timeout,
+            headers={"User-Agent": USER_AGENT},
+            verify=settings.http_verify_ssl,
+            follow_redirects=True,
+            transport=transport,
+            **client_kwargs,
+        )
+
+    async def __aenter__(self) -> "AsyncHTTPClient":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+
+        return self._host_limits[host]
+
+    async def _backoff(self, attempt: int, url: str, reason: Any) -> None:
+        delay = self.backoff * 2**attempt
+        logger.debug(f"Retrying {url} in {delay}s after {reason}")
+        await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncGenerator[httpx.Response, None]:
+        """Sends a request and yields the response with the body unread. Retries until a response
+        with a status that is not retried or the retries run out
+
+        Only sending the request is retried. Errors reading the body are raised to the caller"""
+        send_kwargs = {k: kwargs.pop(k) for k in ["auth", "follow_redirects"] if k in kwargs}
+
+        async with self._host_limit(url):
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+
+                try:
+                    request = self._client.build_request(method, url, **kwargs)
+                    response = await self._client.send(request, stream=True, **send_kwargs)
+                except httpx.TransportError as e:
+                    if last_attempt:
+                        raise
+                    reason: Any = e
+                else:
+                    if response.status_code not in HTTP_RETRY_STATUS_CODES or last_attempt:
+                        break
+
+                    await response.aclose()
+                    reason = response.status_code
+
+                await self._backoff(attempt, url, reason)
+
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends a request with retries and reads the body"""
+        async with self.stream(method, url, **kwargs) as response:
+            await response.aread()
+
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def fetch(self, url: str, **kwargs: Any) -> bytes:
+        """Gets the content of a url. Raises on an error status"""
+        response = await self.get(url, **kwargs)
+
+        if not response.is_success:
+            raise AsyncHTTPException(f"Bad link returned {response.status_code}: {url}")
+
+        return response.content
+
+    async def iter_bytes(
+        self, url: str, chunk_size: int = HTTP_STREAM_CHUNK_SIZE, **kwargs: Any
+    ) -> AsyncGenerator[bytes, None]:
+        """Streams the content of a url in chunks"""
+        async with self.stream("GET", url, **kwargs) as response:
+            if not response.is_success:
+                raise AsyncHTTPException(f"Bad link returned {response.status_code}: {url}")
+
+            async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                yield chunk
+
+    async def download_to_file(self, url: str, file_path: Path, **kwargs: Any) -> int:
+        """Streams the content of a url to a file without holding it in memory. Returns bytes written"""
+        size = 0
+
+        with file_path.open("wb") as fh:
+            async for chunk in self.iter_bytes(url, **kwargs):
+                fh.write(chunk)
+                size += len(chunk)
+
+        return size
+
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """Runs a coroutine for sync callers
+
+    @NOTE when called from inside a running event loop the coroutine runs on its own loop in
+    a worker thread and the calling loop is blocked until it is done. async callers should
+    use AsyncHTTPClient directly"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="http_async") as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def fetch(url: str, **kwargs: Any) -> bytes:
+    """Sync wrapper to fetch a url with the async client"""
+
+    async def _fetch() -> bytes:
+        async with AsyncHTTPClient() as client:
+            return await client.fetch(url, **kwargs)
+
+    return run_sync(_fetch())
+
+
+def download_to_file(url: str, file_path: Path, **kwargs: Any) -> int:
+    """Sync wrapper to stream a url to a file with the async client"""
+
+    async def _download_to_file() -> int:
+        async with AsyncHTTPClient() as client:
+            return await client.download_to_file(url, file_path, **kwargs)
+
+    return run_sync(_download_to_file())
@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from itertools import groupby
 from textwrap import dedent
 
+import pandas as pd
+
 from opennem import settings
 from opennem.api.stats.controllers import get_scada_range_optimized
 from opennem.api.time import human_to_interval, human_to_period
@@ -12,7 +14,7 @@ from opennem.core.flows import FlowDirection, fueltech_to_flow, generated_flow_s
 from opennem.core.fueltechs import ALL_FUELTECH_CODES
 from opennem.core.network_regions import get_network_regions
 from opennem.db import get_database_engine
-from opennem.db.bulk_insert_csv import build_insert_query, generate_csv_from_records
+from opennem.db.bulk_insert_csv import build_insert_query, generate_csv_from_records, staged_upsert
 from opennem.db.models.opennem import FacilityScada
 from opennem.queries.utils import duid_to_case
 from opennem.schema.network import NetworkAEMORooftop, NetworkAPVI, NetworkNEM, NetworkSchema, NetworkWEM
@@ -199,9 +201,23 @@ def get_flows(
     return results
 
 
-def insert_energies(results: list[dict], network: NetworkSchema) -> int:
+def _dedupe_energy_frame(esdf: pd.DataFrame) -> pd.DataFrame:
+    """Dedupes energy rows on primary key the same way as the record path. The last row of a
+    consecutive run of a key is kept and only the first run of each key"""
+    primary_keys = ["trading_interval", "network_id", "facility_code"]
+    keys = esdf[primary_keys]
+
+    run_end = ~(keys.shift(-1) == keys).all(axis=1)
+
+    return esdf[run_end].drop_duplicates(subset=primary_keys, keep="first")
+
+
+def insert_energies(results: list[dict], network: NetworkSchema, binary: bool | None = None) -> int:
     """Takes a list of generation values and calculates energies and bulk-inserts
-    into the database"""
+    into the database
+
+    With binary the energy frame is sent with binary copy from its typed columns rather than
+    through records and csv, which defaults to the db_bulk_insert_binary setting"""
 
     # Get the energy sums as a dataframe
     esdf = energy_sum(results, network=network)
@@ -229,6 +245,21 @@ def insert_energies(results: list[dict], network: NetworkSchema) -> int:
     ]
     esdf = esdf[columns]
 
+    if binary is None:
+        binary = settings.db_bulk_insert_binary
+
+    if binary:
+        if esdf.empty:
+            logger.warning("No records returned from energy sum")
+            return 0
+
+        num_records = staged_upsert(
+            FacilityScada, _dedupe_energy_frame(esdf), ["updated_at", "eoi_quantity"], binary=True
+        ).records
+        logger.info(f"Inserted {num_records} records")
+
+        return num_records
+
     records_to_store: list[dict] = esdf.to_dict("records")
 
     for record in records_to_store[:5]:
@@ -0,0 +1,265 @@
+"""
+NEMWeb new file watcher
+
+Long running watcher for the live NEMWeb directories. Around each expected publish time the
+listings are polled every few seconds with a conditional GET, which is a 304 until AEMO
+publishes, and the matching crawl task is enqueued as soon as a new file shows up rather than
+waiting for the next crontab tick or huey retry.
+
+For each file the publication to ingest latency is recorded from the listing modified time and
+the time the crawl stored the file in crawl_history.
+
+run with:
+
+$ python -m opennem.workers.nemweb_watcher
+"""
+import logging
+import statistics
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from huey.exceptions import RetryTask
+from sqlalchemy import bindparam
+from sqlalchemy import text as sql
+
+from opennem import settings
+from opennem.core.crawlers.schema import CrawlerDefinition
+from opennem.core.parsers.dirlisting import DirlistingEntry, get_dirlisting
+from opennem.crawlers.nemweb import AEMONemwebDispatchIS, AEMONemwebTradingIS, AEMONNemwebDispatchScada
+from opennem.db import get_database_engine
+from opennem.schema.network import NetworkNEM
+
+logger = logging.getLogger("opennem.workers.nemweb_watcher")
+
+# latencies kept per feed for the summary
+NEMWEB_WATCHER_LATENCY_HISTORY = 288
+
+# files the crawl has not stored after this long are dropped from the pending latencies
+NEMWEB_WATCHER_PENDING_EXPIRY = timedelta(minutes=30)
+
+
+@dataclass
+class FileLatency:
+    filename: str
+    interval: datetime | None
+    published: datetime
+    detected: datetime
+    ingested: datetime | None = None
+
+    @property
+    def detect_latency(self) -> timedelta:
+        return self.detected - self.published
+
+    @property
+    def ingest_latency(self) -> timedelta | None:
+        return self.ingested - self.published if self.ingested else None
+
+
+@dataclass
+class WatchedFeed:
+    """A live directory and the name of the scheduler task that crawls it"""
+
+    crawler: CrawlerDefinition
+    task_name: str
+    primed: bool = False
+    pending: list[FileLatency] = field(default_factory=list)
+    latencies: deque[FileLatency] = field(default_factory=lambda: deque(maxlen=NEMWEB_WATCHER_LATENCY_HISTORY))
+
+
+def get_watched_feeds() -> list[WatchedFeed]:
+    return [
+        WatchedFeed(crawler=AEMONemwebDispatchIS, task_name="watcher_run_nem_dispatch_is_crawl"),
+        WatchedFeed(crawler=AEMONNemwebDispatchScada, task_name="watcher_run_nem_dispatch_scada_crawl"),
+        WatchedFeed(crawler=AEMONemwebTradingIS, task_name="watcher_run_nem_trading_is_crawl"),
+    ]
+
+
+def _nem_aware(value: datetime) -> datetime:
+    # listing modified times are naive NEM time
+    return value.replace(tzinfo=NetworkNEM.get_fixed_offset()) if not value.tzinfo else value
+
+
+def get_poll_delay(now: datetime, interval_size: int, window: int, fast: float, slow: float) -> float:
+    """Seconds until the next poll. Fast for window seconds after each interval boundary
+    when files are published, otherwise slow and never past the next boundary"""
+    interval_seconds = interval_size * 60
+    seconds_into_interval = (now.minute * 60 + now.second + now.microsecond / 1e6) % interval_seconds
+
+    if seconds_into_interval < window:
+        return fast
+
+    return min(slow, interval_seconds - seconds_into_interval)
+
+
+def poll_feed(feed: WatchedFeed, enqueue: Callable[[WatchedFeed], Any]) -> list[DirlistingEntry]:
+    """Polls a feed listing and enqueues its crawl if there are new files. Returns the new files"""
+    dirlisting = get_dirlisting(feed.crawler.url, timezone="Australia/Brisbane")  # type: ignore
+
+    if not dirlisting.modified:
+        return []
+
+    if feed.crawler.filename_filter:
+        dirlisting.apply_filter(feed.crawler.filename_filter)
+
+    new_files = dirlisting.get_new_files()
+
+    # the first fetch of a listing has every file as new
+    if not feed.primed:
+        feed.primed = True
+        return []
+
+    if not new_files:
+        return []
+
+    detected = datetime.now(NetworkNEM.get_fixed_offset())
+
+    logger.info(f"{feed.crawler.name}: {len(new_files)} new files. Enqueueing {feed.task_name}")
+
+    enqueue(feed)
+
+    feed.pending += [
+        FileLatency(
+            filename=str(f.filename),
+            interval=f.aemo_interval_date,
+            published=_nem_aware(f.modified_date),
+            detected=detected,
+        )
+        for f in new_files
+        if f.modified_date
+    ]
+
+    return new_files
+
+
+def get_ingested_times(crawler_name: str, intervals: list[datetime]) -> dict[datetime, datetime]:
+    """When the crawl stored each interval"""
+    stmt = sql(
+        """
+        select
+            ch.interval::timestamp,
+            ch.processed_time
+        from crawl_history ch
+        where
+            ch.crawler_name = :crawler_name
+            and ch.interval::timestamp in :intervals
+            and ch.inserted_records is not null
+    """
+    ).bindparams(bindparam("intervals", expanding=True))
+
+    with get_database_engine().connect() as c:
+        rows = c.execute(stmt, {"crawler_name": crawler_name, "intervals": intervals}).fetchall()
+
+    return dict(rows)
+
+
+def collect_latencies(
+    feed: WatchedFeed, get_ingested: Callable[[str, list[datetime]], dict[datetime, datetime]] = get_ingested_times
+) -> list[FileLatency]:
+    """Records the latency of pending files the crawl has stored"""
+    intervals = [f.interval for f in feed.pending if f.interval]
+
+    if not intervals:
+        feed.pending = []
+        return []
+
+    ingested = get_ingested(feed.crawler.name, intervals)
+    completed: list[FileLatency] = []
+
+    for file_latency in feed.pending:
+        if file_latency.interval in ingested:
+            file_latency.ingested = _nem_aware(ingested[file_latency.interval])
+            completed.append(file_latency)
+
+            logger.info(
+                f"{feed.crawler.name}: {file_latency.filename} published {file_latency.published}, "
+                f"detected after {file_latency.detect_latency}, ingested after {file_latency.ingest_latency}"
+            )
+
+    expire_before = datetime.now(NetworkNEM.get_fixed_offset()) - NEMWEB_WATCHER_PENDING_EXPIRY
+    expired = [f for f in feed.pending if f not in completed and f.detected < expire_before]
+
+    if expired:
+        logger.warning(f"{feed.crawler.name}: {len(expired)} files not ingested since {expired[0].detected}")
+
+    feed.pending = [f for f in feed.pending if f not in completed and f not in expired]
+    feed.latencies.extend(completed)
+
+    return completed
+
+
+def get_latency_summary(feed: WatchedFeed) -> str:
+    ingest_seconds = [f.ingest_latency.total_seconds() for f in feed.latencies if f.ingest_latency]
+
+    if not ingest_seconds:
+        return f"{feed.crawler.name}: no files ingested"
+
+    return (
+        f"{feed.crawler.name}: {len(ingest_seconds)} files, publish to ingest median "
+        f"{statistics.median(ingest_seconds):.0f}s max {max(ingest_seconds):.0f}s"
+    )
+
+
+def run_watched_crawl(crawl: Callable[[], Any]) -> None:
+    """Runs a crawl enqueued by the watcher once. The crontab run of the crawl retries when there is
+    nothing new so here that is not an error"""
+    try:
+        crawl()
+    except RetryTask as e:
+        logger.info(f"Watched crawl had nothing new: {e}")
+
+
+def _enqueue_scheduler_task(feed: WatchedFeed) -> Any:
+    # @NOTE imported here as the scheduler module sets up huey and sends a startup alert
+    from opennem.workers import scheduler
+
+    return getattr(scheduler, feed.task_name)()
+
+
+def run_nemweb_watcher(
+    feeds: list[WatchedFeed] | None = None,
+    enqueue: Callable[[WatchedFeed], Any] = _enqueue_scheduler_task,
+    iterations: int | None = None,
+) -> None:
+    """Polls the live feeds and enqueues their crawls as files are published. Runs until interrupted
+    or for a number of iterations"""
+    feeds = feeds or get_watched_feeds()
+    iteration = 0
+    last_summary = time.monotonic()
+
+    logger.info(f"Watching {', '.join(f.crawler.name for f in feeds)}")
+
+    while iterations is None or iteration < iterations:
+        iteration += 1
+
+        for feed in feeds:
+            try:
+                poll_feed(feed, enqueue)
+
+                if feed.pending:
+                    collect_latencies(feed)
+            except Exception as e:
+                logger.error(f"{feed.crawler.name} watcher error: {e}")
+
+        if time.monotonic() - last_summary > 60 * 60:
+            for feed in feeds:
+                logger.info(get_latency_summary(feed))
+
+            last_summary = time.monotonic()
+
+        time.sleep(
+            get_poll_delay(
+                datetime.now(NetworkNEM.get_fixed_offset()),
+                interval_size=NetworkNEM.interval_size,
+                window=settings.nemweb_watcher_window_sec,
+                fast=settings.nemweb_watcher_poll_sec,
+                slow=settings.nemweb_watcher_idle_poll_sec,
+            )
+        )
+
+
+if __name__ == "__main__":
+    run_nemweb_watcher()
@@ -18,6 +18,10 @@ from opennem.aggregates.facility_daily import run_facility_aggregates_for_latest
 from opennem.aggregates.network_demand import run_demand_aggregates_for_latest_interval  # noqa: F401
 from opennem.api.export.map import PriorityType
 from opennem.api.export.tasks import export_electricitymap, export_flows, export_metadata, export_power
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.crawlers.backfill import run_backfill_entry
+from opennem.core.crawlers.schema import CrawlerDefinition
+from opennem.core.parsers.dirlisting import DirlistingEntry
 from opennem.core.profiler import cleanup_database_task_profiles_basedon_retention
 from opennem.core.startup import worker_startup_alert
 from opennem.crawl import run_crawl
@@ -40,6 +44,7 @@ from opennem.workers.daily import energy_runner_hours
 from opennem.workers.daily_summary import run_daily_fueltech_summary
 from opennem.workers.facility_data_ranges import update_facility_seen_range
 from opennem.workers.facility_status import update_opennem_facility_status
+from opennem.workers.nemweb_watcher import run_watched_crawl
 from opennem.workers.network_data_range import run_network_data_range_update
 from opennem.workers.system import clean_tmp_dir
 
@@ -73,6 +78,26 @@ def crawler_run_nem_trading_is_crawl() -> None:
     nem_trading_is_crawl()
 
 
+# crawls enqueued by the nemweb watcher when a file is published. these share the lock of the
+# crontab crawl and don't retry
+@huey.task(priority=50)
+@huey.lock_task("crawler_run_nem_dispatch_scada_crawl")
+def watcher_run_nem_dispatch_scada_crawl() -> None:
+    run_watched_crawl(nem_dispatch_scada_crawl)
+
+
+@huey.task(priority=50)
+@huey.lock_task("crawler_run_nem_dispatch_is_crawl")
+def watcher_run_nem_dispatch_is_crawl() -> None:
+    run_watched_crawl(nem_dispatch_is_crawl)
+
+
+@huey.task(priority=50)
+@huey.lock_task("crawler_run_nem_trading_is_crawl")
+def watcher_run_nem_trading_is_crawl() -> None:
+    run_watched_crawl(nem_trading_is_crawl)
+
+
 @huey.periodic_task(
     network_interval_crontab(network=NetworkAEMORooftop, number_minutes=1), priority=50, retries=5, retry_delay=15
 )
@@ -125,6 +150,12 @@ def run_update_opennem_facility_status() -> None:
     update_opennem_facility_status()
 
 
+# archive backfill files queued by the backfill orchestrator
+@huey.task(retries=2, retry_delay=60)
+def run_backfill_entry_task(crawler: CrawlerDefinition, entry: DirlistingEntry) -> ControllerReturn:
+    return run_backfill_entry(crawler, entry)
+
+
 # export tasks
 @huey.periodic_task(crontab(minute="*/15"), priority=90)
 @huey.lock_task("schedule_custom_tasks")
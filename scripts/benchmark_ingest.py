@@ -0,0 +1,527 @@
+#!/usr/bin/env python
+"""OpenNEM ingest benchmark
+
+Offline benchmark of the NEMWeb ingest hot path. Generates fixture files sized like
+the real NEMWeb reports and times each stage of the ingest for each of them:
+
+    dirlisting -> open -> parse -> process -> copy
+
+The process stage runs the controllers.nem processors with their database calls
+replaced so only the record building is measured, and the copy stage builds the
+COPY buffers that staged_upsert sends, or the binary copy stream with --binary.
+Pass --database to store into the configured database instead.
+
+Each fixture is run in its own process so the peak RSS reported is per fixture.
+Results are compared against a stored baseline which can be refreshed with
+--save-baseline after a change is accepted.
+
+    python -m scripts.benchmark_ingest
+    python -m scripts.benchmark_ingest --fixture dispatch_scada --rounds 5
+    python -m scripts.benchmark_ingest --scale 0.1
+    python -m scripts.benchmark_ingest --binary
+"""
+
+import json
+import logging
+import multiprocessing
+import platform
+import queue
+import random
+import resource
+import sys
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Any
+from unittest import mock
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import click
+
+logger = logging.getLogger("opennem.benchmark_ingest")
+
+BASELINE_PATH = Path(__file__).parent / "benchmark_ingest_baseline.json"
+
+# flag a stage that is this much slower than baseline
+REGRESSION_THRESHOLD = 0.2
+
+NEM_REGIONS = ["NSW1", "QLD1", "SA1", "TAS1", "VIC1"]
+NEM_INTERCONNECTORS = ["N-Q-MNSP1", "NSW1-QLD1", "T-V-MNSP1", "V-S-MNSP1", "V-SA", "VIC1-NSW1"]
+ROOFTOP_REGIONS = NEM_REGIONS + ["QLDC", "QLDN", "QLDS", "TASN", "TASS", "NSW1X", "VIC1X"]
+
+# real files have between 400 and 500 units reporting each interval
+UNIT_COUNT = 480
+
+
+@dataclass
+class TableSpec:
+    """A table in a generated fixture"""
+
+    namespace: str
+    name: str
+    version: int
+    fields: dict[str, str]
+    keys: list[str]
+    intervals: int = 1
+    interval_minutes: int = 5
+    interval_field: str = "settlementdate"
+
+
+@dataclass
+class FixtureSpec:
+    """A generated fixture file modelled on a NEMWeb report"""
+
+    name: str
+    report: str
+    directory: str
+    tables: list[TableSpec] = field(default_factory=list)
+
+
+def _fields(spec: str) -> dict[str, str]:
+    """Field definitions as a string of name:kind pairs"""
+    return dict(i.split(":") for i in spec.split())
+
+
+_PRICE_FIELDS = _fields(
+    "settlementdate:date runno:int regionid:key dispatchinterval:int intervention:int rrp:float eep:int rop:float "
+    "apcflag:int marketsuspendedflag:int lastchanged:date raise6secrrp:float raise6secrop:float "
+    "raise60secrrp:float raise60secrop:float raise5minrrp:float raise5minrop:float raiseregrrp:float "
+    "raiseregrop:float lower6secrrp:float lower6secrop:float lower60secrrp:float lower60secrop:float "
+    "lower5minrrp:float lower5minrop:float lowerregrrp:float lowerregrop:float price_status:str"
+)
+
+_REGIONSUM_FIELDS = _fields(
+    "settlementdate:date runno:int regionid:key dispatchinterval:int intervention:int totaldemand:float "
+    "availablegeneration:float availableload:float demandforecast:float dispatchablegeneration:float "
+    "dispatchableload:float netinterchange:float excessgeneration:float lower5mindispatch:float "
+    "lower5minimport:float lower5minlocaldispatch:float lower5minlocalprice:float lower5minlocalreq:float "
+    "lower5minprice:float lower5minreq:float lower5minsupplyprice:float lower60secdispatch:float "
+    "lower60secimport:float lower60seclocaldispatch:float lower60seclocalprice:float lower60seclocalreq:float "
+    "lower60secprice:float lower60secreq:float lower60secsupplyprice:float lower6secdispatch:float "
+    "lower6secimport:float lower6seclocaldispatch:float lower6seclocalprice:float lower6seclocalreq:float "
+    "lower6secprice:float lower6secreq:float lower6secsupplyprice:float raise5mindispatch:float "
+    "raise5minimport:float raise5minlocaldispatch:float raise5minlocalprice:float raise5minlocalreq:float "
+    "raise5minprice:float raise5minreq:float raise5minsupplyprice:float raise60secdispatch:float "
+    "raise60secimport:float raise60seclocaldispatch:float raise60seclocalprice:float raise60seclocalreq:float "
+    "raise60secprice:float raise60secreq:float raise60secsupplyprice:float raise6secdispatch:float "
+    "raise6secimport:float raise6seclocaldispatch:float raise6seclocalprice:float raise6seclocalreq:float "
+    "raise6secprice:float raise6secreq:float raise6secsupplyprice:float aggegatedispatcherror:float "
+    "initialsupply:float clearedsupply:float lastchanged:date totalintermittentgeneration:float "
+    "demand_and_nonschedgen:float uigf:float semischedule_clearedmw:float semischedule_compliancemw:float"
+)
+
+_INTERCONNECTORRES_FIELDS = _fields(
+    "settlementdate:date runno:int interconnectorid:key dispatchinterval:int intervention:int "
+    "meteredmwflow:float mwflow:float mwlosses:float marginalvalue:float violationdegree:float lastchanged:date "
+    "exportlimit:float importlimit:float marginalloss:float exportgenconid:str importgenconid:str "
+    "fcasexportlimit:float fcasimportlimit:float local_price_adjustment_export:float "
+    "locally_constrained_export:float local_price_adjustment_import:float locally_constrained_import:float"
+)
+
+_CONSTRAINT_FIELDS = _fields(
+    "settlementdate:date runno:int constraintid:key dispatchinterval:int intervention:int rhs:float "
+    "marginalvalue:float violationdegree:float lastchanged:date duid:str genconid_effectivedate:date "
+    "genconid_versionno:int lhs:float"
+)
+
+_UNIT_SOLUTION_FIELDS = _fields(
+    "settlementdate:date runno:int duid:key tradetype:int dispatchinterval:int intervention:int "
+    "connectionpointid:str dispatchmode:int agcstatus:int initialmw:float totalcleared:float "
+    "rampdownrate:float rampuprate:float lower5min:float lower60sec:float lower6sec:float raise5min:float "
+    "raise60sec:float raise6sec:float downepf:float upepf:float marginal5minvalue:float "
+    "marginal60secvalue:float marginal6secvalue:float marginalvalue:float violation5mindegree:float "
+    "violation60secdegree:float violation6secdegree:float violationdegree:float lastchanged:date "
+    "lowerreg:float raisereg:float availability:float raise6secflags:int raise60secflags:int "
+    "raise5minflags:int raiseregflags:int lower6secflags:int lower60secflags:int lower5minflags:int "
+    "lowerregflags:int semidispatchcap:int"
+)
+
+FIXTURES: dict[str, FixtureSpec] = {
+    "dispatch_is": FixtureSpec(
+        name="dispatch_is",
+        report="PUBLIC_DISPATCHIS",
+        directory="DispatchIS_Reports",
+        tables=[
+            TableSpec("DISPATCH", "PRICE", 5, _PRICE_FIELDS, NEM_REGIONS),
+            TableSpec("DISPATCH", "REGIONSUM", 8, _REGIONSUM_FIELDS, NEM_REGIONS),
+            TableSpec("DISPATCH", "INTERCONNECTORRES", 3, _INTERCONNECTORRES_FIELDS, NEM_INTERCONNECTORS),
+            TableSpec("DISPATCH", "CONSTRAINT", 5, _CONSTRAINT_FIELDS, [f"CONSTRAINT_{i}" for i in range(900)]),
+        ],
+    ),
+    "dispatch_scada": FixtureSpec(
+        name="dispatch_scada",
+        report="PUBLIC_DISPATCHSCADA",
+        directory="Dispatch_SCADA",
+        tables=[
+            TableSpec(
+                "DISPATCH",
+                "UNIT_SCADA",
+                1,
+                _fields("settlementdate:date duid:key scadavalue:float"),
+                [f"UNIT{i:03}" for i in range(UNIT_COUNT)],
+            )
+        ],
+    ),
+    "trading_is": FixtureSpec(
+        name="trading_is",
+        report="PUBLIC_TRADINGIS",
+        directory="TradingIS_Reports",
+        tables=[
+            TableSpec("TRADING", "PRICE", 3, _PRICE_FIELDS, NEM_REGIONS),
+            TableSpec("TRADING", "REGIONSUM", 4, _REGIONSUM_FIELDS, NEM_REGIONS),
+            TableSpec("TRADING", "INTERCONNECTORRES", 2, _INTERCONNECTORRES_FIELDS, NEM_INTERCONNECTORS),
+        ],
+    ),
+    "rooftop_pv_actual": FixtureSpec(
+        name="rooftop_pv_actual",
+        report="PUBLIC_ROOFTOP_PV_ACTUAL_MEASUREMENT",
+        directory="ROOFTOP_PV/ACTUAL",
+        tables=[
+            TableSpec(
+                "ROOFTOP",
+                "ACTUAL",
+                2,
+                _fields("interval_datetime:date type:str regionid:key power:float qi:float lastchanged:date"),
+                ROOFTOP_REGIONS,
+                interval_minutes=30,
+                interval_field="interval_datetime",
+            )
+        ],
+    ),
+    "rooftop_pv_forecast": FixtureSpec(
+        name="rooftop_pv_forecast",
+        report="PUBLIC_ROOFTOP_PV_FORECAST",
+        directory="ROOFTOP_PV/FORECAST",
+        tables=[
+            TableSpec(
+                "ROOFTOP",
+                "FORECAST",
+                1,
+                _fields(
+                    "version_datetime:date regionid:key interval_datetime:date powermean:float powerpoe50:float "
+                    "powerpoelow:float powerpoehigh:float lastchanged:date"
+                ),
+                ROOFTOP_REGIONS,
+                intervals=336,
+                interval_minutes=30,
+                interval_field="interval_datetime",
+            )
+        ],
+    ),
+    "next_day_dispatch": FixtureSpec(
+        name="next_day_dispatch",
+        report="PUBLIC_NEXT_DAY_DISPATCH",
+        directory="Next_Day_Dispatch",
+        tables=[
+            TableSpec(
+                "DISPATCH",
+                "UNIT_SOLUTION",
+                4,
+                _UNIT_SOLUTION_FIELDS,
+                [f"UNIT{i:03}" for i in range(UNIT_COUNT)],
+                intervals=288,
+            )
+        ],
+    ),
+}
+
+FIXTURE_START = datetime(2023, 3, 1, 0, 5)
+
+
+def _mms_date(dt: datetime) -> str:
+    return f'"{dt.strftime("%Y/%m/%d %H:%M:%S")}"'
+
+
+def generate_fixture_csv(spec: FixtureSpec, scale: float = 1.0, seed: int = 0) -> tuple[str, int]:
+    """Generates an MMS CSV for a fixture spec and returns it with the number of D rows"""
+    rand = random.Random(seed)
+    row_count = 0
+
+    lines = [
+        f"C,NEMP.WORLD,{spec.report[7:]},AEMO,PUBLIC,{FIXTURE_START.strftime('%Y/%m/%d')},"
+        f"{FIXTURE_START.strftime('%H:%M:%S')},0000000380000000,{spec.report[7:]},0000000380000000"
+    ]
+
+    for table in spec.tables:
+        lines.append(
+            ",".join(["I", table.namespace, table.name, str(table.version)] + [f.upper() for f in table.fields])
+        )
+
+        intervals = max(1, round(table.intervals * scale)) if table.intervals > 1 else 1
+        # only the large single interval tables are scaled by their keys
+        keys = table.keys
+
+        if table.intervals == 1 and len(keys) > 100:
+            keys = keys[: max(1, round(len(keys) * scale))]
+
+        for interval in range(intervals):
+            interval_date = FIXTURE_START + timedelta(minutes=table.interval_minutes * interval)
+
+            for key in keys:
+                values = []
+
+                for fieldname, kind in table.fields.items():
+                    match kind:
+                        case "date":
+                            values.append(
+                                _mms_date(interval_date if fieldname == table.interval_field else FIXTURE_START)
+                            )
+                        case "key":
+                            values.append(key)
+                        case "int":
+                            values.append(str(rand.randint(0, 3)))
+                        case "float":
+                            values.append(f"{rand.uniform(-100, 3000):.5f}")
+                        case _:
+                            values.append("")
+
+                lines.append(",".join(["D", table.namespace, table.name, str(table.version)] + values))
+                row_count += 1
+
+    lines.append(f'C,"END OF REPORT",{len(lines) + 1}')
+
+    return "\r\n".join(lines) + "\r\n", row_count
+
+
+def generate_fixture(spec: FixtureSpec, directory: Path, scale: float = 1.0) -> tuple[Path, int]:
+    """Writes a zipped fixture into directory as it would be served by NEMWeb"""
+    content, row_count = generate_fixture_csv(spec, scale=scale)
+    filename = f"{spec.report}_{FIXTURE_START.strftime('%Y%m%d%H%M')}_0000000380000000"
+
+    zip_path = directory / f"{filename}.zip"
+
+    with ZipFile(zip_path, "w", compression=ZIP_DEFLATED) as zf:
+        zf.writestr(f"{filename}.CSV", content)
+
+    return zip_path, row_count
+
+
+def generate_dirlisting(spec: FixtureSpec, entries: int = 3000) -> tuple[str, str]:
+    """Generates an IIS directory listing for a fixture directory as served by NEMWeb"""
+    url = f"http://nemweb.com.au/Reports/Current/{spec.directory}/"
+    lines = [f'<a href="{url}../">[To Parent Directory]</a><br><br>']
+
+    for i in range(entries):
+        dt = FIXTURE_START + timedelta(minutes=5 * i)
+        filename = f"{spec.report}_{dt.strftime('%Y%m%d%H%M')}_{380000000 + i:016}.zip"
+
+        lines.append(
+            f"{dt.strftime('%A, %B %-d, %Y %-I:%M %p'):>40}        18166 "
+            f'<a href="{url}{filename}">{filename}</a><br>'
+        )
+
+    return f"<html><body><pre>{''.join(lines)}</pre></body></html>", url
+
+
+@contextmanager
+def _stub_shared_connection(*args: Any, **kwargs: Any) -> Generator[Any, None, None]:
+    """Stands in for the database connection shared by the processors"""
+    yield mock.MagicMock()
+
+
+def _run_stage(timings: dict[str, float], stage: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+    return result
+
+
+def _encode_binary_copy(table: Any, records: list[dict]) -> bytes:
+    from opennem.db.bulk_insert_binary import get_binary_copy_columns, iter_binary_copy
+
+    return b"".join(iter_binary_copy(get_binary_copy_columns(table, records)))
+
+
+def run_fixture(
+    name: str, scale: float = 1.0, rounds: int = 3, database: bool = False, binary: bool = False
+) -> dict[str, Any]:
+    """Runs the ingest stages for a fixture and returns the best time per stage"""
+    from opennem.controllers import nem as nem_controller
+    from opennem.core.downloader import file_opener
+    from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+    from opennem.core.parsers.dirlisting import parse_dirlisting
+    from opennem.db.bulk_insert_csv import BulkInsertResult, generate_bulkinsert_csv_from_records
+
+    spec = FIXTURES[name]
+    directory = Path(mkdtemp(prefix="opennem_benchmark_"))
+    zip_path, row_count = generate_fixture(spec, directory, scale=scale)
+    dirlisting_content, dirlisting_url = generate_dirlisting(spec)
+    projection = nem_controller.get_table_projection()
+    copy_encoder = _encode_binary_copy if binary else generate_bulkinsert_csv_from_records
+
+    best: dict[str, float] = {}
+    records_stored = 0
+
+    for _ in range(rounds):
+        timings: dict[str, float] = {}
+        copy_batches: list[tuple[Any, list[dict]]] = []
+
+        def _capture_bulkinsert(
+            table: Any, records: list[dict], *args: Any, copy_batches: list = copy_batches, **kwargs: Any
+        ) -> Any:
+            copy_batches.append((table, records))
+            return BulkInsertResult(records=len(records), changed=len(records))
+
+        _run_stage(timings, "dirlisting", parse_dirlisting, dirlisting_content, url=dirlisting_url)
+        content = _run_stage(timings, "open", file_opener, zip_path).decode("utf-8")
+        table_set = _run_stage(timings, "parse", parse_aemo_mms_csv, content, projection=projection)
+
+        if database:
+            cr = _run_stage(timings, "process", nem_controller.store_aemo_tableset, table_set)
+        else:
+            with mock.patch.object(nem_controller, "shared_connection", _stub_shared_connection), mock.patch.object(
+                nem_controller, "staged_upsert", _capture_bulkinsert
+            ):
+                cr = _run_stage(timings, "process", nem_controller.store_aemo_tableset, table_set)
+
+            for table, records in copy_batches:
+                _run_stage(timings, "copy", copy_encoder, table, records)
+
+        records_stored = cr.inserted_records
+
+        for stage, stage_time in timings.items():
+            best[stage] = min(best.get(stage, stage_time), stage_time)
+
+    # the dirlisting is parsed once per crawl rather than per file
+    total = sum(stage_time for stage, stage_time in best.items() if stage != "dirlisting")
+
+    return {
+        "fixture": name,
+        "rows": row_count,
+        "records_stored": records_stored,
+        "file_size": zip_path.stat().st_size,
+        "stages": best,
+        "total": total,
+        "rows_per_sec": row_count / total if total else 0,
+        # ru_maxrss is kilobytes on linux and bytes on macos
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    }
+
+
+def _run_fixture_worker(results: Any, name: str, scale: float, rounds: int, database: bool, binary: bool) -> None:
+    results.put(run_fixture(name, scale=scale, rounds=rounds, database=database, binary=binary))
+
+
+def run_fixture_isolated(
+    name: str, scale: float = 1.0, rounds: int = 3, database: bool = False, binary: bool = False
+) -> dict[str, Any]:
+    """Runs a fixture in a fresh process so peak RSS covers only that fixture"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_fixture_worker, args=(results, name, scale, rounds, database, binary))
+    process.start()
+
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise Exception(f"Benchmark process for {name} exited with {process.exitcode}") from None
+
+    process.join()
+
+    return result
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict[str, Any]:
+    if not path.is_file():
+        return {}
+
+    return json.loads(path.read_text())
+
+
+def write_baseline(results: list[dict[str, Any]], scale: float, path: Path = BASELINE_PATH) -> None:
+    baseline = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "fixtures": {r["fixture"]: r for r in results},
+    }
+
+    path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+def _format_change(current: float, previous: float | None) -> str:
+    if not previous:
+        return ""
+
+    change = (current - previous) / previous
+    flag = " !" if change > REGRESSION_THRESHOLD else ""
+
+    return f" ({change:+.0%}{flag})"
+
+
+def report_results(results: list[dict[str, Any]], baseline: dict[str, Any]) -> int:
+    """Prints the results against the baseline and returns the number of stage regressions"""
+    baseline_fixtures = baseline.get("fixtures", {})
+    regressions = 0
+
+    for result in results:
+        previous = baseline_fixtures.get(result["fixture"], {})
+        previous_stages = previous.get("stages", {})
+
+        click.echo(
+            f"{result['fixture']}: {result['rows']} rows, {result['records_stored']} stored, "
+            f"{result['rows_per_sec']:,.0f} rows/sec, "
+            f"peak rss {result['peak_rss_mb']:.0f}MB{_format_change(result['peak_rss_mb'], previous.get('peak_rss_mb'))}"
+        )
+
+        for stage, stage_time in result["stages"].items():
+            previous_time = previous_stages.get(stage)
+
+            if previous_time and (stage_time - previous_time) / previous_time > REGRESSION_THRESHOLD:
+                regressions += 1
+
+            click.echo(f"    {stage:<12} {stage_time * 1000:10.2f}ms{_format_change(stage_time, previous_time)}")
+
+    if baseline and baseline.get("scale") not in (None, results[0].get("scale")):
+        click.echo(f"Baseline was run at scale {baseline.get('scale')}")
+
+    return regressions
+
+
+@click.command()
+@click.option("--fixture", "fixtures", multiple=True, type=click.Choice(list(FIXTURES.keys())))
+@click.option("--scale", default=1.0, help="Scale the number of rows in the generated fixtures")
+@click.option("--rounds", default=3, help="Best of this many rounds per stage")
+@click.option("--database", is_flag=True, default=False, help="Store into the configured database")
+@click.option("--binary", is_flag=True, default=False, help="Encode the copy stage with binary copy")
+@click.option("--save-baseline", is_flag=True, default=False, help="Store these results as the baseline")
+@click.option("--baseline", "baseline_path", default=str(BASELINE_PATH), type=click.Path())
+def main(
+    fixtures: tuple[str, ...],
+    scale: float,
+    rounds: int,
+    database: bool,
+    binary: bool,
+    save_baseline: bool,
+    baseline_path: str,
+) -> None:
+    fixture_names = list(fixtures) or list(FIXTURES.keys())
+
+    results = []
+
+    for name in fixture_names:
+        result = run_fixture_isolated(name, scale=scale, rounds=rounds, database=database, binary=binary)
+        result["scale"] = scale
+        results.append(result)
+
+    regressions = report_results(results, load_baseline(Path(baseline_path)))
+
+    if save_baseline:
+        write_baseline(results, scale=scale, path=Path(baseline_path))
+        click.echo(f"Saved baseline to {baseline_path}")
+    elif regressions:
+        click.echo(f"{regressions} stages regressed more than {REGRESSION_THRESHOLD:.0%} against the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
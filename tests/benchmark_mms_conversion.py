@@ -0,0 +1,40 @@
+"""Benchmarks the per cell MMS date and DUID parse against the column converter"""
+import csv
+from pathlib import Path
+
+import pytest
+
+from opennem.core.parsers.aemo.mms import _parse_mms_record, convert_mms_rows
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures" / "aemo" / "PUBLIC_DVD_DISPATCHINTERCONNECTORRES_201503010000.CSV"
+
+
+def load_mms_rows(fixture_path: Path = FIXTURE_PATH) -> tuple[list[str], list[list[str]]]:
+    """Load the raw D rows and fieldnames for the first table in an MMS file"""
+    fieldnames: list[str] = []
+    rows: list[list[str]] = []
+
+    with fixture_path.open() as fh:
+        for row in csv.reader(fh):
+            if row[0] == "I" and not fieldnames:
+                fieldnames = [i.lower() for i in row[4:]]
+            elif row[0] == "D":
+                rows.append(row[4:])
+
+    return fieldnames, rows
+
+
+def parse_rows_per_cell(fieldnames: list[str], rows: list[list[str]]) -> list[dict]:
+    return [_parse_mms_record(fieldnames, values) for values in rows]
+
+
+@pytest.mark.benchmark(group="mms_column_conversion", min_rounds=1)
+def test_benchmark_mms_conversion_per_cell(benchmark) -> None:
+    fieldnames, rows = load_mms_rows()
+    benchmark(parse_rows_per_cell, fieldnames, rows)
+
+
+@pytest.mark.benchmark(group="mms_column_conversion", min_rounds=1)
+def test_benchmark_mms_conversion_columns(benchmark) -> None:
+    fieldnames, rows = load_mms_rows()
+    benchmark(convert_mms_rows, fieldnames, rows)
@@ -1,4 +1,24 @@
-from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+import io
+from collections.abc import Generator
+from datetime import datetime
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+
+from opennem.core.parsers.aemo import mms
+from opennem.core.parsers.aemo.mms import (
+    _parse_mms_record,
+    convert_mms_date_column,
+    convert_mms_rows,
+    parse_aemo_file,
+    parse_aemo_mms_csv,
+    parse_aemo_mms_csv_stream,
+    parse_aemo_url,
+    stream_aemo_file,
+    stream_aemo_url,
+)
+from opennem.utils.archive import iter_unzipped_chunks
 
 
 def test_parse_aemo_mms_dispatch_scada(aemo_nemweb_dispatch_scada: str) -> None:
@@ -24,3 +44,212 @@ def test_parse_aemo_mms_dispatch_scada(aemo_nemweb_dispatch_scada: str) -> None:
         raise Exception("Invalid record")
 
     # assert record.settlementdate, "Record has settlement date"  # type: ignore
+
+
+AEMO_MMS_SAMPLE = """C,NEMP.WORLD,DISPATCHIS,AEMO,PUBLIC,2021/09/02,12:50:10,0000000348376188,DISPATCHIS,0000000348376182
+I,DISPATCH,PRICE,5,SETTLEMENTDATE,RUNNO,REGIONID,DISPATCHINTERVAL,INTERVENTION,RRP
+D,DISPATCH,PRICE,5,"2021/09/02 12:55:00",1,NSW1,20210902151,0,45.5
+D,DISPATCH,PRICE,5,"2021/09/02 12:55:00",1,QLD1,20210902151,0,41.2
+D,DISPATCH,PRICE,5,"2021/09/02 12:55:00",1,SA1,20210902151,0,-10.0
+I,DISPATCH,UNIT_SCADA,1,SETTLEMENTDATE,DUID,SCADAVALUE
+D,DISPATCH,UNIT_SCADA,1,"2021/09/02 12:55:00",bw01,660.1
+D,DISPATCH,UNIT_SCADA,1,"2021/09/02 12:55:00",BW02,0
+C,"END OF REPORT",8
+"""
+
+
+def test_parse_aemo_mms_csv_stream_batches() -> None:
+    batches = list(parse_aemo_mms_csv_stream(io.BytesIO(AEMO_MMS_SAMPLE.encode()), batch_size=2))
+
+    assert [(b.table_name, len(b.records)) for b in batches] == [
+        ("dispatch_price", 2),
+        ("dispatch_price", 1),
+        ("dispatch_unit_scada", 2),
+    ]
+
+    table_name, fieldnames, records = batches[-1]
+
+    assert fieldnames == ["settlementdate", "duid", "scadavalue"]
+    assert records[0]["duid"] == "BW01", "DUID is normalized"
+    assert records[0]["settlementdate"] == datetime.fromisoformat("2021-09-02T12:55:00+10:00")
+
+
+def test_parse_aemo_mms_csv_stream_matches_table_set() -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE)
+    batches = list(parse_aemo_mms_csv_stream(io.BytesIO(AEMO_MMS_SAMPLE.encode()), namespace_filter=["dispatch"]))
+
+    for table_name, _, records in batches:
+        table = table_set.get_table(table_name)
+
+        assert table, f"Has table {table_name}"
+        assert table.records == records, "Streamed records match"
+
+
+def test_parse_aemo_mms_csv_columnar() -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE)
+    table_set_columnar = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, columnar=True)
+
+    for table in table_set.tables:
+        table_columnar = table_set_columnar.get_table(table.full_name)
+
+        assert table_columnar, f"Has table {table.full_name}"
+        assert table_columnar.columnar, "Table is columnar"
+        assert not table_columnar.records, "Columnar table has no row records"
+        assert table_columnar.record_count == len(table.records)
+        assert list(table_columnar.iter_records()) == table.records, "Records match row storage"
+        assert table_columnar.to_frame().equals(table.to_frame()), "Frames match row storage"
+
+
+def test_parse_aemo_mms_csv_columnar_merge() -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, columnar=True)
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, table_set=table_set, columnar=True)
+
+    table = table_set.get_table("dispatch_unit_scada")
+
+    assert table, "Has table"
+    assert table.record_count == 4, "Merged columnar tables"
+    assert len(table.get_column("duid")) == 4
+
+
+def test_convert_mms_rows_matches_per_cell_parse() -> None:
+    fieldnames = ["settlementdate", "duid", "scadavalue"]
+    rows = [
+        ["2021/09/02 12:55:00", "bw01", "660.1"],
+        ["2021/09/02 12:55:00", " Bw02 ", "0"],
+        ["2021-09-02 13:00:00", "ER01", "1.5"],
+        ["2021/09/02 13:00:00", "-", ""],
+    ]
+
+    records = convert_mms_rows(fieldnames, rows)
+    records_per_cell = [_parse_mms_record(fieldnames, values) for values in rows]
+
+    assert records == records_per_cell, "Column conversion matches per cell parse"
+
+    for record, record_per_cell in zip(records, records_per_cell, strict=True):
+        assert record["settlementdate"].tzinfo == record_per_cell["settlementdate"].tzinfo, "Same timezone"
+
+
+def test_convert_mms_date_column_missing_values() -> None:
+    column = convert_mms_date_column(["2021/09/02 12:55:00", "", None])
+
+    assert str(column.tz) == "UTC+10:00", "Column is in NEM time"
+    assert column[0] == datetime.fromisoformat("2021-09-02T12:55:00+10:00")
+    assert column[1:].isna().all(), "Missing values are NaT"
+
+
+def test_aemo_table_set_lookup_and_merge() -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE)
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, table_set=table_set)
+
+    assert table_set.table_names == ["dispatch_price", "dispatch_unit_scada"], "Repeated tables are merged"
+    assert table_set.has_table("dispatch_price"), "Lookup by full name"
+    assert table_set.has_table("unit_scada"), "Lookup by name"
+    assert not table_set.has_table("trading_price"), "Missing table"
+
+    table = table_set.get_table("price")
+
+    assert table and table.full_name == "dispatch_price"
+    assert len(table.records) == 6, "Records are merged"
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_parse_aemo_mms_csv_concatenated_reports(columnar: bool) -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE * 2, columnar=columnar)
+
+    assert [(t.full_name, t.record_count) for t in table_set.tables] == [
+        ("dispatch_price", 6),
+        ("dispatch_unit_scada", 4),
+    ], "The end of report row does not merge the last table into itself"
+
+    table = table_set.get_table("dispatch_unit_scada")
+
+    assert table
+    table_set.add_table(table)
+
+    assert table.record_count == 4, "Adding a table already in the set is a no-op"
+
+
+def test_parse_aemo_mms_csv_projection() -> None:
+    projection = {"dispatch_unit_scada": ["settlementdate", "duid"], "trading_price": None}
+    table_set = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, projection=projection)
+
+    assert table_set.table_names == ["dispatch_unit_scada"], "Only projected tables are parsed"
+
+    table = table_set.get_table("dispatch_unit_scada")
+
+    assert table and table.fieldnames == ["settlementdate", "duid"], "Only projected columns are kept"
+    assert table.records[0] == {"settlementdate": datetime.fromisoformat("2021-09-02T12:55:00+10:00"), "duid": "BW01"}
+
+    batches = list(parse_aemo_mms_csv_stream(io.BytesIO(AEMO_MMS_SAMPLE.encode()), projection=projection))
+
+    assert [(b.table_name, b.fieldnames) for b in batches] == [("dispatch_unit_scada", ["settlementdate", "duid"])]
+    assert batches[0].records == table.records, "Streamed projection matches"
+
+
+def test_parse_aemo_file_bytes_path_matches_str(tmp_path: Path) -> None:
+    # quoted comma in a value goes through the csv fallback
+    content = AEMO_MMS_SAMPLE.replace(
+        'C,"END OF REPORT",8', 'D,DISPATCH,UNIT_SCADA,1,"2021/09/02 13:00:00","ER,01",12\nC,"END OF REPORT",8'
+    )
+    file_path = tmp_path / "PUBLIC_DISPATCHIS_202109021255.CSV"
+    file_path.write_text(content)
+
+    projection = {"dispatch_unit_scada": ["settlementdate", "duid", "scadavalue"], "dispatch_price": None}
+
+    for _projection in [None, projection]:
+        table_set = parse_aemo_mms_csv(content, projection=_projection)
+        table_set_file = parse_aemo_file(str(file_path), projection=_projection)
+
+        assert table_set_file.table_names == table_set.table_names
+        for table in table_set.tables:
+            table_file = table_set_file.get_table(table.full_name)
+            assert table_file and table_file.records == table.records, "Bytes path matches str path"
+
+        batches = list(stream_aemo_file(str(file_path), batch_size=2, projection=_projection))
+        assert sum(len(b.records) for b in batches) == sum(len(t.records) for t in table_set.tables)
+
+    table = parse_aemo_file(str(file_path)).get_table("dispatch_unit_scada")
+    assert table and table.records[-1]["duid"] == "ER,01"
+
+
+def test_stream_aemo_url_nested_zip(monkeypatch: pytest.MonkeyPatch) -> None:
+    inner = io.BytesIO()
+
+    with ZipFile(inner, "w") as zf:
+        zf.writestr("PUBLIC_DISPATCHIS_1.CSV", AEMO_MMS_SAMPLE)
+
+    outer = io.BytesIO()
+
+    with ZipFile(outer, "w") as zf:
+        zf.writestr("PUBLIC_DISPATCHIS_1.zip", inner.getvalue())
+        zf.writestr("PUBLIC_DISPATCHIS_2.CSV", AEMO_MMS_SAMPLE)
+
+    content = outer.getvalue()
+    chunks = [content[i : i + 64] for i in range(0, len(content), 64)]
+
+    monkeypatch.setattr(mms, "url_stream_downloader", lambda url: iter_unzipped_chunks(chunks))
+
+    batches = list(stream_aemo_url("https://nemweb.com.au/test.zip"))
+    expected = list(parse_aemo_mms_csv_stream(io.BytesIO(AEMO_MMS_SAMPLE.encode())))
+
+    assert batches == expected + expected
+
+
+def test_parse_aemo_url_streams_download(monkeypatch: pytest.MonkeyPatch) -> None:
+    content = AEMO_MMS_SAMPLE.encode()
+    monkeypatch.setattr(mms, "url_stream_downloader", lambda url: iter([content[i : i + 64] for i in range(0, len(content), 64)]))
+
+    table_set = parse_aemo_url("https://nemweb.com.au/test.zip")
+    expected = parse_aemo_mms_csv(AEMO_MMS_SAMPLE)
+
+    assert table_set.table_names == expected.table_names
+    assert [t.records for t in table_set.tables] == [t.records for t in expected.tables], "Streamed parse matches"
+
+    def _bad_download(url: str) -> Generator[bytes, None, None]:
+        raise Exception("Bad link returned 404")
+        yield b""
+
+    monkeypatch.setattr(mms, "url_stream_downloader", _bad_download)
+
+    with pytest.raises(Exception, match="Could not fetch AEMO url https://nemweb.com.au/missing.zip"):
+        parse_aemo_url("https://nemweb.com.au/missing.zip")
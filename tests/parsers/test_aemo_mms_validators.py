@@ -0,0 +1,108 @@
+from typing import Any
+
+import pytest
+
+from opennem.core.parsers.aemo.mms import AEMOTableSchema, convert_mms_rows, parse_aemo_mms_csv
+from opennem.core.parsers.aemo.mms_validators import compile_mms_validator
+from opennem.schema.aemo.mms import DispatchUnitScada, DispatchUnitSolutionSchema, MMSDispatchUnitScada, RooftopActual
+
+
+def _per_row_records(schema: Any, fieldnames: list[str], rows: list[list[str]]) -> list[Any]:
+    table = AEMOTableSchema(name="test", namespace="test", fieldnames=fieldnames)
+    table.set_schema(schema)
+
+    for record in convert_mms_rows(fieldnames, rows):
+        table.add_record(record)
+
+    return table.records
+
+
+def _compiled_records(schema: Any, fieldnames: list[str], rows: list[list[str]]) -> list[Any]:
+    table = AEMOTableSchema(name="test", namespace="test", fieldnames=fieldnames)
+    table.set_schema(schema)
+    table.add_validated_rows(rows)
+
+    return table.records
+
+
+@pytest.mark.parametrize(
+    ["schema", "fieldnames", "rows", "failed_rows"],
+    [
+        (
+            DispatchUnitScada,
+            ["settlementdate", "duid", "scadavalue"],
+            [
+                ["2021/09/02 12:55:00", "bw01", "660.1"],
+                ["2021/09/02 12:55:00", "BW02", ""],
+                ["", "BW03", "1.5"],
+                ["2021/09/02 12:55:00", "BW04", "1e3"],
+                ["2021/09/02 12:55:00", "BW05", " 12 "],
+            ],
+            [1, 2],
+        ),
+        (
+            DispatchUnitSolutionSchema,
+            ["settlementdate", "duid", "initialmw"],
+            [
+                ["2021/09/02 12:55:00", " bw01 ", "660.1"],
+                ["2021/09/02 12:55:00", "BW02", ""],
+                ["2021/09/02 12:55:00", "BW03", "bad"],
+            ],
+            [1, 2],
+        ),
+        (
+            RooftopActual,
+            ["interval_datetime", "lastchanged", "regionid", "power", "qi", "type"],
+            [
+                ["2021/09/02 12:30:00", "2021/09/02 12:31:00", "NSW1", "100.5", "0.8", "DAILY"],
+                ["2021/09/02 12:30:00", "2021/09/02 12:31:00", "QLD1", "x", "0.8", "DAILY"],
+            ],
+            [1],
+        ),
+        (
+            # missing a required field rejects every row
+            RooftopActual,
+            ["interval_datetime", "regionid", "power", "qi", "type"],
+            [["2021/09/02 12:30:00", "NSW1", "100.5", "0.8", "DAILY"]],
+            [0],
+        ),
+        (
+            MMSDispatchUnitScada,
+            ["settlementdate", "duid", "scadavalue"],
+            [["2021/09/02 12:55:00", "BW01", "1"]],
+            [],
+        ),
+    ],
+)
+def test_compiled_validator_matches_pydantic(
+    schema: Any, fieldnames: list[str], rows: list[list[str]], failed_rows: list[int]
+) -> None:
+    validator = compile_mms_validator(schema)
+    columns = {f: [r[i] for r in rows] for i, f in enumerate(fieldnames)}
+
+    assert validator.validate_columns(columns, len(rows)).failed_rows == failed_rows
+
+    per_row = _per_row_records(schema, fieldnames, rows)
+    compiled = _compiled_records(schema, fieldnames, rows)
+
+    assert len(per_row) == len(compiled) == len(rows) - len(failed_rows)
+
+    for per_row_record, compiled_record in zip(per_row, compiled, strict=True):
+        assert per_row_record == compiled_record
+
+
+def test_parse_aemo_mms_csv_table_schemas() -> None:
+    content = """I,DISPATCH,UNIT_SOLUTION,2,SETTLEMENTDATE,DUID,INITIALMW
+D,DISPATCH,UNIT_SOLUTION,2,"2021/09/02 12:55:00",bw01,660.1
+D,DISPATCH,UNIT_SOLUTION,2,"2021/09/02 12:55:00",BW02,
+C,"END OF REPORT",3
+"""
+    table = parse_aemo_mms_csv(content, parse_table_schemas=True).get_table("unit_solution")
+
+    assert table and len(table.records) == 1
+
+    record = table.records[0]
+
+    assert isinstance(record, DispatchUnitSolutionSchema)
+    assert record.duid == "BW01"
+    assert record.initialmw == 660.1
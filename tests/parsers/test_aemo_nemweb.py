@@ -0,0 +1,74 @@
+import multiprocessing
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.parsers.aemo import nemweb
+from opennem.core.parsers.aemo.nemweb import store_aemo_files
+
+from .test_aemo_mms import AEMO_MMS_SAMPLE
+
+
+def _count_batches(batches) -> ControllerReturn:  # type: ignore
+    records = sum(len(b.records) for b in batches)
+    return ControllerReturn(total_records=records, processed_records=records, inserted_records=records)
+
+
+@pytest.fixture
+def aemo_csv_files(tmp_path: Path) -> list[Path]:
+    files = []
+
+    for i in range(4):
+        file_path = tmp_path / f"PUBLIC_DISPATCHIS_20210902125{i}.CSV"
+        file_path.write_text(AEMO_MMS_SAMPLE)
+        files.append(file_path)
+
+    return files
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_store_aemo_files(monkeypatch: pytest.MonkeyPatch, aemo_csv_files: list[Path], workers: int) -> None:
+    monkeypatch.setattr(nemweb, "store_aemo_table_batches", _count_batches)
+
+    cr = store_aemo_files(aemo_csv_files, workers=workers)
+
+    assert cr.processed_records == 4 * 5, "Aggregated records from every file"
+    assert cr.errors == 0
+
+
+def test_store_aemo_files_error_isolation(
+    monkeypatch: pytest.MonkeyPatch, aemo_csv_files: list[Path], tmp_path: Path
+) -> None:
+    monkeypatch.setattr(nemweb, "store_aemo_table_batches", _count_batches)
+
+    cr = store_aemo_files(aemo_csv_files + [tmp_path / "missing.CSV"], workers=2)
+
+    assert cr.processed_records == 4 * 5, "Other files are still stored"
+    assert cr.errors == 1, "Bad file is reported"
+    assert cr.error_detail and "missing.CSV" in cr.error_detail[0]
+
+
+def _store_aemo_files_in_daemon(files: list[Path], results: Any) -> None:
+    try:
+        cr = store_aemo_files(files, workers=2)
+        results.put((cr.processed_records, cr.errors))
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_store_aemo_files_in_daemon_process(monkeypatch: pytest.MonkeyPatch, aemo_csv_files: list[Path]) -> None:
+    """Huey process workers are daemonic and can't start a pool"""
+    monkeypatch.setattr(nemweb, "store_aemo_table_batches", _count_batches)
+
+    # fork so the patched store carries over to the daemon
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    daemon = context.Process(target=_store_aemo_files_in_daemon, args=(aemo_csv_files, results), daemon=True)
+    daemon.start()
+
+    try:
+        assert results.get(timeout=30) == (4 * 5, 0), "Stored every file without a pool"
+    finally:
+        daemon.join()
@@ -0,0 +1,22 @@
+import pytest
+
+from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+from opennem.core.parsers.dirlisting import parse_dirlisting
+from scripts.benchmark_ingest import FIXTURES, generate_dirlisting, generate_fixture_csv
+
+
+@pytest.mark.parametrize("fixture_name", list(FIXTURES.keys()))
+def test_benchmark_ingest_fixtures_parse(fixture_name: str) -> None:
+    spec = FIXTURES[fixture_name]
+    content, row_count = generate_fixture_csv(spec, scale=0.05)
+
+    table_set = parse_aemo_mms_csv(content)
+
+    assert len(table_set.tables) == len(spec.tables)
+    assert sum(t.record_count for t in table_set.tables) == row_count
+
+
+def test_benchmark_ingest_dirlisting_parses() -> None:
+    content, url = generate_dirlisting(FIXTURES["dispatch_scada"], entries=10)
+
+    assert len(parse_dirlisting(content, url=url).get_files()) == 10
@@ -0,0 +1,149 @@
+import struct
+from datetime import UTC, datetime, timedelta, timezone
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from opennem.db.bulk_insert_binary import (
+    PG_COPY_BINARY_HEADER,
+    BinaryCopyStream,
+    get_binary_copy_columns,
+    iter_binary_copy,
+)
+from opennem.db.bulk_insert_csv import build_binary_insert_query
+from opennem.db.models.opennem import FacilityScada
+from opennem.workers.energy import _dedupe_energy_frame
+
+NEM_TZ = timezone(timedelta(hours=10))
+
+
+def _decode_binary_copy(content: bytes) -> list[list[bytes | None]]:
+    """Decodes a binary copy stream into raw field values"""
+    assert content.startswith(PG_COPY_BINARY_HEADER)
+
+    position = len(PG_COPY_BINARY_HEADER)
+    rows: list[list[bytes | None]] = []
+
+    while True:
+        (field_count,) = struct.unpack_from(">h", content, position)
+        position += 2
+
+        if field_count == -1:
+            break
+
+        row: list[bytes | None] = []
+
+        for _ in range(field_count):
+            (length,) = struct.unpack_from(">i", content, position)
+            position += 4
+
+            if length == -1:
+                row.append(None)
+                continue
+
+            row.append(content[position : position + length])
+            position += length
+
+        rows.append(row)
+
+    assert position == len(content)
+
+    return rows
+
+
+def _pg_timestamp(value: bytes) -> datetime:
+    (micros,) = struct.unpack(">q", value)
+    return datetime(2000, 1, 1, tzinfo=UTC) + timedelta(microseconds=micros)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 1000])
+def test_binary_copy_encodes_values(chunk_rows: int) -> None:
+    columns: dict[str, tuple[str, Any]] = {
+        "interval": ("timestamptz", [datetime(2021, 1, 1, 10, 5, tzinfo=NEM_TZ), None, ""]),
+        "code": ("text", ["BW01", None, "héllo"]),
+        "value": ("float8", [1.5, float("nan"), "2"]),
+        "flag": ("bool", [True, None, False]),
+        "quality": ("int4", [1, 2, None]),
+    }
+
+    content = b"".join(iter_binary_copy(columns, chunk_rows=chunk_rows))
+    rows = _decode_binary_copy(content)
+
+    assert len(rows) == 3
+
+    assert _pg_timestamp(rows[0][0]) == datetime(2021, 1, 1, 0, 5, tzinfo=UTC)
+    assert rows[0][1] == b"BW01"
+    assert struct.unpack(">d", rows[0][2]) == (1.5,)
+    assert rows[0][3] == b"\x01"
+    assert struct.unpack(">i", rows[0][4]) == (1,)
+
+    assert rows[1] == [None, None, None, None, struct.pack(">i", 2)]
+
+    assert rows[2][0] is None
+    assert rows[2][1] == "héllo".encode()
+    assert struct.unpack(">d", rows[2][2]) == (2.0,)
+    assert rows[2][3] == b"\x00"
+    assert rows[2][4] is None
+
+
+def test_binary_copy_stream_reads() -> None:
+    chunks = [b"abc", b"", b"defgh"]
+    stream = BinaryCopyStream(chunks)
+
+    assert stream.read(2) == b"ab"
+    assert stream.read(4) == b"c"
+    assert stream.read(100) == b"defgh"
+    assert stream.read(1) == b""
+
+
+def test_binary_copy_facility_scada_frame() -> None:
+    frame = pd.DataFrame(
+        {
+            "created_by": ["test", "test"],
+            "created_at": ["", ""],
+            "updated_at": [datetime(2021, 1, 1, 12), datetime(2021, 1, 1, 12)],
+            "network_id": ["NEM", "NEM"],
+            "trading_interval": pd.to_datetime(["2021-01-01 10:00+10:00", "2021-01-01 10:05+10:00"]),
+            "facility_code": ["BW01", "BW01"],
+            "generated": [None, None],
+            "eoi_quantity": [1.25, 2.5],
+            "is_forecast": [False, False],
+            "energy_quality_flag": [0, 0],
+        }
+    )
+
+    columns = get_binary_copy_columns(FacilityScada, frame)
+
+    assert columns["trading_interval"][0] == "timestamptz"
+    assert columns["eoi_quantity"][0] == "float8"
+    assert columns["is_forecast"][0] == "bool"
+
+    rows = _decode_binary_copy(b"".join(iter_binary_copy(columns)))
+
+    assert rows[0][1] is None
+    assert _pg_timestamp(rows[1][4]) == datetime(2021, 1, 1, 0, 5, tzinfo=UTC)
+    assert struct.unpack(">d", rows[1][7]) == (2.5,)
+
+    query = build_binary_insert_query(
+        FacilityScada, {name: pg_type for name, (pg_type, _) in columns.items()}, ["updated_at", "eoi_quantity"]
+    )
+
+    assert "FORMAT BINARY" in query
+    assert "eoi_quantity float8" in query
+    assert "eoi_quantity = EXCLUDED.eoi_quantity" in query
+
+
+def test_dedupe_energy_frame_matches_records() -> None:
+    frame = pd.DataFrame(
+        {
+            "trading_interval": [1, 1, 2, 1, 3],
+            "network_id": ["NEM"] * 5,
+            "facility_code": ["A"] * 5,
+            "eoi_quantity": [10, 11, 20, 12, 30],
+        }
+    )
+
+    deduped = _dedupe_energy_frame(frame)
+
+    assert deduped["eoi_quantity"].tolist() == [11, 20, 30]
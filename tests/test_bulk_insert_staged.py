@@ -0,0 +1,170 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from opennem.db import bulk_insert_csv, isolated_bulk_inserts
+from opennem.db.bulk_insert_csv import build_insert_query, get_staging_table_name, staged_upsert
+from opennem.db.models.opennem import BalancingSummary, FacilityScada
+
+
+class _FakeEngine:
+    """Hands out mock raw connections and records what they were sent"""
+
+    def __init__(self, fail_chunk: int | None = None, changed_per_chunk: int = 0) -> None:
+        self.connections: list[Any] = []
+        self.fail_chunk = fail_chunk
+        self.changed_per_chunk = changed_per_chunk
+        self._lock = threading.Lock()
+
+    def raw_connection(self) -> Any:
+        conn = mock.MagicMock()
+
+        with self._lock:
+            chunk_index = len(self.connections)
+            self.connections.append(conn)
+
+        def _copy_expert(query: str, content: Any, *args: Any, **kwargs: Any) -> None:
+            if chunk_index == self.fail_chunk:
+                raise Exception("copy failed")
+
+        conn.cursor.return_value.copy_expert.side_effect = _copy_expert
+        conn.cursor.return_value.rowcount = self.changed_per_chunk
+
+        return conn
+
+
+def _facility_scada_records(count: int) -> list[dict]:
+    interval = datetime(2021, 1, 1, tzinfo=timezone(timedelta(hours=10)))
+
+    return [
+        {
+            "created_by": "test",
+            "created_at": None,
+            "updated_at": None,
+            "network_id": "NEM",
+            "trading_interval": interval + timedelta(minutes=5 * i),
+            "facility_code": "BW01",
+            "generated": float(i),
+            "eoi_quantity": None,
+            "is_forecast": False,
+            "energy_quality_flag": 0,
+        }
+        for i in range(count)
+    ]
+
+
+def test_staging_table_names_are_unique() -> None:
+    names = {get_staging_table_name(FacilityScada) for _ in range(100)}
+
+    assert len(names) == 100
+    assert all(len(n) <= 63 for n in names)
+
+    # two queries built in the same second no longer share a staging table
+    assert build_insert_query(FacilityScada) != build_insert_query(FacilityScada)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_staged_upsert_commits_each_chunk(monkeypatch: pytest.MonkeyPatch, binary: bool, workers: int) -> None:
+    engine = _FakeEngine(changed_per_chunk=2)
+    monkeypatch.setattr(bulk_insert_csv, "get_database_engine", lambda: engine)
+
+    result = staged_upsert(
+        FacilityScada, _facility_scada_records(25), ["generated"], binary=binary, chunk_size=10, workers=workers
+    )
+
+    assert result.records == 25
+    assert result.changed == 6
+    assert result.errors == 0
+    assert sorted(c.chunk for c in result.chunks) == [0, 1, 2]
+    assert [c.records for c in sorted(result.chunks, key=lambda c: c.chunk)] == [10, 10, 5]
+
+    assert len(engine.connections) == 3
+
+    for conn in engine.connections:
+        conn.commit.assert_called_once()
+        conn.close.assert_called_once()
+
+
+def test_staged_upsert_isolates_failed_chunk(monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = _FakeEngine(fail_chunk=1)
+    monkeypatch.setattr(bulk_insert_csv, "get_database_engine", lambda: engine)
+
+    result = staged_upsert(FacilityScada, _facility_scada_records(25), chunk_size=10, workers=1)
+
+    assert result.records == 15
+    assert result.errors == 1
+    assert result.chunks[1].error == "copy failed"
+
+    engine.connections[1].rollback.assert_called_once()
+    engine.connections[1].commit.assert_not_called()
+    engine.connections[2].commit.assert_called_once()
+
+
+def test_staged_upsert_joins_shared_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    shared_conn = mock.MagicMock()
+    shared_conn.connection.cursor.return_value.rowcount = 4
+    monkeypatch.setattr(bulk_insert_csv, "get_shared_connection", lambda: shared_conn)
+    monkeypatch.setattr(bulk_insert_csv, "get_database_engine", mock.MagicMock(side_effect=AssertionError))
+
+    result = staged_upsert(FacilityScada, _facility_scada_records(25), chunk_size=10, workers=3)
+
+    assert result.records == 25
+    assert result.changed == 12
+    assert len(result.chunks) == 3
+    assert shared_conn.connection.cursor.return_value.copy_expert.call_count == 3
+    shared_conn.connection.commit.assert_not_called()
+
+
+
+def test_staged_upsert_isolated_commits_chunks_in_shared_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Archive loads commit each chunk so it is visible to other connections before the load finishes"""
+    engine = _FakeEngine()
+    fake_raw_connection = engine.raw_connection
+    committed: list[int] = []
+    committed_at_copy: list[list[int]] = []
+
+    def _raw_connection() -> Any:
+        conn = fake_raw_connection()
+        chunk_index = len(engine.connections) - 1
+
+        conn.cursor.return_value.copy_expert.side_effect = lambda *args, **kwargs: committed_at_copy.append(list(committed))
+        conn.commit.side_effect = lambda: committed.append(chunk_index)
+
+        return conn
+
+    shared_conn = mock.MagicMock()
+    monkeypatch.setattr(engine, "raw_connection", _raw_connection)
+    monkeypatch.setattr(bulk_insert_csv, "get_shared_connection", lambda: shared_conn)
+    monkeypatch.setattr(bulk_insert_csv, "get_database_engine", lambda: engine)
+
+    with isolated_bulk_inserts():
+        result = staged_upsert(FacilityScada, _facility_scada_records(25), chunk_size=10, workers=1)
+
+    assert result.records == 25
+    assert committed_at_copy == [[], [0], [0, 1]], "Earlier chunks are committed while the load runs"
+    assert committed == [0, 1, 2]
+    shared_conn.connection.cursor.assert_not_called()
+
+def test_build_insert_query_changed_only() -> None:
+    query = build_insert_query(FacilityScada, ["updated_at", "generated", "eoi_quantity"], update_changed_only=True)
+
+    assert "generated = EXCLUDED.generated" in query
+    assert (
+        "WHERE (facility_scada.generated, facility_scada.eoi_quantity) IS DISTINCT FROM "
+        "(EXCLUDED.generated, EXCLUDED.eoi_quantity)" in query
+    )
+
+    # with coalesce the stored values are compared against what the update would write
+    query = build_insert_query(BalancingSummary, ["price"], update_coalesce=True, update_changed_only=True)
+
+    assert (
+        "WHERE (balancing_summary.price) IS DISTINCT FROM (COALESCE(EXCLUDED.price, balancing_summary.price))" in query
+    )
+
+    # bookkeeping columns alone never count as a change
+    assert "IS DISTINCT FROM" not in build_insert_query(FacilityScada, ["updated_at"], update_changed_only=True)
+    assert "IS DISTINCT FROM" not in build_insert_query(FacilityScada, ["generated"])
@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from opennem.controllers import nem
+from opennem.controllers.nem import (
+    BALANCING_SUMMARY_COLUMN_NAMES,
+    TABLE_PROCESSOR_MAP,
+    _get_table_records,
+    generate_balancing_summary_records,
+    generate_facility_scada,
+    get_table_projection,
+)
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+from opennem.db.bulk_insert_csv import BulkInsertResult, build_insert_query
+from opennem.db.models.opennem import BalancingSummary
+
+from .parsers.test_aemo_mms import AEMO_MMS_SAMPLE
+
+
+def test_generate_facility_scada_columnar_matches_records() -> None:
+    table = parse_aemo_mms_csv(AEMO_MMS_SAMPLE).get_table("dispatch_unit_scada")
+    table_columnar = parse_aemo_mms_csv(AEMO_MMS_SAMPLE, columnar=True).get_table("dispatch_unit_scada")
+
+    assert table and table_columnar, "Has tables"
+
+    records = generate_facility_scada(_get_table_records(table))
+    records_columnar = generate_facility_scada(_get_table_records(table_columnar))
+
+    assert len(records) == 2, "Has all scada records"
+
+    for record, record_columnar in zip(records, records_columnar, strict=True):
+        record.pop("created_at")
+        record_columnar.pop("created_at")
+
+        assert record == record_columnar, "Columnar records generate the same facility scada"
+
+
+def test_table_projection_covers_processors() -> None:
+    projection = get_table_projection()
+
+    assert set(projection.keys()) == set(TABLE_PROCESSOR_MAP.keys()), "Projection has every processed table"
+    assert all(projection.values()), "Every processed table has its columns"
+
+
+AEMO_MMS_BALANCING_SAMPLE = """C,NEMP.WORLD,DISPATCHIS,AEMO,PUBLIC,2021/09/02,12:50:10,0000000348376188,DISPATCHIS,0000000348376182
+I,DISPATCH,PRICE,5,SETTLEMENTDATE,RUNNO,REGIONID,DISPATCHINTERVAL,INTERVENTION,RRP
+D,DISPATCH,PRICE,5,"2021/09/02 12:55:00",1,NSW1,20210902151,0,45.5
+D,DISPATCH,PRICE,5,"2021/09/02 12:55:00",1,QLD1,20210902151,0,41.2
+I,DISPATCH,REGIONSUM,8,SETTLEMENTDATE,RUNNO,REGIONID,TOTALDEMAND,NETINTERCHANGE,DEMAND_AND_NONSCHEDGEN
+D,DISPATCH,REGIONSUM,8,"2021/09/02 12:55:00",1,NSW1,7000.5,-300.2,7100.1
+D,DISPATCH,REGIONSUM,8,"2021/09/02 12:55:00",1,SA1,1200.5,150.2,1300.1
+C,"END OF REPORT",8
+"""
+
+
+def test_generate_balancing_summary_records_merges_tables() -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_BALANCING_SAMPLE)
+
+    record_groups = generate_balancing_summary_records(table_set.tables)
+
+    assert list(record_groups.keys()) == [
+        ("price_dispatch", "net_interchange", "demand", "demand_total"),
+        ("price_dispatch",),
+        ("net_interchange", "demand", "demand_total"),
+    ], "Records are grouped by the columns their tables set"
+
+    records = [r for group in record_groups.values() for r in group]
+
+    assert [r["network_region"] for r in records] == ["NSW1", "QLD1", "SA1"], "One record per interval and region"
+    assert all(list(r.keys()) == BALANCING_SUMMARY_COLUMN_NAMES for r in records), "Records have every column"
+
+    nsw, qld, sa = records
+
+    assert (nsw["price_dispatch"], nsw["demand"], nsw["demand_total"]) == ("45.5", "7000.5", "7100.1")
+    assert qld["price_dispatch"] == "41.2" and qld["demand"] is None
+    assert sa["price_dispatch"] is None and sa["net_interchange"] == "150.2"
+
+
+def test_process_balancing_summary_counts_changed(monkeypatch: pytest.MonkeyPatch) -> None:
+    table_set = parse_aemo_mms_csv(AEMO_MMS_BALANCING_SAMPLE)
+    upsert = mock.MagicMock(side_effect=lambda table, records, *args, **kwargs: BulkInsertResult(records=len(records), changed=1))
+    monkeypatch.setattr(nem, "staged_upsert", upsert)
+
+    cr = nem.process_balancing_summary(table_set.tables)
+
+    assert (cr.processed_records, cr.inserted_records, cr.changed_records) == (3, 3, 3)
+    assert [c.args[2] for c in upsert.call_args_list] == [
+        ["price_dispatch", "net_interchange", "demand", "demand_total"],
+        ["price_dispatch"],
+        ["net_interchange", "demand", "demand_total"],
+    ], "Each key only updates the columns its tables set"
+
+    merged = ControllerReturn(changed_records=2)
+    nem.merge_controller_return(merged, cr)
+
+    assert merged.changed_records == 5
+
+
+AEMO_MMS_TRADING_REGIONSUM_SAMPLE = """C,NEMP.WORLD,TRADINGIS,AEMO,PUBLIC,2021/09/02,12:50:10,0000000348376188,TRADINGIS,0000000348376182
+I,TRADING,REGIONSUM,4,SETTLEMENTDATE,RUNNO,REGIONID,PERIODID,NETINTERCHANGE
+D,TRADING,REGIONSUM,4,"2021/09/02 13:00:00",1,NSW1,26,
+C,"END OF REPORT",3
+"""
+
+
+def test_process_balancing_summary_null_overwrites(monkeypatch: pytest.MonkeyPatch) -> None:
+    upsert = mock.MagicMock(return_value=BulkInsertResult(records=1))
+    monkeypatch.setattr(nem, "staged_upsert", upsert)
+
+    nem.process_balancing_summary(parse_aemo_mms_csv(AEMO_MMS_TRADING_REGIONSUM_SAMPLE).tables)
+
+    table, records, update_fields = upsert.call_args.args
+
+    assert records[0]["net_interchange_trading"] is None
+    assert update_fields == ["net_interchange_trading"]
+    assert not upsert.call_args.kwargs.get("update_coalesce"), "A null value overwrites the stored value"
+
+    query = build_insert_query(table, update_fields)
+
+    assert "net_interchange_trading = EXCLUDED.net_interchange_trading" in query
+
+
+AEMO_MMS_INTERCONNECTOR_SAMPLE = """C,NEMP.WORLD,DISPATCHIS,AEMO,PUBLIC,2021/09/02,12:50:10,0000000348376188,DISPATCHIS,0000000348376182
+I,DISPATCH,INTERCONNECTORRES,3,SETTLEMENTDATE,RUNNO,INTERCONNECTORID,DISPATCHINTERVAL,INTERVENTION,METEREDMWFLOW,MWFLOW
+D,DISPATCH,INTERCONNECTORRES,3,"2021/09/02 12:55:00",1,N-Q-MNSP1,20210902151,0,-35.2,-34.1
+D,DISPATCH,INTERCONNECTORRES,3,"2021/09/02 12:55:00",1,VIC1-NSW1,20210902151,0,412.5,410.0
+C,"END OF REPORT",4
+"""
+
+
+def test_process_dispatch_interconnectorres_counts_changed(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = mock.MagicMock()
+    conn.execute.return_value.rowcount = 1
+
+    @contextmanager
+    def _shared_connection():  # type: ignore
+        yield conn
+
+    monkeypatch.setattr(nem, "shared_connection", _shared_connection)
+
+    table = parse_aemo_mms_csv(AEMO_MMS_INTERCONNECTOR_SAMPLE).get_table("dispatch_interconnectorres")
+
+    assert table, "Has interconnector table"
+
+    cr = nem.process_dispatch_interconnectorres(table)
+
+    assert (cr.inserted_records, cr.changed_records) == (2, 1)
+
+    query = str(conn.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+
+    assert "WHERE facility_scada.generated IS DISTINCT FROM excluded.generated" in query, "Only changed flows are updated"
+
+
+def test_build_insert_query_update_coalesce() -> None:
+    query = build_insert_query(BalancingSummary, ["price", "demand"], update_coalesce=True)
+
+    assert "price = COALESCE(EXCLUDED.price, balancing_summary.price)" in query
+    assert "demand = COALESCE(EXCLUDED.demand, balancing_summary.demand)" in query
+
+
+def test_store_aemo_tableset_shares_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = mock.MagicMock()
+
+    @contextmanager
+    def _shared_connection():  # type: ignore
+        yield conn
+
+    def _process_ok(table):  # type: ignore
+        return ControllerReturn(processed_records=table.record_count, inserted_records=table.record_count)
+
+    def _process_fail(table):  # type: ignore
+        raise Exception("bad table")
+
+    monkeypatch.setattr(nem, "shared_connection", _shared_connection)
+    monkeypatch.setattr(nem, "process_balancing_summary", lambda tables: _process_ok(tables[0]))
+    monkeypatch.setattr(nem, "process_unit_scada_optimized", _process_fail)
+
+    cr = nem.store_aemo_tableset(parse_aemo_mms_csv(AEMO_MMS_SAMPLE))
+
+    assert cr.inserted_records == 3, "Balancing summary stored"
+    assert cr.errors == 2, "Failed table counted as errors"
+    assert list(cr.processor_timings.keys()) == ["process_balancing_summary"]
+    assert conn.begin_nested.call_count == 2, "Each processor runs in a savepoint"
+    assert conn.begin_nested.return_value.rollback.call_count == 1, "Failed processor is rolled back"
+
+    with pytest.raises(nem.ProcessorException, match="bad table"):
+        nem.store_aemo_tableset(parse_aemo_mms_csv(AEMO_MMS_SAMPLE), atomic=True)
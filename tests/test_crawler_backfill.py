@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from opennem.controllers import nem
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.crawlers import backfill
+from opennem.core.crawlers.backfill import BackfillProgress, get_throttle_delay, plan_backfill, run_backfill
+from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+from opennem.core.parsers.dirlisting import DirlistingEntry
+from opennem.crawlers.nemweb import AEMONemwebDispatchISArchive
+from opennem.db.bulk_insert_csv import BulkInsertChunkMetric, BulkInsertResult
+from opennem.db.models.opennem import FacilityScada
+from opennem.schema.date_range import CrawlDateRange
+
+from .parsers.test_aemo_mms import AEMO_MMS_SAMPLE
+
+DATE_RANGE = CrawlDateRange(start=datetime(2022, 6, 3), end=datetime(2022, 6, 7))
+
+
+def _archive_entries() -> list[DirlistingEntry]:
+    return [
+        DirlistingEntry(
+            filename=Path(f"PUBLIC_DISPATCHIS_202206{day:02d}.zip"),
+            link=f"http://nemweb.com.au/Reports/ARCHIVE/DispatchIS_Reports/PUBLIC_DISPATCHIS_202206{day:02d}.zip",
+            modified_date=datetime(2022, 7, 1),
+            file_size=1000,
+        )
+        for day in range(1, 11)
+    ]
+
+
+@pytest.fixture
+def archive_listing(monkeypatch: pytest.MonkeyPatch) -> list[datetime]:
+    """Archive of 10 days with the 4th already checkpointed. Returns the checkpointed intervals"""
+    checkpointed = [datetime(2022, 6, 4)]
+
+    dirlisting = mock.MagicMock()
+    dirlisting.get_files.return_value = _archive_entries()
+    monkeypatch.setattr(backfill, "get_dirlisting", lambda *args, **kwargs: dirlisting)
+    monkeypatch.setattr(
+        backfill,
+        "crawler_history_has_intervals",
+        lambda crawler_name, intervals, rebuild=False: [i in checkpointed for i in intervals],
+    )
+
+    return checkpointed
+
+
+def test_plan_backfill_skips_checkpointed_files(archive_listing: list[datetime]) -> None:
+    planned = plan_backfill(AEMONemwebDispatchISArchive, DATE_RANGE)
+
+    assert [e.aemo_interval_date for e in planned] == [datetime(2022, 6, day) for day in [3, 5, 6, 7]]
+
+
+def test_run_backfill_checkpoints_and_merges(monkeypatch: pytest.MonkeyPatch, archive_listing: list[datetime]) -> None:
+    def _store_aemo_entry(crawler: Any, entry: DirlistingEntry, **kwargs: Any) -> ControllerReturn:
+        if entry.aemo_interval_date == datetime(2022, 6, 6):
+            raise Exception("store failed")
+
+        return ControllerReturn(processed_records=10, inserted_records=10)
+
+    worker_inits: list[str] = []
+
+    monkeypatch.setattr(backfill, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(backfill, "_init_backfill_worker", lambda: worker_inits.append("init"))
+    monkeypatch.setattr(backfill, "get_table_projection", lambda: None)
+    monkeypatch.setattr(backfill, "store_aemo_entry", _store_aemo_entry)
+    monkeypatch.setattr(
+        backfill,
+        "set_crawler_history",
+        lambda crawler_name, histories: archive_listing.extend(h.interval for h in histories),
+    )
+
+    cr = run_backfill(AEMONemwebDispatchISArchive, DATE_RANGE, workers=2, target_write_rate=0)
+
+    assert (cr.crawls_run, cr.inserted_records, cr.errors) == (4, 30, 1)
+    assert worker_inits, "Workers drop the inherited connection pool"
+    assert sorted(archive_listing) == [datetime(2022, 6, day) for day in [3, 4, 5, 7]]
+
+    # a second run resumes with only the failed file
+    assert [e.aemo_interval_date for e in plan_backfill(AEMONemwebDispatchISArchive, DATE_RANGE)] == [
+        datetime(2022, 6, 6)
+    ]
+
+
+def test_run_backfill_entry_skips_checkpoint_on_failed_chunk(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A file that loses a chunk is not checkpointed so a resumed backfill retries it"""
+
+    @contextmanager
+    def _shared_connection():  # type: ignore
+        yield mock.MagicMock()
+
+    def _staged_upsert(table: Any, records: list[dict], *args: Any, **kwargs: Any) -> BulkInsertResult:
+        if table is not FacilityScada:
+            return BulkInsertResult(records=len(records))
+
+        return BulkInsertResult(
+            records=1,
+            chunks=[
+                BulkInsertChunkMetric(chunk=0, records=1, seconds=0.1),
+                BulkInsertChunkMetric(chunk=1, records=0, seconds=0.1, error="deadlock detected"),
+            ],
+        )
+
+    checkpointed: list[datetime] = []
+
+    monkeypatch.setattr(nem, "shared_connection", _shared_connection)
+    monkeypatch.setattr(nem, "staged_upsert", _staged_upsert)
+    monkeypatch.setattr(backfill, "get_table_projection", lambda: None)
+    monkeypatch.setattr(
+        backfill,
+        "store_aemo_entry",
+        lambda crawler, entry, **kwargs: nem.store_aemo_tableset(parse_aemo_mms_csv(AEMO_MMS_SAMPLE)),
+    )
+    monkeypatch.setattr(
+        backfill, "set_crawler_history", lambda crawler_name, histories: checkpointed.extend(h.interval for h in histories)
+    )
+
+    cr = backfill.run_backfill_entry(AEMONemwebDispatchISArchive, _archive_entries()[0])
+
+    assert cr.errors == 2, "Failed table counted as errors"
+    assert not checkpointed, "File is not checkpointed"
+
+    with pytest.raises(nem.ProcessorException, match="chunk 1: deadlock detected"):
+        nem.store_aemo_tableset(parse_aemo_mms_csv(AEMO_MMS_SAMPLE), atomic=True)
+
+
+def test_throttle_delay() -> None:
+    assert get_throttle_delay(1000, 1.0, 0) == 0.0
+    assert get_throttle_delay(1000, 1.0, 500) == 1.0
+    assert get_throttle_delay(1000, 3.0, 500) == 0.0
+
+
+def test_backfill_progress_eta() -> None:
+    progress = BackfillProgress(files_total=4, bytes_total=4000)
+    assert progress.eta is None
+
+    progress.started_at -= 10
+    progress.files_done, progress.bytes_done, progress.records = 1, 1000, 500
+
+    assert progress.eta is not None and timedelta(seconds=29) < progress.eta < timedelta(seconds=31)
+    assert "1/4 files" in str(progress)
@@ -0,0 +1,146 @@
+from datetime import UTC, datetime, timedelta
+from typing import Any
+from unittest import mock
+
+import pytest
+from datetime_truncate import truncate as date_trunc
+
+from opennem import settings
+from opennem.core.crawlers import history
+from opennem.core.crawlers.history import (
+    CrawlHistoryEntry,
+    clear_crawler_history_bitmaps,
+    get_crawler_missing_intervals,
+    get_crawler_missing_intervals_bitmap,
+    set_crawler_history,
+)
+from opennem.core.time import get_interval
+
+LATEST_INTERVAL = datetime(2023, 3, 1, 12, 30)
+
+
+def _stored_intervals() -> list[datetime]:
+    """Every 5 minutes for 3 days with gaps and an interval off the grid"""
+    intervals = [LATEST_INTERVAL - timedelta(minutes=5 * i) for i in range(3 * 288)]
+    intervals = [i for n, i in enumerate(intervals) if n % 7 and n not in range(100, 150)]
+
+    return intervals + [datetime(2023, 2, 28, 1, 2, 3)]
+
+
+def _missing_intervals_reference(stored: list[datetime], interval_size: str, days: int) -> list[datetime]:
+    """What the generate_series left join returns"""
+    interval = get_interval(interval_size)
+    step = timedelta(minutes=interval.interval)
+    series, current = [], LATEST_INTERVAL - timedelta(days=days)
+
+    while current <= LATEST_INTERVAL:
+        series.append(current)
+        current += step
+
+    missing = sorted(set(series) - set(stored), reverse=True)
+
+    if interval.interval >= 60:
+        missing = [date_trunc(i, interval.trunc) for i in missing]
+
+    return missing
+
+
+PROCESSED_TIME = datetime(2023, 3, 1, 12, 35, tzinfo=UTC)
+
+
+def _crawl_history_rows(rows: list[tuple[datetime, bool, datetime]], query: Any) -> list[tuple[datetime, bool, datetime]]:
+    """crawl_history rows for the bitmap query filtered on processed_time like the sql"""
+    processed_time = query.compile().params.get("processed_time")
+
+    return [i for i in rows if not processed_time or i[2] >= processed_time]
+
+
+@pytest.fixture
+def crawl_history_rows(monkeypatch: pytest.MonkeyPatch) -> list[tuple[datetime, bool, datetime]]:
+    rows = [(i, True, PROCESSED_TIME) for i in _stored_intervals()]
+
+    engine = mock.MagicMock()
+    engine.connect.return_value.__enter__.return_value.execute.side_effect = lambda query: _crawl_history_rows(rows, query)
+    monkeypatch.setattr(history, "get_database_engine", lambda: engine)
+
+    clear_crawler_history_bitmaps()
+    yield rows
+    clear_crawler_history_bitmaps()
+
+
+@pytest.fixture
+def stored_history(crawl_history_rows: list[tuple[datetime, bool, datetime]]) -> list[datetime]:
+    return [i[0] for i in crawl_history_rows]
+
+
+@pytest.mark.parametrize(["interval_size", "days"], [("5m", 2), ("5m", 5), ("30m", 3), ("1h", 1), ("1d", 4)])
+def test_bitmap_missing_intervals_match_sql(stored_history: list[datetime], interval_size: str, days: int) -> None:
+    missing = get_crawler_missing_intervals_bitmap(
+        "au.nemweb.test", interval=get_interval(interval_size), days=days, latest_interval=LATEST_INTERVAL
+    )
+
+    assert missing == _missing_intervals_reference(stored_history, interval_size, days)
+
+
+def test_set_crawler_history_updates_bitmap(
+    monkeypatch: pytest.MonkeyPatch, crawl_history_rows: list[tuple[datetime, bool, datetime]]
+) -> None:
+    monkeypatch.setattr(history, "get_scoped_session", mock.MagicMock())
+    interval = get_interval("5m")
+
+    def _missing() -> list[Any]:
+        return get_crawler_missing_intervals_bitmap(
+            "au.nemweb.test", interval=interval, days=1, latest_interval=LATEST_INTERVAL
+        )
+
+    def _set_crawler_history(histories: list[CrawlHistoryEntry]) -> None:
+        set_crawler_history("au.nemweb.test", histories)
+
+        # the stored rows as crawl_history returns them after the commit
+        crawl_history_rows.extend((i.interval, i.records is not None, PROCESSED_TIME) for i in histories)
+
+    missing = _missing()
+    assert LATEST_INTERVAL in missing
+
+    _set_crawler_history(
+        [CrawlHistoryEntry(interval=LATEST_INTERVAL, records=10), CrawlHistoryEntry(interval=missing[-1], records=None)],
+    )
+
+    assert _missing() == missing[1:]
+
+    # intervals with no records stay missing and stored intervals can be unset
+    _set_crawler_history([CrawlHistoryEntry(interval=LATEST_INTERVAL - timedelta(minutes=5))])
+
+    assert LATEST_INTERVAL - timedelta(minutes=5) in _missing()
+
+
+def test_bitmap_picks_up_history_from_other_processes(crawl_history_rows: list[tuple[datetime, bool, datetime]]) -> None:
+    interval = get_interval("5m")
+
+    def _missing() -> list[Any]:
+        return get_crawler_missing_intervals_bitmap(
+            "au.nemweb.test", interval=interval, days=1, latest_interval=LATEST_INTERVAL
+        )
+
+    missing = _missing()
+    assert LATEST_INTERVAL in missing
+
+    # another crawler process stores the latest interval and clears a stored one after the bitmap is built
+    crawl_history_rows.append((LATEST_INTERVAL, True, PROCESSED_TIME + timedelta(minutes=5)))
+    crawl_history_rows.append((LATEST_INTERVAL - timedelta(minutes=5), False, PROCESSED_TIME + timedelta(minutes=5)))
+
+    assert _missing() == [LATEST_INTERVAL - timedelta(minutes=5)] + missing[1:]
+
+
+def test_missing_intervals_uses_sql_for_calendar_intervals(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "crawl_history_bitmap", True)
+    sql_path = mock.MagicMock(return_value=[])
+    bitmap_path = mock.MagicMock(return_value=[])
+    monkeypatch.setattr(history, "get_crawler_missing_intervals_sql", sql_path)
+    monkeypatch.setattr(history, "get_crawler_missing_intervals_bitmap", bitmap_path)
+
+    get_crawler_missing_intervals("au.nemweb.test", interval=get_interval("1M"))
+    get_crawler_missing_intervals("au.nemweb.test", interval=get_interval("5m"))
+
+    assert sql_path.call_count == 1
+    assert bitmap_path.call_count == 1
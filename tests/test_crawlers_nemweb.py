@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.crawlers.schema import CrawlerDefinition, CrawlerPriority
+from opennem.core.parsers.dirlisting import DirectoryListing, DirlistingEntry
+from opennem.crawlers import nemweb
+from opennem.schema.network import NetworkNEM
+
+
+def _dirlisting_entries(count: int) -> list[DirlistingEntry]:
+    return [
+        DirlistingEntry(
+            filename=Path(f"PUBLIC_DISPATCHSCADA_2023030100{i:02d}_0000000380000000.zip"),
+            link=f"http://nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/{i}.zip",
+            modified_date=datetime(2023, 3, 1, 0, i),
+            aemo_interval_date=None,
+            file_size=1000,
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_run_nemweb_aemo_crawl_stores_in_order(monkeypatch: pytest.MonkeyPatch, concurrency: int) -> None:
+    entries = _dirlisting_entries(10)
+    fetch_threads: set[str] = set()
+    stored: list[str] = []
+    histories: list[Any] = []
+
+    def _parse_aemo_url(url: str, **kwargs: Any) -> str:
+        fetch_threads.add(threading.current_thread().name)
+        time.sleep(random.random() / 100)
+
+        if url.endswith("/3.zip"):
+            raise Exception("fetch failed")
+
+        return url
+
+    def _store_aemo_tableset(table_set: str) -> ControllerReturn:
+        stored.append(table_set)
+        return ControllerReturn(processed_records=2, inserted_records=2)
+
+    dirlisting = mock.MagicMock()
+    dirlisting.get_files.return_value = entries
+
+    monkeypatch.setattr(nemweb, "get_dirlisting", lambda *args, **kwargs: dirlisting)
+    monkeypatch.setattr(nemweb, "parse_aemo_url", _parse_aemo_url)
+    monkeypatch.setattr(nemweb, "store_aemo_tableset", _store_aemo_tableset)
+    monkeypatch.setattr(nemweb, "set_crawler_history", lambda **kwargs: histories.extend(kwargs["histories"]))
+
+    crawler = CrawlerDefinition(
+        priority=CrawlerPriority.high,
+        name="au.nemweb.test",
+        url="http://nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/",
+        network=NetworkNEM,
+        concurrency=concurrency,
+        processor=nemweb.run_nemweb_aemo_crawl,
+    )
+
+    cr = nemweb.run_nemweb_aemo_crawl(crawler, latest=False)
+
+    assert cr is not None
+    assert stored == [e.link for e in entries if not e.link.endswith("/3.zip")], "Stored in dirlisting order"
+    assert [h.interval for h in histories] == [e.aemo_interval_date for e in entries if not e.link.endswith("/3.zip")]
+    assert (cr.processed_records, cr.errors, cr.crawls_run) == (18, 1, 10)
+    assert cr.last_modified == datetime(2023, 3, 1, 0, 9)
+
+    if concurrency > 1:
+        assert all(t.startswith("nemweb_fetch") for t in fetch_threads), "Fetched in the pool"
+
+
+def test_run_nemweb_aemo_crawl_latest_retries_failed_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    entries = [
+        DirlistingEntry.construct(**e.dict(exclude={"aemo_interval_date"}), aemo_interval_date=datetime(2023, 3, 1, 0, 5 * i))
+        for i, e in enumerate(_dirlisting_entries(4))
+    ]
+
+    listings = [
+        DirectoryListing.construct(url="", entries=entries, new_entries=entries[2:], modified=True),
+        DirectoryListing.construct(url="", entries=entries, new_entries=[], modified=False),
+        DirectoryListing.construct(url="", entries=entries, new_entries=[], modified=False),
+    ]
+    # the first two files were already crawled
+    missing_intervals = [e.aemo_interval_date for e in entries[2:]]
+    stored: list[str] = []
+    failures = [entries[3].link]
+
+    def _store_aemo_entry(crawler: CrawlerDefinition, entry: DirlistingEntry, **kwargs: Any) -> ControllerReturn:
+        if entry.link in failures:
+            failures.remove(entry.link)
+            raise Exception("store failed")
+
+        stored.append(entry.link)
+        return ControllerReturn(processed_records=1, inserted_records=1)
+
+    def _set_crawler_history(crawler_name: str, histories: list[Any]) -> None:
+        for history in histories:
+            missing_intervals.remove(history.interval)
+
+    monkeypatch.setattr(nemweb, "get_dirlisting", lambda *args, **kwargs: listings.pop(0))
+    monkeypatch.setattr(nemweb, "store_aemo_entry", _store_aemo_entry)
+    monkeypatch.setattr(nemweb, "set_crawler_history", _set_crawler_history)
+    monkeypatch.setattr(nemweb, "get_crawler_missing_intervals", lambda **kwargs: list(missing_intervals))
+
+    crawler = CrawlerDefinition(
+        priority=CrawlerPriority.high,
+        name="au.nemweb.test",
+        url="http://nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/",
+        network=NetworkNEM,
+        processor=nemweb.run_nemweb_aemo_crawl,
+    )
+
+    cr = nemweb.run_nemweb_aemo_crawl(crawler, latest=True)
+
+    assert cr and (cr.crawls_run, cr.errors) == (2, 1)
+    assert stored == [entries[2].link], "Only files for missing intervals are fetched"
+
+    cr = nemweb.run_nemweb_aemo_crawl(crawler, latest=True)
+
+    assert cr and (cr.crawls_run, cr.errors) == (1, 0)
+    assert stored == [entries[2].link, entries[3].link], "Failed file is retried on an unchanged listing"
+
+    assert nemweb.run_nemweb_aemo_crawl(crawler, latest=True) is None, "Nothing to do without missing intervals"
+    assert stored == [entries[2].link, entries[3].link]
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from opennem.db import get_shared_connection, shared_connection
+
+
+@pytest.fixture
+def sqlite_engine():  # type: ignore
+    engine = create_engine("sqlite://")
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (v INTEGER)"))
+
+    return engine
+
+
+def test_shared_connection_nested_blocks_share_connection(sqlite_engine) -> None:  # type: ignore
+    assert get_shared_connection() is None
+
+    with shared_connection(sqlite_engine) as conn:
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+
+        with shared_connection(sqlite_engine) as inner_conn:
+            assert inner_conn is conn, "Nested blocks join the outer connection"
+            assert get_shared_connection() is conn
+
+    assert get_shared_connection() is None
+
+    with sqlite_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+
+
+def test_shared_connection_rolls_back_on_error(sqlite_engine) -> None:  # type: ignore
+    with pytest.raises(ValueError):
+        with shared_connection(sqlite_engine) as conn:
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+            raise ValueError("processor failed")
+
+    assert get_shared_connection() is None
+
+    with sqlite_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0
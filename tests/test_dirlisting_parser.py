@@ -1,9 +1,22 @@
+import html
 from datetime import datetime
 from pathlib import Path
+from typing import Any
+from unittest import mock
+from urllib.parse import urljoin
 
 import pytest
 
-from opennem.core.parsers.dirlisting import DirlistingEntry, parse_dirlisting_datetime, parse_dirlisting_line
+from opennem.core.parsers import dirlisting
+from opennem.core.parsers.dirlisting import (
+    DirlistingEntry,
+    DirlistingEntryType,
+    clear_dirlisting_cache,
+    get_dirlisting,
+    parse_dirlisting,
+    parse_dirlisting_datetime,
+    parse_dirlisting_line,
+)
 
 from .conftest import PATH_TESTS_FIXTURES
 
@@ -68,3 +81,102 @@ def test_dirlisting_line(line: str, result: dict[str, str | datetime | int]) ->
     dirlisting_line_result = parse_dirlisting_line(line)
 
     assert result_model == dirlisting_line_result, "Models match for dirlisting line"
+
+
+class _FakeResponse:
+    def __init__(self, status_code: int, content: str = "", headers: dict | None = None) -> None:
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content.encode("utf-8")
+        self.headers = headers or {}
+
+
+def test_get_dirlisting_incremental(monkeypatch: pytest.MonkeyPatch) -> None:
+    url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    content = load_fixture()
+    new_line = (
+        ' Wednesday, November 10, 2021  2:35 PM        18409 <A HREF="/Reports/Current/DispatchIS_Reports/'
+        'PUBLIC_DISPATCHIS_202111101440_0000000352367999.zip">PUBLIC_DISPATCHIS_202111101440_0000000352367999.zip</A><br>'
+    )
+    grown_content = content.replace("</pre>", f"{new_line}</pre>")
+
+    responses = [
+        _FakeResponse(200, content, {"ETag": '"v1"', "Last-Modified": "Wed, 10 Nov 2021 04:35:00 GMT"}),
+        _FakeResponse(304),
+        _FakeResponse(200, grown_content, {"ETag": '"v2"'}),
+    ]
+    requests: list[dict] = []
+
+    def _get(request_url: str, headers: dict, **kwargs: Any) -> _FakeResponse:
+        requests.append(headers)
+        return responses.pop(0)
+
+    clear_dirlisting_cache()
+    monkeypatch.setattr(dirlisting, "http", mock.MagicMock(get=_get))
+
+    full_listing = parse_dirlisting(content, url=url)
+
+    listing = get_dirlisting(url)
+
+    assert listing.count == full_listing.count == 578
+    assert [(e.link, e.modified_date, e.file_size, e.entry_type) for e in listing.entries] == [
+        (e.link, e.modified_date, e.file_size, e.entry_type) for e in full_listing.entries
+    ], "Raw line parse matches the full parse"
+    assert requests[0] == {}
+
+    not_modified = get_dirlisting(url)
+
+    assert requests[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 10 Nov 2021 04:35:00 GMT"}
+    assert not not_modified.modified and not not_modified.new_entries
+    assert not_modified.count == 578
+
+    grown = get_dirlisting(url)
+
+    assert grown.modified and grown.count == 579
+    assert [e.link for e in grown.get_new_files()] == [
+        "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/PUBLIC_DISPATCHIS_202111101440_0000000352367999.zip"
+    ]
+
+    clear_dirlisting_cache()
+
+
+def test_parse_dirlisting_matches_line_parser() -> None:
+    url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    content = load_fixture()
+    listing = parse_dirlisting(content, url=url)
+
+    expected = []
+
+    for line in content.split("<br>"):
+        model = parse_dirlisting_line(html.unescape(line.strip()))
+
+        if model:
+            model.link = urljoin(url, model.link)
+            expected.append(model)
+
+    assert len(listing.entries) == 578
+    assert [e.dict() for e in listing.entries] == [e.dict() for e in expected]
+
+
+def test_dirlisting_index_matches_filters() -> None:
+    listing = parse_dirlisting(load_fixture(), url="http://nemweb.com.au/Reports/Current/DispatchIS_Reports/")
+    files = [e for e in listing.entries if e.entry_type == DirlistingEntryType.file]
+
+    assert listing.get_files() == files
+    assert listing.file_count == len(files)
+
+    intervals = [files[0].aemo_interval_date, files[10].aemo_interval_date, datetime(2000, 1, 1)]
+    assert listing.get_files_aemo_intervals(intervals) == [f for f in files if f.aemo_interval_date in intervals]
+
+    modified_since = files[200].modified_date
+    assert sorted(listing.get_files_modified_since(modified_since), key=lambda f: f.link) == sorted(
+        [f for f in files if f.modified_date and f.modified_date > modified_since], key=lambda f: f.link
+    )
+
+    modified_in = [files[5].modified_date, files[300].modified_date]
+    assert listing.get_files_modified_in(modified_in) == [f for f in files if f.modified_date in modified_in]
+
+    for reverse in [True, False]:
+        assert listing.get_most_recent_files(reverse=reverse, limit=5) == sorted(
+            files, key=lambda f: f.modified_date, reverse=reverse  # type: ignore
+        )[:5]
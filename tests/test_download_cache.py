@@ -0,0 +1,136 @@
+import logging
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from opennem.core import downloader
+from opennem.utils import download_cache
+from opennem.utils.download_cache import DownloadCache, DownloadCacheException
+
+CURRENT_URL = "https://nemweb.com.au/Reports/Current/DispatchIS_Reports/PUBLIC_DISPATCHIS_202303010005.zip"
+ARCHIVE_URL = "https://nemweb.com.au/Reports/Archive/DispatchIS_Reports/PUBLIC_DISPATCHIS_20230301.zip"
+
+
+class _FakeHttp:
+    """Serves fixed content and answers conditional requests"""
+
+    def __init__(self, content: dict[str, bytes]) -> None:
+        self.content = content
+        self.requests: list[tuple[str, dict]] = []
+
+    def get(self, url: str, headers: dict | None = None, **kwargs: Any) -> Any:
+        headers = headers or {}
+        self.requests.append((url, headers))
+
+        response = mock.MagicMock()
+        response.headers = {"Last-Modified": "Wed, 01 Mar 2023 00:05:00 GMT", "ETag": f'"{len(self.content[url])}"'}
+
+        if headers.get("If-None-Match") == response.headers["ETag"]:
+            response.status_code, response.ok = 304, False
+            return response
+
+        response.status_code, response.ok, response.content = 200, True, self.content[url]
+
+        return response
+
+
+@pytest.fixture
+def fake_http(monkeypatch: pytest.MonkeyPatch) -> _FakeHttp:
+    fake_http = _FakeHttp({CURRENT_URL: b"current" * 10, ARCHIVE_URL: b"archive" * 10})
+    monkeypatch.setattr(download_cache, "http", fake_http)
+
+    return fake_http
+
+
+def test_download_cache_hits(tmp_path: Path, fake_http: _FakeHttp) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=1000, pin_archives=True)
+
+    assert cache.lookup(CURRENT_URL) is None
+
+    for _ in range(3):
+        assert cache.fetch(CURRENT_URL) == b"current" * 10
+        assert cache.fetch(ARCHIVE_URL) == b"archive" * 10
+
+    # current files are revalidated, archive files are served without a request
+    assert [url for url, _ in fake_http.requests] == [CURRENT_URL, ARCHIVE_URL, CURRENT_URL, CURRENT_URL]
+    assert fake_http.requests[-1][1] == {"If-None-Match": '"70"', "If-Modified-Since": "Wed, 01 Mar 2023 00:05:00 GMT"}
+
+    entry = cache.lookup(ARCHIVE_URL)
+    assert entry and entry.pinned and entry.size == 70
+    assert cache.object_path(entry.sha256).read_bytes() == b"archive" * 10
+
+
+def test_download_cache_dedupes_content(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=1000)
+
+    first = cache.put("https://a/1.zip", b"same")
+    second = cache.put("https://a/2.zip", b"same")
+
+    assert first.sha256 == second.sha256
+    assert cache.size() == 4
+
+    cache.remove("https://a/1.zip")
+    assert cache.object_path(first.sha256).is_file(), "Content is kept while referenced"
+
+    cache.remove("https://a/2.zip")
+    assert not cache.object_path(first.sha256).is_file()
+
+
+def test_download_cache_lru_eviction(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=30)
+
+    cache.put("https://a/1.zip", b"1" * 10)
+    cache.put("https://a/2.zip", b"2" * 10, pinned=True)
+    cache.put("https://a/3.zip", b"3" * 10)
+
+    # touch the oldest so the next put evicts 3 rather than 1
+    entry = cache.lookup("https://a/1.zip")
+    assert entry and cache.read(entry) == b"1" * 10
+
+    cache.put("https://a/4.zip", b"4" * 10)
+
+    assert cache.size() == 30
+    assert cache.lookup("https://a/3.zip") is None
+    assert all(cache.lookup(f"https://a/{i}.zip") for i in [1, 2, 4])
+
+    # pinned content survives eviction
+    with caplog.at_level(logging.WARNING, logger="opennem.utils.download_cache"):
+        assert cache.evict(max_bytes=0) == 2
+
+    assert cache.lookup("https://a/2.zip")
+    assert "over its 0 byte limit" in caplog.text, "Pinned files over the limit are logged"
+
+
+def test_download_cache_drops_damaged_content(tmp_path: Path, fake_http: _FakeHttp) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=1000)
+    cache.fetch(ARCHIVE_URL)
+
+    entry = cache.lookup(ARCHIVE_URL)
+    assert entry
+    cache.object_path(entry.sha256).write_bytes(b"truncated")
+
+    assert cache.fetch(ARCHIVE_URL) == b"archive" * 10
+    assert len(fake_http.requests) == 2
+
+
+def test_cached_download_disabled(monkeypatch: pytest.MonkeyPatch, fake_http: _FakeHttp) -> None:
+    monkeypatch.setattr(download_cache, "get_download_cache", lambda: None)
+
+    assert download_cache.cached_download(CURRENT_URL) == b"current" * 10
+
+    fake_http.get = mock.MagicMock(return_value=mock.MagicMock(ok=False, status_code=404))  # type: ignore
+
+    with pytest.raises(DownloadCacheException):
+        download_cache.cached_download(CURRENT_URL)
+
+
+def test_url_stream_downloader_uses_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, fake_http: _FakeHttp) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=1000, pin_archives=True)
+    monkeypatch.setattr(downloader, "get_download_cache", lambda: cache)
+
+    for _ in range(2):
+        assert b"".join(downloader.url_stream_downloader(ARCHIVE_URL, chunk_size=16)) == b"archive" * 10
+
+    assert [url for url, _ in fake_http.requests] == [ARCHIVE_URL], "Second stream is served from the cache"
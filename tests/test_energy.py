@@ -1,7 +1,12 @@
 import csv
+import json
+from datetime import datetime, timedelta
 from pathlib import Path
 
-from opennem.core.energy import energy_sum, shape_energy_dataframe
+import pandas as pd
+import pytest
+
+from opennem.core.energy import _energy_aggregate, energy_sum, shape_energy_dataframe
 from opennem.schema.network import NetworkNEM
 
 # from opennem.workers.emissions import load_factors
@@ -53,3 +58,105 @@ def _test_energy_sum_outputs() -> None:
     assert es.eoi_quantity.sum() > 1000, "Has energy value"
 
     return es
+
+
+def _energy_fixture_series(fixture_name: str, facility_code: str, fueltech_id: str, start: datetime, interval: int) -> list[dict]:
+    with (FIXTURE_PATH / f"{fixture_name}.json").open() as fh:
+        values = json.load(fh)
+
+    return [
+        {
+            "trading_interval": start + timedelta(minutes=interval * i),
+            "facility_code": facility_code,
+            "network_id": "NEM",
+            "fueltech_id": fueltech_id,
+            "generated": value,
+        }
+        for i, value in enumerate(values)
+    ]
+
+
+def _energy_fixture_frame() -> pd.DataFrame:
+    start = datetime(2021, 10, 23, 0, 5)
+
+    # gaps and an empty reading in the coal series go through the zero filled buckets
+    coal = _energy_fixture_series("coal_black_1_day", "BW01", "coal_black", start, 5)
+    coal = [r for i, r in enumerate(coal) if i not in [50, 51, 52, 53, 100]]
+    coal[150]["generated"] = None
+
+    records = (
+        coal
+        + _energy_fixture_series("battery_charging_1_day", "BATT1", "battery_charging", start, 5)
+        + _energy_fixture_series("23_oct_wem_gas", "GAS1", "gas_ccgt", datetime(2021, 10, 23, 0, 30), 30)
+    )
+    records.sort(key=lambda r: (r["trading_interval"], r["facility_code"]))
+
+    return shape_energy_dataframe(records)
+
+
+def test_energy_sum_hours_matches_expected() -> None:
+    """Output of the hourly energy engine against the output of the query per bucket version"""
+    with (FIXTURE_PATH / "energy_sum_hours_expected.json").open() as fh:
+        expected = json.load(fh)
+
+    es = energy_sum(_energy_fixture_frame(), NetworkNEM)
+
+    assert len(es) == len(expected)
+    assert [[r.trading_interval.isoformat(), r.facility_code] for r in es.itertuples()] == [e[:2] for e in expected]
+    assert es.eoi_quantity.tolist() == pytest.approx([e[2] for e in expected], abs=1e-5)
+
+
+def test_energy_sum_hours_rooftop() -> None:
+    with (FIXTURE_PATH / "23_oct_rooftop.json").open() as fh:
+        values = json.load(fh)
+
+    start = datetime(2021, 10, 23, 0, 30)
+    records = _energy_fixture_series("23_oct_rooftop", "ROOFTOP_NEM_QLD", "solar_rooftop", start, 30)
+
+    es = energy_sum(shape_energy_dataframe(records), NetworkNEM)
+
+    # half of each 30 minute reading at the reading interval
+    assert len(es) == 46
+    assert es.eoi_quantity.tolist() == pytest.approx([v / 2 for v in values[:46]])
+    assert es.trading_interval.iloc[0] == pd.Timestamp(start, tz=NetworkNEM.get_fixed_offset())
+
+
+def test_energy_aggregate_variable_buckets() -> None:
+    """Buckets close on the reading after each stop and each duid starts with a bucket of its first reading"""
+    start = datetime(2021, 10, 23, tzinfo=NetworkNEM.get_fixed_offset())
+    records = []
+
+    for i in range(14):
+        for facility_code, base in [("A", 10.0), ("B", 20.0)]:
+            # a gap in B and an empty reading in A
+            if facility_code == "B" and i in [3, 4]:
+                continue
+
+            generated = None if facility_code == "A" and i == 8 else base + i
+            records.append((start + timedelta(minutes=5 * i), "WEM", facility_code, generated))
+
+    df = pd.DataFrame(records, columns=["trading_interval", "network_id", "facility_code", "generated"])
+
+    es = _energy_aggregate(df.set_index(["trading_interval", "network_id", "facility_code"]))
+
+    assert es.trading_interval.tolist() == [start] * 3 + [start + timedelta(minutes=30)] * 2 + [start + timedelta(hours=1)] * 2
+    assert es.facility_code.tolist() == ["B", "A", "B", "A", "B", "A", "B"]
+    assert es.eoi_quantity.tolist() == pytest.approx([10.0, 5.25, 10.25, 7.0, 12.125, 10.2, 15.0])
+
+
+def test_energy_aggregate_empty_bucket_readings() -> None:
+    start = datetime(2021, 10, 23, tzinfo=NetworkNEM.get_fixed_offset())
+    records = [
+        (start, "WEM", "A", 10.0),
+        (start + timedelta(minutes=5), "WEM", "A", None),
+        (start + timedelta(minutes=30), "WEM", "A", None),
+        (start + timedelta(minutes=35), "WEM", "A", 12.0),
+        (start + timedelta(minutes=40), "WEM", "A", 14.0),
+    ]
+
+    df = pd.DataFrame(records, columns=["trading_interval", "network_id", "facility_code", "generated"])
+
+    es = _energy_aggregate(df.set_index(["trading_interval", "network_id", "facility_code"]))
+
+    # a bucket with a single reading that isn't its first is still half of it
+    assert es.eoi_quantity.tolist() == pytest.approx([5.0, 6.0])
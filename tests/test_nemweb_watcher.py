@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from huey.exceptions import RetryTask
+
+from opennem.core.parsers.dirlisting import DirectoryListing, DirlistingEntry
+from opennem.crawlers.nemweb import AEMONNemwebDispatchScada
+from opennem.schema.network import NetworkNEM
+from opennem.workers import nemweb_watcher
+from opennem.workers.nemweb_watcher import WatchedFeed, collect_latencies, get_poll_delay, poll_feed, run_watched_crawl
+
+NEM_TZ = NetworkNEM.get_fixed_offset()
+
+
+def _entry(minute: int) -> DirlistingEntry:
+    return DirlistingEntry(
+        filename=Path(f"PUBLIC_DISPATCHSCADA_2023030100{minute:02d}_0000000380000000.zip"),
+        link=f"http://nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/{minute}.zip",
+        modified_date=datetime(2023, 3, 1, 0, minute) + timedelta(seconds=30),
+        file_size=1000,
+    )
+
+
+@pytest.mark.parametrize(
+    ["now", "delay"],
+    [
+        (datetime(2023, 3, 1, 0, 5, 10), 2),
+        (datetime(2023, 3, 1, 0, 7, 59), 2),
+        (datetime(2023, 3, 1, 0, 8, 0), 30),
+        (datetime(2023, 3, 1, 0, 9, 50), 10),
+    ],
+)
+def test_poll_delay(now: datetime, delay: float) -> None:
+    assert get_poll_delay(now, interval_size=5, window=180, fast=2, slow=30) == delay
+
+
+def test_poll_feed_enqueues_new_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    listings = [
+        DirectoryListing.construct(url="", entries=[_entry(0)], new_entries=[_entry(0)], modified=True),
+        DirectoryListing.construct(url="", entries=[_entry(0)], new_entries=[], modified=False),
+        DirectoryListing.construct(url="", entries=[_entry(0), _entry(5)], new_entries=[_entry(5)], modified=True),
+    ]
+    monkeypatch.setattr(nemweb_watcher, "get_dirlisting", lambda *args, **kwargs: listings.pop(0))
+
+    feed = WatchedFeed(crawler=AEMONNemwebDispatchScada, task_name="watcher_run_nem_dispatch_scada_crawl")
+    enqueued: list[Any] = []
+
+    # the first poll primes the listing and the second is not modified
+    assert poll_feed(feed, enqueued.append) == []
+    assert poll_feed(feed, enqueued.append) == []
+    assert poll_feed(feed, enqueued.append) == [_entry(5)]
+
+    assert enqueued == [feed]
+    assert [f.interval for f in feed.pending] == [_entry(5).aemo_interval_date]
+
+    ingested_at = datetime(2023, 3, 1, 0, 6, 10, tzinfo=NEM_TZ)
+    completed = collect_latencies(feed, lambda crawler_name, intervals: {intervals[0]: ingested_at})
+
+    assert len(completed) == 1
+    assert completed[0].ingest_latency == timedelta(seconds=40)
+    assert feed.pending == []
+    assert list(feed.latencies) == completed
+
+
+def test_run_watched_crawl_nothing_new_is_not_retried() -> None:
+    def _crawl() -> None:
+        raise RetryTask("No new dispatch scada data")
+
+    def _crawl_error() -> None:
+        raise Exception("crawl failed")
+
+    run_watched_crawl(_crawl)
+
+    with pytest.raises(Exception, match="crawl failed"):
+        run_watched_crawl(_crawl_error)
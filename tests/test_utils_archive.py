@@ -0,0 +1,90 @@
+import io
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+
+from opennem.utils import archive
+from opennem.utils.archive import ZipStreamException, download_and_unzip, iter_prefetched, iter_unzipped_chunks
+
+
+class _UnseekableWriter(io.RawIOBase):
+    """Forces zipfile to write data descriptors as it would when streaming"""
+
+    def __init__(self) -> None:
+        self.buffer = io.BytesIO()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: bytes) -> int:  # type: ignore
+        return self.buffer.write(b)
+
+
+def _zip(members: dict[str, bytes], compression: int = ZIP_DEFLATED, seekable: bool = True) -> bytes:
+    fh: io.BytesIO | _UnseekableWriter = io.BytesIO() if seekable else _UnseekableWriter()
+
+    with ZipFile(fh, "w", compression=compression) as zf:  # type: ignore
+        for name, content in members.items():
+            zf.writestr(name, content)
+
+    return fh.getvalue() if isinstance(fh, io.BytesIO) else fh.buffer.getvalue()
+
+
+def _chunked(content: bytes, size: int = 7) -> list[bytes]:
+    return [content[i : i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize("compression", [ZIP_DEFLATED, ZIP_STORED])
+def test_iter_unzipped_chunks_nested(compression: int) -> None:
+    inner = _zip({"b.csv": b"b1\nb2\n", "c.csv": b"c1\nc2"}, compression=compression)
+    outer = _zip({"a.csv": b"a1\na2\n", "inner.zip": inner}, compression=compression)
+
+    assert b"".join(iter_unzipped_chunks(_chunked(outer))) == b"a1\na2\nb1\nb2\nc1\nc2\n"
+
+
+def test_iter_unzipped_chunks_data_descriptors() -> None:
+    content = _zip({"a.csv": b"a1\n" * 1000, "b.csv": b"b1\n"}, seekable=False)
+
+    assert b"".join(iter_unzipped_chunks(_chunked(content, 1024))) == b"a1\n" * 1000 + b"b1\n"
+
+
+def test_iter_unzipped_chunks_passes_through_plain_content() -> None:
+    assert b"".join(iter_unzipped_chunks([b"C,", b"END\n"])) == b"C,END\n"
+
+
+def test_iter_unzipped_chunks_truncated() -> None:
+    content = _zip({"a.csv": b"a1\n" * 1000})
+
+    with pytest.raises(ZipStreamException):
+        list(iter_unzipped_chunks(_chunked(content[:40], 8)))
+
+
+def test_iter_prefetched() -> None:
+    assert list(iter_prefetched(iter([b"a", b"b", b"c"]), depth=1)) == [b"a", b"b", b"c"]
+
+    def _failing():  # type: ignore
+        yield b"a"
+        raise ValueError("download failed")
+
+    with pytest.raises(ValueError):
+        list(iter_prefetched(_failing()))
+
+
+def test_download_and_unzip_streams_to_disk(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    inner = _zip({"b.csv": b"b1\nb2\n"})
+    outer = _zip({"a.csv": b"a1\na2\n", "inner.zip": inner})
+    downloads: list[str] = []
+
+    def _download_to_file(url: str, file_path: Path) -> int:
+        downloads.append(url)
+        return file_path.write_bytes(outer)
+
+    monkeypatch.setattr(archive, "get_download_cache", lambda: None)
+    monkeypatch.setattr(archive, "download_to_file", _download_to_file)
+    monkeypatch.setattr(archive, "mkdtemp", lambda prefix: str(tmp_path))
+
+    dest_dir = download_and_unzip("http://nemweb.com.au/Reports/Archive/DispatchIS_Reports/PUBLIC_DISPATCHIS_20230301.zip")
+
+    assert downloads, "Archive streamed with the async client"
+    assert sorted(p.name for p in Path(dest_dir).iterdir()) == ["a.csv", "b.csv"]
@@ -0,0 +1,136 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+
+from opennem.utils import http, http_async
+from opennem.utils.http_async import AsyncHTTPClient, AsyncHTTPException
+
+
+def _client(handler, **kwargs) -> AsyncHTTPClient:  # type: ignore
+    return AsyncHTTPClient(transport=httpx.MockTransport(handler), backoff=0, **kwargs)
+
+
+def test_fetch_retries_status_and_transport_errors() -> None:
+    attempts: list[str] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.path)
+
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+
+        if len(attempts) == 2:
+            return httpx.Response(503)
+
+        return httpx.Response(200, content=b"content")
+
+    async def _run() -> bytes:
+        async with _client(_handler, retries=3) as client:
+            return await client.fetch("http://nemweb.com.au/file.zip")
+
+    assert asyncio.run(_run()) == b"content"
+    assert len(attempts) == 3
+
+
+def test_fetch_raises_when_retries_run_out() -> None:
+    async def _run() -> bytes:
+        async with _client(lambda request: httpx.Response(500), retries=2) as client:
+            return await client.fetch("http://nemweb.com.au/file.zip")
+
+    with pytest.raises(AsyncHTTPException):
+        asyncio.run(_run())
+
+
+def test_concurrent_fetches_limit_connections_per_host() -> None:
+    in_flight: dict[str, int] = {}
+    max_in_flight: dict[str, int] = {}
+
+    async def _handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] = in_flight.get(host, 0) + 1
+        max_in_flight[host] = max(max_in_flight.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+
+        return httpx.Response(200, content=request.url.path.encode())
+
+    urls = [f"http://{host}/{i}" for host in ["a.com", "b.com"] for i in range(10)] + ["http://a.com/missing"]
+
+    async def _run() -> list:
+        async with _client(_handler, max_connections_per_host=3, retries=0) as client:
+            return await asyncio.gather(*[client.fetch(url) for url in urls], return_exceptions=True)
+
+    results = asyncio.run(_run())
+
+    assert results[:20] == [f"/{i}".encode() for _ in range(2) for i in range(10)]
+    assert isinstance(results[20], AsyncHTTPException)
+    assert max_in_flight == {"a.com": 3, "b.com": 3}
+
+
+def test_iter_bytes_streams() -> None:
+    async def _run() -> list[bytes]:
+        async with _client(lambda request: httpx.Response(200, content=b"x" * 10)) as client:
+            return [chunk async for chunk in client.iter_bytes("http://a.com/file", chunk_size=4)]
+
+    assert asyncio.run(_run()) == [b"xxxx", b"xxxx", b"xx"]
+
+
+class _FailingStream(httpx.AsyncByteStream):
+    async def __aiter__(self):  # type: ignore
+        yield b"partial"
+        raise httpx.ReadError("connection reset")
+
+
+def test_iter_bytes_raises_body_errors() -> None:
+    attempts: list[str] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.path)
+        return httpx.Response(200, stream=_FailingStream())
+
+    async def _run() -> list[bytes]:
+        async with _client(_handler, retries=3) as client:
+            return [chunk async for chunk in client.iter_bytes("http://a.com/file")]
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(_run())
+
+    assert len(attempts) == 1, "Errors reading the body are not retried"
+
+
+def test_download_to_file(tmp_path: Path) -> None:
+    file_path = tmp_path / "file.zip"
+
+    async def _run() -> int:
+        async with _client(lambda request: httpx.Response(200, content=b"x" * 10)) as client:
+            return await client.download_to_file("http://a.com/file.zip", file_path)
+
+    assert asyncio.run(_run()) == 10
+    assert file_path.read_bytes() == b"x" * 10
+
+
+def test_sync_wrapper_inside_running_loop(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    file_path = tmp_path / "file.zip"
+    monkeypatch.setattr(
+        http_async, "AsyncHTTPClient", lambda: _client(lambda request: httpx.Response(200, content=b"x" * 10))
+    )
+
+    async def _run() -> int:
+        return http_async.download_to_file("http://a.com/file.zip", file_path)
+
+    assert asyncio.run(_run()) == 10, "Runs on its own loop from inside a running loop"
+    assert http_async.download_to_file("http://a.com/file.zip", file_path) == 10
+    assert file_path.read_bytes() == b"x" * 10
+
+
+def test_sync_session_mounts_timeout_with_retries() -> None:
+    adapter = http.http.get_adapter("https://nemweb.com.au/")
+
+    assert isinstance(adapter, http.TimeoutHTTPAdapter)
+    assert adapter.max_retries is http.retry_strategy
+    assert adapter.timeout == http.DEFAULT_TIMEOUT